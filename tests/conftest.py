@@ -0,0 +1,37 @@
+# The gene regulation network of tsa/examples/gene_regulation_example.py,
+# shared by the tests.
+
+import numpy as np
+import pytest
+
+from tsa.models.gene_regulation import dX_gene_reg_fn, params_gene_reg
+
+
+s = [0.2, 0.2, 0.2, 0.2, 0.2]
+g = [0.9, 0.9, 0.7, 1.5, 1.5]
+b = [2, 2, 2, 2, 2, 2, 2]
+k = [1.5, 1.5, 1.5, 1.5, 1.5]
+m = [5, 5, 5, 5, 5]
+
+def accepted_model_fn(x, t):
+	dx = [0 for i in range(len(x))]
+	dx[0] = s[0] - g[0]*x[0] + b[0]*(x[4]**m[4])/(x[4]**m[4] + k[4]**m[4])
+	dx[1] = s[1] - g[1]*x[1] + b[1]*(x[0]**m[0])/(x[0]**m[0] + k[0]**m[0])
+	dx[2] = s[2] - g[2]*x[2] + b[2]*(x[0]**m[0])/(x[0]**m[0] + k[0]**m[0])
+	dx[3] = s[3] - g[3]*x[3] + b[3]*(x[0]**m[0])/(x[0]**m[0] + k[0]**m[0]) + b[5]/(1 + (x[2]/k[2])**m[2])
+	dx[4] = s[4] - g[4]*x[4] + b[4]*(x[3]**m[3])/(x[3]**m[3] + k[3]**m[3]) + b[6]/(1 + (x[1]/k[1])**m[1])
+	return dx
+
+@pytest.fixture
+def gene_reg():
+	""" The arguments of generate_models for the gene regulation example.
+	"""
+	return dict(topology_fn=dX_gene_reg_fn,
+				parameter_fn=params_gene_reg,
+				accepted_model_fn=accepted_model_fn,
+				nodes={0: 'Gene 0', 1: 'Gene 1', 2: 'Gene 2', 3: 'Gene 3', 4: 'Gene 4'},
+				max_parents=2,
+				time_scale=[0, 10, 31],
+				initial_vals=np.array([1, 0.5, 1, 1.5, 0.5]),
+				restarts=1,
+				seed=0)
@@ -0,0 +1,25 @@
+import tsa
+from tsa.core.cache import framework_name, open_fit_cache
+from tsa.models.gene_regulation import dX_gene_reg_fn
+from tsa.models.linear_model import dX_linear_fn
+
+
+def test_declarative_frameworks_are_named_by_spec():
+	linear = tsa.DeclarativeFramework(tsa.FrameworkSpec('n0 * X + EDGES', ['e0 * P'], 1, 1))
+	quadratic = tsa.DeclarativeFramework(tsa.FrameworkSpec('n0 * X + EDGES', ['e0 * P**2'], 1, 1))
+	same = tsa.DeclarativeFramework(tsa.FrameworkSpec('n0 * X + EDGES', ['e0 * P'], 1, 1))
+	assert framework_name(linear) != framework_name(quadratic)
+	assert framework_name(linear) == framework_name(same)
+
+def test_functions_are_named_by_code():
+	first = lambda x, t, top, params: params[0] * x[top.target]
+	second = lambda x, t, top, params: params[0] * x[top.target] ** 2
+	assert framework_name(first) != framework_name(second)
+	assert framework_name(dX_gene_reg_fn) != framework_name(dX_linear_fn)
+
+def test_unidentified_framework_is_not_cached(tmp_path):
+	class Framework(object):
+		def __call__(self, x, t, top, params):
+			return params[0]
+	assert open_fit_cache(str(tmp_path / 'fits.db'), Framework()) is None
+	assert open_fit_cache(str(tmp_path / 'fits.db'), dX_gene_reg_fn) is not None
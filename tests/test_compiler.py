@@ -0,0 +1,23 @@
+import numpy as np
+
+import tsa
+from tsa.core import compiler
+from tsa.models.gene_regulation import dX_gene_reg_fn
+
+
+def test_compiled_topologies_are_bounded(monkeypatch):
+	monkeypatch.setattr(compiler, 'COMPILED_CACHE_SIZE', 8)
+	compiler.clear_compiled_cache()
+	spec = dX_gene_reg_fn.spec
+	for p in range(20):
+		compiler.compile_topology(spec, tsa.Topology(0, [0], [p]))
+	assert len(compiler._compiled_topologies) == 8
+	compiler.clear_compiled_cache()
+
+def test_whole_model_matches_topologies():
+	spec = dX_gene_reg_fn.spec
+	tops = [tsa.Topology(0, [1], [1]), tsa.Topology(1, [0, 1], [0, 1])]
+	params = [[0.2, 0.9, 2, 1.5, 5], [0.2, 0.9, 2, 1.5, 5, 1, 1, 2]]
+	x = np.array([1.0, 0.5])
+	derivs = compiler.compile_whole_model(spec, tops)(x, 0, params)
+	assert np.allclose(derivs, [dX_gene_reg_fn(x, 0, tops[i], params[i]) for i in range(2)])
@@ -0,0 +1,69 @@
+import random
+
+import numpy as np
+import pytest
+
+import tsa
+from tsa.core.compiler import compile_topology
+from tsa.models.gene_regulation import dX_gene_reg_fn, params_gene_reg
+from tsa.models.linear_model import dX_linear_fn, params_linear
+from tsa.models.mass_action import dX_massact_fn, params_massact
+from tsa.models.population_dynamics import dX_pop_dynamics_fn, params_pop_dynamics
+
+
+# (framework, parameter function, number of interactions, whether it has complex parents)
+FRAMEWORKS = [(dX_gene_reg_fn, params_gene_reg, 2, False),
+			  (dX_linear_fn, params_linear, 1, False),
+			  (dX_massact_fn, params_massact, 1, True),
+			  (dX_pop_dynamics_fn, params_pop_dynamics, 1, False)]
+
+def random_cases(parameter_fn, num_interactions, complex_parents, num_cases=10, num_species=4):
+	""" Draws random topologies, parameters within bounds and positive species values.
+	"""
+	rng = random.Random(0)
+	all_params = parameter_fn()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	xs = np.random.RandomState(0).uniform(0.2, 2, size=(6, num_species))
+	ts = np.linspace(0, 1, 6)
+	for i in range(num_cases):
+		target = rng.randrange(num_species)
+		candidates = list(range(num_species))
+		if complex_parents:
+			candidates += [(0, 1), (1, 2, 3)]
+		parents = rng.sample(candidates, rng.randint(0, 3))
+		interactions = [rng.randrange(num_interactions) for p in parents]
+		top = tsa.Topology(target, interactions, parents)
+		ptypes = node_ptypes + edge_ptypes * len(parents)
+		params = [rng.uniform(max(pt.bounds[0], 0.1), min(pt.bounds[1], 3)) for pt in ptypes]
+		yield xs, ts, top, params
+
+@pytest.mark.parametrize('fn, parameter_fn, num_interactions, complex_parents', FRAMEWORKS)
+def test_compiled_spec_matches_vectorized(fn, parameter_fn, num_interactions, complex_parents):
+	for xs, ts, top, params in random_cases(parameter_fn, num_interactions, complex_parents):
+		compiled = compile_topology(fn.spec, top).vectorized(xs, ts, params)
+		assert np.allclose(compiled, fn.vectorized(xs, ts, top, params))
+
+def central_differences(f, x, h=1e-6):
+	""" Estimates the derivative of f with respect to each entry of x, stacking them in the last axis.
+	"""
+	x = np.asarray(x, dtype=float)
+	cols = []
+	for i in range(len(x)):
+		step = np.zeros(len(x))
+		step[i] = h
+		cols.append((np.asarray(f(x + step)) - np.asarray(f(x - step))) / (2 * h))
+	return np.stack(cols, axis=-1)
+
+@pytest.mark.parametrize('fn, parameter_fn, num_interactions, complex_parents', FRAMEWORKS)
+def test_param_grad_matches_finite_differences(fn, parameter_fn, num_interactions, complex_parents):
+	for xs, ts, top, params in random_cases(parameter_fn, num_interactions, complex_parents):
+		expected = central_differences(lambda p: fn.vectorized(xs, ts, top, p), params)
+		assert np.allclose(fn.param_grad(xs, ts, top, params), expected, rtol=1e-5, atol=1e-6)
+
+@pytest.mark.parametrize('fn, parameter_fn, num_interactions, complex_parents', FRAMEWORKS)
+def test_state_grad_matches_finite_differences(fn, parameter_fn, num_interactions, complex_parents):
+	for xs, ts, top, params in random_cases(parameter_fn, num_interactions, complex_parents):
+		for (x, t) in zip(xs, ts):
+			expected = central_differences(lambda y: fn.vectorized(y.reshape(1, -1), [t], top, params)[0], x)
+			assert np.allclose(fn.state_grad(x, t, top, params), expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,48 @@
+import tsa
+from tsa.models.linear_model import params_linear
+
+
+def make_bag():
+	node_ptypes = [p for p in params_linear() if not p.is_edge_param]
+	edge_ptypes = [p for p in params_linear() if p.is_edge_param]
+	first = [tsa.TargetModel(tsa.Topology(0, [], []), [0.5], 0.1, 0), tsa.TargetModel(tsa.Topology(0, [0], [1]), [0.5, 1], 0.2, 0)]
+	second = [tsa.TargetModel(tsa.Topology(1, [], []), [0.2], 0.1, 0)]
+	lst = [([a, b], a.dist + b.dist) for a in first for b in second]
+	return tsa.ModelBag(lst, node_ptypes, edge_ptypes, 1, 1, 1, [], [], {0: 'A', 1: 'B'})
+
+def test_views_share_target_models():
+	bag = make_bag()
+	assert len(bag) == 2
+	assert bag[0] is not bag[0]
+	assert bag[0].targets[1] is bag[1].targets[1]
+	assert [wm.dist for wm in bag.models] == sorted(wm.dist for wm in bag.models)
+
+def test_assign_models():
+	bag = make_bag()
+	wm = bag[1]
+	wm.dist = 0.0
+	assert bag[0].dist > 0
+	bag.models = [bag[0], wm]
+	assert bag[0].dist == 0.0
+	assert bag[0].targets[0].topology.parents == (1,)
+
+def test_from_wm_list_shares_table():
+	bag = make_bag()
+	sub = bag.from_wm_list([bag[1]])
+	assert len(sub) == 1
+	assert sub.table is bag.table
+
+def test_from_wm_list_keeps_changed_targets():
+	bag = make_bag()
+	wm = bag[0]
+	replaced = tsa.TargetModel(tsa.Topology(1, [0], [0]), [0.3, 2], 0.1, 0)
+	wm.targets = [wm.targets[0], replaced]
+	sub = bag.from_wm_list([wm, bag[1]])
+	assert sub.table is not bag.table
+	assert sub[0].targets[1] is replaced
+	assert sub[1].targets[1] is not replaced
+
+	# Replacing a single TargetModel in place is noticed too
+	wm = bag[1]
+	wm.targets[1] = replaced
+	assert bag.from_wm_list([wm])[0].targets[1] is replaced
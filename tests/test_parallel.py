@@ -0,0 +1,33 @@
+import platform
+
+import tsa
+from tsa.core.generate import ModelSpace, generate_target_topologies, gradient_match_par, gradient_match_topologies, sim_data
+
+
+def fitted(best):
+	return [(tm.topology, tm.params.tolist(), tm.dist) for tm in best]
+
+def test_gradient_match_par_matches_serial(gene_reg):
+	model_space = ModelSpace(max_parents=1, num_interactions=2, num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=gene_reg['topology_fn'])
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	all_params = gene_reg['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	targets = [0, 3]
+	args = dict(species_vals=species_vals, species_derivs=species_derivs, time_scale=gene_reg['time_scale'],
+				edge_ptypes=edge_ptypes, node_ptypes=node_ptypes, num_best_models=3, num_restarts=2, seed=0)
+
+	serial = [gradient_match_topologies(generate_target_topologies(model_space, t, [], []), t, **args) for t in targets]
+	# Small chunks, so that the topologies of each target are spread across the processes
+	parallel = gradient_match_par([(t, generate_target_topologies(model_space, t, [], [])) for t in targets], processes=2, chunksize=2, **args)
+	assert [fitted(best) for best in parallel] == [fitted(best) for best in serial]
+
+def test_generate_models_parallel_matches_serial(monkeypatch, gene_reg):
+	parallel = tsa.generate_models(retained_top=2, processes=2, **gene_reg)
+	# Fit in this process
+	monkeypatch.setattr(platform, 'system', lambda: 'Windows')
+	serial = tsa.generate_models(retained_top=2, **gene_reg)
+	assert len(parallel) == len(serial) > 0
+	for (p, s) in zip(parallel.models, serial.models):
+		assert [tm.topology for tm in p.targets] == [tm.topology for tm in s.targets]
+		assert p.dist == s.dist
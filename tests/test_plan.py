@@ -0,0 +1,15 @@
+import pytest
+
+from tsa.plan import main
+
+
+def test_counting_needs_interactions():
+	with pytest.raises(SystemExit) as exit:
+		main(['--nodes', '4', '--max-parents', '2'])
+	assert exit.value.code == 2
+
+def test_counting(capsys):
+	assert main(['--nodes', '4', '--max-parents', '2', '--num-interactions', '2', '--max-order', '1']) == 0
+	assert 'Target 0: 33 topologies' in capsys.readouterr().out
+	main(['--nodes', '4', '--max-parents', '2', '--framework', 'tsa.models.gene_regulation:dX_gene_reg_fn'])
+	assert 'Target 0: 33 topologies' in capsys.readouterr().out
@@ -0,0 +1,25 @@
+import pytest
+
+from tsa.core.generate import ModelSpace, candidate_interactomes, generate_target_topologies, sim_data
+from tsa.core.prescreen import PRESCREEN_METHODS, prescreen_parents
+
+
+@pytest.mark.parametrize('method', PRESCREEN_METHODS)
+def test_prescreen_keeps_target_and_enforced_edges(gene_reg, method):
+	model_space = ModelSpace(max_parents=2, num_interactions=2, num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=gene_reg['topology_fn'])
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	enf_edges = {3: [2]}
+	for target in range(5):
+		enf = enf_edges.get(target, [])
+		interactomes = candidate_interactomes(model_space, enf, [])
+		kept = prescreen_parents(species_vals, species_derivs[:, target], target, interactomes, 1, method=method)
+		assert target in kept
+		assert len(kept) <= 2
+
+		# Every topology left after pre-screening is one of the full enumeration, and has the enforced edges
+		full = [top for (dX, top) in generate_target_topologies(model_space, target, enf, [])]
+		enforced = set(min(full, key=lambda top: len(top.parents)).parents)
+		assert len(enforced) == len(enf)
+		screened = [top for (dX, top) in generate_target_topologies(model_space, target, enf, [], parents=kept)]
+		assert len(screened) > 0
+		assert all(top in full and enforced <= set(top.parents) for top in screened)
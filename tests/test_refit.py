@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import tsa
+from tsa.models.linear_model import dX_linear_fn, params_linear
+
+
+def accepted_model_fn(x, t):
+	return [0.5 - x[0] + 0.3 * x[1], 0.2 - 0.5 * x[1]]
+
+def whole_model(coeff):
+	node_ptypes = [p for p in params_linear() if not p.is_edge_param]
+	edge_ptypes = [p for p in params_linear() if p.is_edge_param]
+	targets = [tsa.TargetModel(tsa.Topology(0, [0, 0], [0, 1]), [0.5, -1, coeff], 0, 0),
+			   tsa.TargetModel(tsa.Topology(1, [0], [1]), [0.2, -0.5], 0, 0)]
+	return tsa.WholeModel(targets, 0, node_ptypes, edge_ptypes)
+
+def refit(model_lst, true_vals, checkpoint):
+	node_ptypes = [p for p in params_linear() if not p.is_edge_param]
+	edge_ptypes = [p for p in params_linear() if p.is_edge_param]
+	return tsa.fit_whole_model(model_lst, dX_linear_fn, [0, 0], true_vals, [0, 5, 11], node_ptypes, edge_ptypes,
+							   checkpoint=checkpoint, progress=None, method='lsq')
+
+def test_refit_checkpoint_resumes_same_inputs(tmp_path):
+	checkpoint = str(tmp_path / 'refit.ckpt')
+	true_vals, _ = tsa.sim_data(accepted_model_fn, [0, 5, 11], [0, 0])
+	model_lst = [whole_model(0.1), whole_model(0.5)]
+	first = refit(model_lst, true_vals, checkpoint)
+	resumed = refit(model_lst, true_vals, checkpoint)
+	assert [wm.dist for wm in resumed] == [wm.dist for wm in first]
+
+def test_refit_checkpoint_rejects_other_inputs(tmp_path):
+	checkpoint = str(tmp_path / 'refit.ckpt')
+	true_vals, _ = tsa.sim_data(accepted_model_fn, [0, 5, 11], [0, 0])
+	refit([whole_model(0.1)], true_vals, checkpoint)
+	with pytest.raises(ValueError):
+		refit([whole_model(0.1)], 2 * true_vals, checkpoint)
+	with pytest.raises(ValueError):
+		refit([whole_model(0.2)], true_vals, checkpoint)
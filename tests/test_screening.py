@@ -0,0 +1,54 @@
+import pytest
+
+import tsa
+from tsa.core import solvers
+from tsa.core.generate import ModelSpace, generate_target_topologies, gradient_match_topologies, sim_data
+
+
+def test_screen_stride_too_large(gene_reg):
+	# Every 4th of 31 time steps leaves 8, as many as the parameters of a topology with 2 parents
+	with pytest.raises(ValueError, match='screen_stride of at most 3'):
+		tsa.generate_models(screen_margin=2.0, processes=1, **gene_reg)
+
+def test_screening_on_example_time_scale(gene_reg):
+	screened = tsa.generate_models(screen_margin=2.0, screen_stride=3, retained_top=2, processes=2, **gene_reg)
+	assert len(screened) > 0
+	assert all(len(wm.targets) == 5 for wm in screened.models)
+
+def test_unscreenable_topologies_are_promoted(gene_reg):
+	model_space = ModelSpace(max_parents=2, num_interactions=2, num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=gene_reg['topology_fn'])
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	all_params = gene_reg['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	models = list(generate_target_topologies(model_space, 0, [], []))
+	num_two_parents = sum(1 for (dX, top) in models if len(top.parents) == 2)
+
+	stats = {}
+	best = gradient_match_topologies(models, 0, species_vals, species_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes,
+									 num_best_models=2, num_restarts=1, seed=0, stats=stats, screen_margin=0.0, screen_stride=4)
+	num_promoted, num_screened = stats['promoted'][0]
+	assert num_screened == len(models)
+	assert num_two_parents <= num_promoted < len(models)
+	assert len(best) == 2
+
+def test_screening_uses_loose_tolerance(monkeypatch, gene_reg):
+	tols = []
+	minimize = solvers.minimize
+	def recorded(*args, **kwargs):
+		tols.append(kwargs['tol'])
+		return minimize(*args, **kwargs)
+	monkeypatch.setattr(solvers, 'minimize', recorded)
+
+	model_space = ModelSpace(max_parents=1, num_interactions=2, num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=gene_reg['topology_fn'])
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	all_params = gene_reg['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	models = list(generate_target_topologies(model_space, 0, [], []))
+	stats = {}
+	gradient_match_topologies(models, 0, species_vals, species_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes,
+							  num_best_models=2, num_restarts=1, seed=0, stats=stats, screen_margin=1.0, screen_stride=2)
+	num_promoted, num_screened = stats['promoted'][0]
+	assert tols.count(1e-3) == num_screened
+	assert tols.count(1e-6) == num_promoted
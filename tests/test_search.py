@@ -0,0 +1,29 @@
+import platform
+
+import tsa
+from tsa.core import solvers
+
+
+def count_fits(monkeypatch, gene_reg, **kwargs):
+	fits = []
+	fit = solvers.SLSQPSolver.fit
+	def counted(self, *args, **kw):
+		fits.append(1)
+		return fit(self, *args, **kw)
+	monkeypatch.setattr(solvers.SLSQPSolver, 'fit', counted)
+	# Fit in this process, so that the fits can be counted
+	monkeypatch.setattr(platform, 'system', lambda: 'Windows')
+	models = tsa.generate_models(retained_top=2, search='stepwise', **dict(gene_reg, **kwargs))
+	return len(fits), models
+
+def test_stepwise_warm_start_reuses_fits_across_rounds(monkeypatch, gene_reg):
+	num_cold, cold = count_fits(monkeypatch, gene_reg)
+	num_warm, warm = count_fits(monkeypatch, gene_reg, warm_start=True)
+	assert num_warm <= num_cold
+	assert len(warm) == len(cold)
+
+def test_stepwise_parallel_matches_serial(monkeypatch, gene_reg):
+	num_serial, serial = count_fits(monkeypatch, gene_reg, warm_start=True)
+	monkeypatch.undo()
+	parallel = tsa.generate_models(retained_top=2, search='stepwise', processes=2, warm_start=True, **gene_reg)
+	assert [wm.dist for wm in parallel.models] == [wm.dist for wm in serial.models]
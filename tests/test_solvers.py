@@ -0,0 +1,97 @@
+import random
+
+import numpy as np
+import pytest
+
+from tsa import Topology
+from tsa.core.generate import ModelSpace, generate_target_topologies, sim_data, sub_topologies, topology_key, warm_starts
+from tsa.core.solvers import LeastSquaresSolver, SLSQPSolver, objective_fn, restart_points
+from tsa.models.linear_model import dX_linear_fn, params_linear
+from tsa.models.mass_action import dX_massact_fn, params_massact
+
+
+def gene_reg_data(gene_reg, target):
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	return species_vals, species_derivs[:, target]
+
+def in_bounds(params, bounds_list):
+	return len(params) == len(bounds_list) and all(lb <= v <= ub for (v, (lb, ub)) in zip(params, bounds_list))
+
+@pytest.mark.parametrize('fn, parameter_fn, max_order', [(dX_linear_fn, params_linear, 1), (dX_massact_fn, params_massact, 2)])
+def test_lstsq_matches_slsqp(gene_reg, fn, parameter_fn, max_order):
+	target = 3
+	species_vals, target_derivs = gene_reg_data(gene_reg, target)
+	all_params = parameter_fn()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	model_space = ModelSpace(max_parents=2, num_interactions=1, num_nodes=5, node_names=gene_reg['nodes'], max_order=max_order, topology_fn=fn)
+	lstsq = LeastSquaresSolver(species_vals, target_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes)
+	slsqp = SLSQPSolver(species_vals, target_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes, num_restarts=3)
+
+	topologies = [top for (dX, top) in generate_target_topologies(model_space, target, [], [])]
+	assert any(type(p) is tuple for top in topologies for p in top.parents) == (max_order > 1)
+	for top in topologies:
+		params, dist = lstsq.fit(fn, top)
+		slsqp_params, slsqp_dist = slsqp.fit(fn, top, rng=random.Random(0))
+		# The least-squares fit is exact, so SLSQP can at best reach it
+		assert dist <= slsqp_dist * (1 + 1e-6) + 1e-9
+		assert np.isclose(dist, slsqp_dist, rtol=1e-3, atol=1e-6)
+
+@pytest.mark.parametrize('framework', ['gene_reg', 'linear'])
+def test_warm_starts_are_in_bounds(gene_reg, framework):
+	fn, parameter_fn = (gene_reg['topology_fn'], gene_reg['parameter_fn']) if framework == 'gene_reg' else (dX_linear_fn, params_linear)
+	target = 3
+	species_vals, target_derivs = gene_reg_data(gene_reg, target)
+	all_params = parameter_fn()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	model_space = ModelSpace(max_parents=2, num_interactions=len(fn.spec.edge_exprs), num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=fn)
+	solver = SLSQPSolver(species_vals, target_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes, num_restarts=1)
+
+	optima = {}
+	for (dX, top) in generate_target_topologies(model_space, target, [], []):
+		starts = warm_starts(dX, top, solver, 0, optima)
+		if len(top.parents) < 2:
+			assert starts == []
+			continue
+		assert len(starts) == 1
+		assert in_bounds(starts[0], solver.bounds.get(top)[0])
+		# A new linear edge starts out without effect, so the start is exactly as good as the best nested fit
+		if framework == 'linear':
+			nested = min(optima[topology_key(sub)][1] for (i, sub) in sub_topologies(top))
+			obj = objective_fn(dX, species_vals, target_derivs, top, gene_reg['time_scale'])
+			assert np.isclose(obj(np.array(starts[0])), nested)
+
+@pytest.mark.parametrize('design', ['random', 'sobol', 'lhs'])
+def test_restart_points_are_in_bounds(design):
+	bounds_list = [(0, 1), (-2, 3), (0.5, 0.5), (1e-3, 1e3)]
+	for num_points in [0, 1, 5, 16]:
+		points = restart_points(design, bounds_list, num_points, rng=random.Random(0))
+		assert len(points) == num_points
+		assert all(in_bounds(p, bounds_list) for p in points)
+		assert points == restart_points(design, bounds_list, num_points, rng=random.Random(0))
+	assert restart_points(design, [], 3, rng=random.Random(0)) == [[], [], []]
+
+def test_lhs_points_cover_every_stratum():
+	num_points = 8
+	points = np.array(restart_points('lhs', [(0, 1), (-4, 4)], num_points, rng=random.Random(0)))
+	for (d, (lb, ub)) in enumerate([(0, 1), (-4, 4)]):
+		strata = np.floor((points[:, d] - lb) / (ub - lb) * num_points)
+		assert sorted(strata.tolist()) == list(range(num_points))
+
+@pytest.mark.parametrize('design', ['sobol', 'lhs'])
+def test_converged_restarts_stop_early(gene_reg, design):
+	target = 3
+	species_vals, target_derivs = gene_reg_data(gene_reg, target)
+	all_params = gene_reg['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	top = Topology(target, [0], [0])
+	full = SLSQPSolver(species_vals, target_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes, num_restarts=8, design=design)
+	early = SLSQPSolver(species_vals, target_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes, num_restarts=8, design=design, converged=2)
+	params, dist = full.fit(gene_reg['topology_fn'], top, rng=random.Random(0))
+	early_params, early_dist = early.fit(gene_reg['topology_fn'], top, rng=random.Random(0))
+	assert full.last_restarts == 8
+	assert early.last_restarts < 8
+	assert in_bounds(early_params, early.bounds.get(top)[0])
+	assert np.isclose(early_dist, dist, rtol=1e-2, atol=1e-6)
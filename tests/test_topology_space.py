@@ -0,0 +1,36 @@
+import itertools
+
+import pytest
+
+from tsa.core.generate import ModelSpace, TopologySpace, candidate_interactomes, generate_target_topologies, rank_combination, unrank_combination
+from tsa.models.gene_regulation import dX_gene_reg_fn
+from tsa.models.mass_action import dX_massact_fn
+
+
+def test_combination_ranks_follow_itertools():
+	for n, k in [(5, 0), (5, 2), (6, 3), (4, 4)]:
+		for rank, comb in enumerate(itertools.combinations(range(n), k)):
+			assert rank_combination(n, comb) == rank
+			assert unrank_combination(n, k, rank) == comb
+
+@pytest.mark.parametrize('num_interactions, max_order, topology_fn, enf_gaps, prescreened', [
+	(2, 1, dX_gene_reg_fn, [], False),
+	(2, 1, dX_gene_reg_fn, [1, 3], False),
+	(2, 1, dX_gene_reg_fn, [], True),
+	(1, 2, dX_massact_fn, [], False),
+])
+def test_topology_space_matches_enumeration(num_interactions, max_order, topology_fn, enf_gaps, prescreened):
+	model_space = ModelSpace(max_parents=2, num_interactions=num_interactions, num_nodes=5, node_names=list(range(5)), max_order=max_order, topology_fn=topology_fn)
+	for target in range(5):
+		parents = candidate_interactomes(model_space, [], enf_gaps)[::2] if prescreened else None
+		enumerated = [top for (dX, top) in generate_target_topologies(model_space, target, [], enf_gaps, parents=parents)]
+		space = TopologySpace(model_space, target, [], enf_gaps, parents=parents)
+		assert len(space) == len(enumerated)
+		assert [top for (dX, top) in space.topologies(0, len(space))] == enumerated
+		for i in range(len(enumerated)):
+			assert space.topology(i) == enumerated[i]
+			assert space.index(enumerated[i]) == i
+
+		# Any range of the space is generated directly
+		a, b = len(space) // 3, 2 * len(space) // 3
+		assert [top for (dX, top) in space.topologies(a, b)] == enumerated[a:b]
@@ -0,0 +1,106 @@
+import itertools
+import random
+import time
+
+import numpy as np
+import pytest
+
+import tsa
+from tsa.core.generate import ModelSpace, SimulationAborted, SimulationWatchdog, best_first_whole_models, generate_target_topologies, gradient_match_topologies, sim_data, whole_model_check
+
+
+def random_target_models(num_species=4, max_models=4, seed=0):
+	""" Draws lists of TargetModels with integer scores, so that scores tie and sum exactly.
+	"""
+	rng = random.Random(seed)
+	return [[tsa.TargetModel(tsa.Topology(s, [], []), [0.5], rng.randint(0, 5), rng.randint(0, 5)) for k in range(rng.randint(1, max_models))] for s in range(num_species)]
+
+def test_best_first_matches_sorted_product():
+	for seed in range(20):
+		best_models = random_target_models(seed=seed)
+		for key in ('AIC', 'dist'):
+			opts = [sorted(b, key=lambda m: getattr(m, key)) for b in best_models]
+			expected = sorted(itertools.product(*opts), key=lambda wm: sum(getattr(m, key) for m in wm))
+			lazy = list(best_first_whole_models(best_models, key=key))
+			# Ties come out in the order of the product of the sorted lists, as from a stable sort
+			assert lazy == expected
+
+@pytest.fixture
+def candidates(gene_reg):
+	""" The whole models made of the two best topologies of each target of the gene regulation example, and the values to check them against.
+	"""
+	model_space = ModelSpace(max_parents=gene_reg['max_parents'], num_interactions=2, num_nodes=5, node_names=gene_reg['nodes'], max_order=1, topology_fn=gene_reg['topology_fn'])
+	species_vals, species_derivs = sim_data(gene_reg['accepted_model_fn'], gene_reg['time_scale'], gene_reg['initial_vals'])
+	all_params = gene_reg['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	best = [gradient_match_topologies(generate_target_topologies(model_space, t, [], []), t, species_vals, species_derivs, gene_reg['time_scale'], edge_ptypes, node_ptypes,
+									  num_best_models=2, num_restarts=1, seed=0) for t in range(5)]
+	return list(best_first_whole_models(best)), species_vals
+
+def check(gene_reg, models, species_vals, **kwargs):
+	return whole_model_check(models, gene_reg['topology_fn'], gene_reg['initial_vals'], species_vals, gene_reg['time_scale'], **kwargs)
+
+def test_pruning_keeps_top(gene_reg, candidates):
+	models, species_vals = candidates
+	top = 3
+	full = check(gene_reg, models, species_vals)
+	stats = {}
+	pruned = check(gene_reg, models, species_vals, prune_top=top, stats=stats)
+	assert stats['pruned'] > 0
+	assert [m for (m, dist) in pruned[:top]] == [m for (m, dist) in full[:top]]
+	# Pruned models are integrated in segments, which changes their distances within the integration error
+	assert np.allclose([dist for (m, dist) in pruned[:top]], [dist for (m, dist) in full[:top]], atol=1e-6)
+	assert sum(1 for (m, dist) in pruned if dist == float('inf')) == stats['pruned']
+
+def aborted_reason(watchdog, ode, initial_values, ts):
+	with pytest.raises(SimulationAborted) as info:
+		watchdog.simulate(ode, initial_values, ts)
+	return info.value.reason
+
+def test_watchdog_aborts():
+	ts = np.linspace(0, 2, 21)
+	def decay(x, t):
+		return -x
+	def slow(x, t):
+		time.sleep(0.01)
+		return -x
+	def blow_up(x, t):
+		# x = 1 / (1 - t), which diverges at t = 1
+		return x ** 2
+
+	assert aborted_reason(SimulationWatchdog(max_seconds=0.05), slow, [1.0], ts) == 'timeout'
+	assert aborted_reason(SimulationWatchdog(max_evals=5), decay, [1.0], ts) == 'max_evals'
+	assert aborted_reason(SimulationWatchdog(max_state=1e3), blow_up, [1.0], ts) == 'diverged'
+	assert np.allclose(SimulationWatchdog(max_evals=1000).simulate(decay, [1.0], ts)[:, 0], np.exp(-ts), atol=1e-6)
+
+def test_aborted_models_get_infinite_distance(gene_reg, candidates):
+	models, species_vals = candidates
+	stats = {}
+	res = check(gene_reg, models, species_vals, watchdog=SimulationWatchdog(max_evals=5), stats=stats)
+	assert all(dist == float('inf') for (m, dist) in res)
+	assert stats['aborted'] == {'max_evals': len(models)}
+
+@pytest.mark.parametrize('batch_size', [4, 7])
+def test_batches_match_single_checks(gene_reg, candidates, batch_size):
+	models, species_vals = candidates
+	single = dict((tuple(id(tm) for tm in m), dist) for (m, dist) in check(gene_reg, models, species_vals))
+	batched = check(gene_reg, models, species_vals, batch_size=batch_size)
+	assert len(batched) == len(models)
+	# The stacked system is integrated to the same tolerances per model, not to the same steps
+	for (m, dist) in batched:
+		assert np.isclose(dist, single[tuple(id(tm) for tm in m)], rtol=1e-3, atol=1e-6)
+
+def test_check_checkpoint_rejects_other_inputs(gene_reg, candidates, tmp_path):
+	models, species_vals = candidates
+	checkpoint = str(tmp_path / 'check.ckpt')
+	first = check(gene_reg, models[:4], species_vals, checkpoint=checkpoint)
+	resumed = check(gene_reg, models[:4], species_vals, checkpoint=checkpoint)
+	assert [dist for (m, dist) in resumed] == [dist for (m, dist) in first]
+	# Other models at the same indices, as when the best lists of a run directory are regenerated
+	with pytest.raises(ValueError):
+		check(gene_reg, models[4:8], species_vals, checkpoint=checkpoint)
+	with pytest.raises(ValueError):
+		check(gene_reg, models[:4], 2 * species_vals, checkpoint=checkpoint)
+	with pytest.raises(ValueError):
+		check(gene_reg, models[:4], species_vals, checkpoint=checkpoint, prune_top=2)
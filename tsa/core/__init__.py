@@ -1,3 +1,10 @@
+from .compiler import *
+from .solvers import *
+from .jit import *
+from .cache import *
+from .prescreen import *
 from .generate import *
+from .shard import *
+from .plan import *
 from .model import *
 from .visualize import *
\ No newline at end of file
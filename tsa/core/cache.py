@@ -0,0 +1,201 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+import weakref
+import numpy as np
+
+
+def framework_name(topology_fn):
+	""" A name identifying a model framework, used to tell the runs and fits of different frameworks apart. The name of the function is followed by a digest of its FrameworkSpec, or of its code if it has no spec (see framework_digest), so that eg. two DeclarativeFrameworks or two lambdas are only named alike if they calculate the same derivatives. A JitFramework is named after the framework it wraps.
+	"""
+	wrapped = getattr(topology_fn, 'topology_fn', None)
+	if wrapped is not None:
+		return framework_name(wrapped) + '[jit]'
+	name = '{}.{}'.format(topology_fn.__module__, getattr(topology_fn, '__name__', type(topology_fn).__name__))
+	fn_digest = framework_digest(topology_fn)
+	if fn_digest is not None:
+		name += '#' + fn_digest[:16]
+	return name
+
+def framework_digest(topology_fn):
+	""" Hashes what determines the derivatives of a model framework: its FrameworkSpec if it has one, and otherwise the bytecode, constants and global names used by its python function.
+
+		Returns:
+		The digest as a hex string, or None if the framework has neither a spec nor python code, in which case its fits cannot be told apart from those of other frameworks.
+	"""
+	wrapped = getattr(topology_fn, 'topology_fn', None)
+	if wrapped is not None:
+		return framework_digest(wrapped)
+	spec = getattr(topology_fn, 'spec', None)
+	if spec is not None:
+		return digest('spec', *spec.fingerprint())
+	code = getattr(topology_fn, '__code__', None)
+	if code is not None:
+		return digest('code', code_fingerprint(code))
+	return None
+
+def code_fingerprint(code):
+	""" The parts of a code object that determine what it computes. Nested code objects (eg. of lambdas) are replaced by their own fingerprints, since their repr holds their address.
+	"""
+	consts = tuple(code_fingerprint(c) if hasattr(c, 'co_code') else c for c in code.co_consts)
+	return (code.co_code, consts, code.co_names)
+
+def digest(*parts):
+	""" Hashes python values and numpy arrays into a hex string. Arrays are hashed by their dtype, shape and contents.
+	"""
+	h = hashlib.sha256()
+	for part in parts:
+		if isinstance(part, np.ndarray):
+			arr = np.ascontiguousarray(part)
+			h.update(repr((arr.dtype.str, arr.shape)).encode())
+			h.update(arr.tobytes())
+		else:
+			h.update(repr(part).encode())
+		h.update(b'|')
+	return h.hexdigest()
+
+
+class FitCache(object):
+	""" A persistent cache of gradient-matching fits, stored in an SQLite database so that it can be shared between runs and between the processes of a run.
+
+		A fit is identified by a hash of everything that determines it: the framework (see framework_name), the topology, the data it is fit to, the parameter bounds, the solver and its settings (see the fingerprint method of the solvers) and the seed. Since such a fit is deterministic, a cached fit can be used in place of fitting the topology again.
+
+		The cache holds at most max_entries fits. When it grows beyond that, the least recently used fits are evicted.
+
+		Args:
+		path - The file name of the database. It is created if it does not exist.
+
+		max_entries - The maximum number of fits to keep
+
+		Attributes:
+		stats - A dictionary counting the 'hits', 'misses' and 'evicted' fits of this process
+	"""
+	# How many fits a process stores between checks of the size of the cache
+	evict_every = 1000
+
+	def __init__(self, path, max_entries=1000000):
+		self.path = path
+		self.max_entries = max_entries
+		self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+		self.conn = None
+		self.pid = None
+		self.num_stored = 0
+		self.solver_digests = weakref.WeakKeyDictionary()
+
+	def connect(self):
+		""" Returns the connection to the database of this process, opening it on first use (connections cannot be shared with forked processes).
+		"""
+		if self.conn is None or self.pid != os.getpid():
+			self.conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+			self.conn.execute('PRAGMA journal_mode=WAL')
+			self.conn.execute('CREATE TABLE IF NOT EXISTS fits (key TEXT PRIMARY KEY, value BLOB, used REAL)')
+			self.conn.execute('CREATE INDEX IF NOT EXISTS fits_used ON fits (used)')
+			self.pid = os.getpid()
+		return self.conn
+
+	def key(self, dX, top, solver, seed, warm_start=False):
+		""" Calculates the key of the fit of a topology.
+
+			Args:
+			dX - The topology function of the model framework
+
+			top - A Topology object describing the model to fit
+
+			solver - The solver object fitting the topology. It must have a fingerprint method.
+
+			seed - The seed of the run (see topology_rng)
+
+			warm_start - Whether the fit is warm-started from nested topologies (see warm_starts)
+
+			Returns:
+			The key as a hex string.
+		"""
+		solver_digest = self.solver_digests.get(solver)
+		if solver_digest is None:
+			solver_digest = digest(*solver.fingerprint())
+			self.solver_digests[solver] = solver_digest
+		return digest(framework_name(dX), top.target, tuple(top.parents), tuple(top.interactions), solver_digest, seed, warm_start)
+
+	def get(self, key):
+		""" Looks up a fit.
+
+			Returns:
+			The fit stored under key as a tuple (params, dist, AIC), or None if there is none.
+		"""
+		conn = self.connect()
+		row = conn.execute('SELECT value FROM fits WHERE key = ?', (key,)).fetchone()
+		if row is None:
+			self.stats['misses'] += 1
+			return None
+		self.stats['hits'] += 1
+		conn.execute('UPDATE fits SET used = ? WHERE key = ?', (time.time(), key))
+		return pickle.loads(row[0])
+
+	def put(self, key, params, dist, AIC):
+		""" Stores a fit under key.
+		"""
+		value = pickle.dumps((np.asarray(params, dtype=float), float(dist), float(AIC)), protocol=2)
+		conn = self.connect()
+		conn.execute('INSERT OR REPLACE INTO fits (key, value, used) VALUES (?, ?, ?)', (key, value, time.time()))
+		self.num_stored += 1
+		if self.num_stored % self.evict_every == 0:
+			self.evict()
+
+	def evict(self):
+		""" Removes the least recently used fits until at most max_entries are left.
+
+			Returns:
+			The number of fits removed.
+		"""
+		conn = self.connect()
+		size = conn.execute('SELECT COUNT(*) FROM fits').fetchone()[0]
+		extra = size - self.max_entries
+		if extra <= 0:
+			return 0
+		conn.execute('DELETE FROM fits WHERE key IN (SELECT key FROM fits ORDER BY used LIMIT ?)', (extra,))
+		self.stats['evicted'] += extra
+		return extra
+
+	def __len__(self):
+		return self.connect().execute('SELECT COUNT(*) FROM fits').fetchone()[0]
+
+	def clear(self):
+		""" Removes every fit from the cache.
+		"""
+		self.connect().execute('DELETE FROM fits')
+
+	def close(self):
+		if self.conn is not None and self.pid == os.getpid():
+			self.conn.close()
+		self.conn = None
+
+	def __getstate__(self):
+		# Connections and solver digests are per process
+		state = self.__dict__.copy()
+		state['conn'] = None
+		state['pid'] = None
+		state['solver_digests'] = weakref.WeakKeyDictionary()
+		return state
+
+	def report(self):
+		""" Prints the hit and miss counts of this process.
+		"""
+		lookups = self.stats['hits'] + self.stats['misses']
+		rate = self.stats['hits'] / lookups if lookups > 0 else 0
+		print('Fit cache: {} hits, {} misses ({:.1%} hit rate), {} evicted'.format(self.stats['hits'], self.stats['misses'], rate, self.stats['evicted']))
+
+def open_fit_cache(cache, topology_fn=None):
+	""" Returns a FitCache for the fit_cache argument of generate_models: either a FitCache, which is returned as it is, or the file name of one.
+
+		If the framework topology_fn is given and cannot be identified (see framework_digest), None is returned instead, since its fits could be mistaken for those of another framework.
+	"""
+	if cache is None:
+		return None
+	if topology_fn is not None and framework_digest(topology_fn) is None:
+		print("A fit cache is given, but the model framework has neither a FrameworkSpec nor python code to identify it by. Proceeding without the fit cache")
+		return None
+	if isinstance(cache, FitCache):
+		return cache
+	return FitCache(cache)
@@ -0,0 +1,197 @@
+import collections
+import re
+import numpy as np
+
+
+def substitute_names(expr, names):
+	""" Replaces the names used in the expressions of a FrameworkSpec (X, P, EDGES, n0, n1, ..., e0, e1, ...) by the output of names(name).
+	"""
+	return re.sub(r'\b(X|P|EDGES|n\d+|e\d+)\b', lambda m: names(m.group(1)), expr)
+
+class FrameworkSpec(object):
+	""" Declarative description of a model framework, from which a specialized derivative function can be generated for every topology (see compile_topology).
+
+		The derivative of a target is given as expressions in the following names:
+			X - The value of the target species
+			P - The value of the parent of an edge (the product of the values of its species for complex parents)
+			n0, n1, ... - The node parameters of the target, in the order of the framework's node ParameterTypes
+			e0, e1, ... - The parameters of an edge, in the order of the framework's edge ParameterTypes
+			EDGES - The sum of the terms of all edges of the topology
+		Expressions can also use numpy functions through np (eg. np.exp).
+
+		Args:
+		node_expr - The expression for the derivative of the target in terms of X, the node parameters and EDGES. For example 'n0 - n1 * X + EDGES'.
+
+		edge_exprs - A list of expressions such that edge_exprs[i] is the term contributed by an edge with interaction i, in terms of X, P and the edge parameters. For example ['e0 * P']. A single expression is used for edges of any interaction.
+
+		num_node_params - The number of node parameters
+
+		num_edge_params - The number of parameters of every edge
+	"""
+	def __init__(self, node_expr, edge_exprs, num_node_params, num_edge_params):
+		self.node_expr = node_expr
+		self.edge_exprs = list(edge_exprs)
+		self.num_node_params = num_node_params
+		self.num_edge_params = num_edge_params
+
+	def fingerprint(self):
+		""" Returns the expressions and parameter counts that determine the derivatives of this spec, for the key of a FitCache.
+		"""
+		return (self.node_expr, tuple(self.edge_exprs), self.num_node_params, self.num_edge_params)
+
+	def expression(self, topology, x_name='x', params_name='params', vectorized=False):
+		""" Writes out the derivative of the target of a topology as a single python expression.
+
+			Args:
+			topology - A Topology object describing the model
+
+			x_name - The name of the variable holding the species values
+
+			params_name - The name of the variable holding the parameter list of the topology
+
+			vectorized - If True, x_name holds the values across all time steps, such that x[t, s] = value of species s at time t
+
+			Returns:
+			The expression as a string.
+		"""
+		def value(s):
+			if vectorized:
+				return '{}[:, {}]'.format(x_name, s)
+			return '{}[{}]'.format(x_name, s)
+
+		def parent_value(p):
+			if type(p) is tuple:
+				return '(' + ' * '.join(value(s) for s in p) + ')'
+			return value(p)
+
+		def node_names(name):
+			if name == 'X':
+				return value(topology.target)
+			if name.startswith('n'):
+				return '{}[{}]'.format(params_name, int(name[1:]))
+			if name == 'EDGES':
+				return edges
+			raise ValueError('{} cannot be used in a node expression'.format(name))
+
+		terms = []
+		for i in range(len(topology.parents)):
+			p = topology.parents[i]
+			at = self.num_node_params + i * self.num_edge_params
+			def edge_names(name):
+				if name == 'X':
+					return value(topology.target)
+				if name == 'P':
+					return parent_value(p)
+				if name.startswith('e'):
+					return '{}[{}]'.format(params_name, at + int(name[1:]))
+				raise ValueError('{} cannot be used in an edge expression'.format(name))
+			edge_expr = self.edge_exprs[0] if len(self.edge_exprs) == 1 else self.edge_exprs[topology.interactions[i]]
+			terms.append('(' + substitute_names(edge_expr, edge_names) + ')')
+		edges = '(' + ' + '.join(terms) + ')' if len(terms) > 0 else '0'
+
+		return substitute_names(self.node_expr, node_names)
+
+
+class CompiledTopology(object):
+	""" The derivative functions generated for one topology by compile_topology.
+
+		fn(x, t, params) calculates the derivative of the target at time t and vectorized(xs, ts, params) at every time step at once (as a numpy array). source holds the generated code.
+	"""
+	def __init__(self, fn, vectorized, source):
+		self.fn = fn
+		self.vectorized = vectorized
+		self.source = source
+
+
+# Compiled functions for each (spec, topology key), least recently used first. See compile_topology.
+_compiled_topologies = collections.OrderedDict()
+
+# The number of topologies whose compiled functions are kept
+COMPILED_CACHE_SIZE = 4096
+
+def topology_key(topology):
+	""" A hashable key identifying the structure of a topology: its target, parents and interactions.
+	"""
+	return topology.key
+
+def compile_source(source):
+	""" Executes generated source code (with numpy available as np) and returns the namespace it defined.
+	"""
+	namespace = {'np': np}
+	exec(compile(source, '<tsa compiled>', 'exec'), namespace)
+	return namespace
+
+def compile_topology(spec, topology):
+	""" Generates straight-line derivative functions for a topology under a framework spec, so that the parents, interactions and parameter indices of the topology are resolved once instead of on every call.
+
+		Compiled functions are cached by spec and topology key, so compiling the same topology again is a dictionary lookup. The functions of the COMPILED_CACHE_SIZE most recently used topologies are kept.
+
+		Args:
+		spec - A FrameworkSpec describing the framework
+
+		topology - A Topology object describing the model
+
+		Returns:
+		A CompiledTopology.
+	"""
+	key = (id(spec), topology_key(topology))
+	compiled = _compiled_topologies.get(key)
+	if compiled is not None:
+		_compiled_topologies.move_to_end(key)
+		return compiled[1]
+
+	expr = spec.expression(topology)
+	vec_expr = spec.expression(topology, x_name='xs', vectorized=True)
+	source = 'def dX(x, t, params):\n\treturn {}\n\n'.format(expr)
+	# Adding zeros gives an array even if the expression does not depend on xs, without changing its value
+	source += 'def dX_vec(xs, ts, params):\n\treturn ({}) + np.zeros(xs.shape[0])\n'.format(vec_expr)
+	namespace = compile_source(source)
+	compiled = CompiledTopology(namespace['dX'], namespace['dX_vec'], source)
+	_compiled_topologies[key] = (spec, compiled)	# Keep spec alive so that its id is not reused while the entry exists
+	if len(_compiled_topologies) > COMPILED_CACHE_SIZE:
+		_compiled_topologies.popitem(last=False)
+	return compiled
+
+def compile_whole_model(spec, topologies):
+	""" Builds a function calculating the derivatives of every species of a whole model from the compiled functions of its topologies (see compile_topology). 
+
+		Whole models are not compiled as a single function, since most are simulated only once: compiling each of them costs about as much as simulating it, and caching them holds memory for every model checked.
+
+		Args:
+		spec - A FrameworkSpec describing the framework
+
+		topologies - A list of Topology objects representing the parental structure of each species
+
+		Returns:
+		A function fn(x, t, params), where params[i] is the list of parameters for topology i, that returns the derivatives of every species as a numpy array.
+	"""
+	fns = [compile_topology(spec, top).fn for top in topologies]
+	def dX(x, t, params):
+		return np.array([fns[i](x, t, params[i]) for i in range(len(fns))])
+	return dX
+
+def clear_compiled_cache():
+	""" Empties the cache of compile_topology.
+	"""
+	_compiled_topologies.clear()
+
+def framework_spec(topology_fn):
+	""" Returns the FrameworkSpec attached to a topology function as its `spec` attribute, or None if it has none.
+	"""
+	return getattr(topology_fn, 'spec', None)
+
+
+class DeclarativeFramework(object):
+	""" A model framework defined only by a FrameworkSpec. It can be passed as the topology_fn anywhere in TSA: calling it (with the signature fn(x, t, topology, params)) and its vectorized form both run the compiled functions of the topology.
+
+		Args:
+		spec - A FrameworkSpec describing the framework
+	"""
+	def __init__(self, spec):
+		self.spec = spec
+
+	def __call__(self, x, t, topology, params):
+		return compile_topology(self.spec, topology).fn(x, t, params)
+
+	def vectorized(self, xs, ts, topology, params):
+		return compile_topology(self.spec, topology).vectorized(xs, ts, params)
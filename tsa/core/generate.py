@@ -1,16 +1,24 @@
 import itertools
+import heapq
+import random
 import numpy as np 
 from scipy.integrate import odeint
-from scipy.optimize import minimize
+from scipy.optimize import minimize, least_squares
 import time
 import platform 
 import multiprocessing as mp 
+from multiprocessing import shared_memory
 from .model import *
+from .solvers import *
+from .jit import *
+from .cache import *
+from .prescreen import *
 
 import pickle
 import json
 import math
 import sys
+import os
 
 def sim_data(model_fn, time_scale, x0):
 	""" Create time series data for a model by simulating it across the given time scale. 
@@ -66,7 +74,35 @@ def enumerate_perms(num_parents, interactions):
 	for i in perm_list:
 		yield tuple(i)
 
-def generate_target_topologies(model_space, target, enf_edges=[], enf_gaps=[]):
+def candidate_interactomes(model_space, enf_edges=[], enf_gaps=[]):
+	""" Lists the interactomes (species, or tuples of species for complex parents) that can be parents of a target, besides its enforced edges. See generate_target_topologies.
+	"""
+	# Put all enforced nodes in tuple form for next steps
+	enf_edges = tuple([tuple([e]) for e in enf_edges])
+	enf_gaps = tuple([tuple([e]) for e in enf_gaps])
+	
+	# List out the nodes that are not enforced gaps 
+	nodes = [(i) for i in range(model_space.num_nodes) if i not in enf_gaps]
+	
+	# Generate a list of interactomes based on order
+	max_order = model_space.max_order
+	interactomes = [itertools.combinations(nodes, i) for i in range(1, max_order+1)]
+	interactomes = [map(lambda x: x[0] if len(x)==1 else x, i) for i in interactomes] # Makes it so that non-complex interactomes are represented as ints, while complex ones are tuples (eg: (1) becomes 1, but (1,2) stays the same)
+	interactomes = itertools.chain(*tuple(interactomes))
+
+	# Remove enforced nodes so that they can be added in later:
+	interactomes = filter(lambda x: x not in enf_edges, interactomes)
+
+	return list(interactomes)
+
+def count_target_topologies(model_space, num_interactomes, num_enf_edges=0):
+	""" Counts the topologies generate_target_topologies enumerates for a target with num_interactomes candidate parents and num_enf_edges enforced edges, without enumerating them.
+	"""
+	num_interactions = max(model_space.num_interactions, 0)
+	num_enf_edges = min(num_enf_edges, model_space.max_parents)
+	return sum(math.comb(num_interactomes, k) * num_interactions ** k for k in range(model_space.max_parents + 1 - num_enf_edges))
+
+def generate_target_topologies(model_space, target, enf_edges=[], enf_gaps=[], parents=None):
 	""" Generate all possible network topologies concerning one target species
 
 		Args:
@@ -78,6 +114,8 @@ def generate_target_topologies(model_space, target, enf_edges=[], enf_gaps=[]):
 
 		enf_gaps - An array of nodes that specify which nodes cannot be parents of this target 
 
+		parents - An optional list of interactomes (see candidate_interactomes). If set, only these are considered as parents besides the enforced edges. See prescreen_parents.
+
 		Returns:
 		An iterator containing all possible network topologies in the form (dX, topology). 
 		dX is a function that takes in a list of parameters and returns the derivatives of the target variable for the given topology. topology is a Topology object specifying the structure of this part of the graph.
@@ -90,23 +128,12 @@ def generate_target_topologies(model_space, target, enf_edges=[], enf_gaps=[]):
 		enf_edges = enf_edges[:model_space.max_parents]
 		num_enf_edges = model_space.max_parents
 
+	interactomes = candidate_interactomes(model_space, enf_edges, enf_gaps)
+	if parents is not None:
+		interactomes = [i for i in interactomes if i in parents]
+
 	# Put all enforced nodes in tuple form for next steps
 	enf_edges = tuple([tuple([e]) for e in enf_edges])
-	enf_gaps = tuple([tuple([e]) for e in enf_gaps])
-	
-	# List out the nodes that are not enforced gaps 
-	nodes = [(i) for i in range(model_space.num_nodes) if i not in enf_gaps]
-	
-	# Generate a list of interactomes based on order
-	max_order = model_space.max_order
-	interactomes = [itertools.combinations(nodes, i) for i in range(1, max_order+1)]
-	interactomes = [map(lambda x: x[0] if len(x)==1 else x, i) for i in interactomes] # Makes it so that non-complex interactomes are represented as ints, while complex ones are tuples (eg: (1) becomes 1, but (1,2) stays the same)
-	interactomes = itertools.chain(*tuple(interactomes))
-
-	# Remove enforced nodes so that they can be added in later:
-	interactomes = filter(lambda x: x not in enf_edges, interactomes)
-
-	interactomes = list(interactomes)
 
 	# List out interactions
 	interactions = [i for i in range(model_space.num_interactions)]
@@ -131,295 +158,1907 @@ def generate_target_topologies(model_space, target, enf_edges=[], enf_gaps=[]):
 
 				yield (dX, topology)
 
+def rank_combination(n, comb):
+	""" The position of a combination (a sorted tuple of distinct integers in range(n)) in the order of itertools.combinations(range(n), len(comb)).
+	"""
+	k = len(comb)
+	rank = 0
+	prev = -1
+	for i in range(k):
+		# Count the combinations that have a smaller item at position i
+		for x in range(prev+1, comb[i]):
+			rank += math.comb(n - x - 1, k - i - 1)
+		prev = comb[i]
+	return rank
+
+def unrank_combination(n, k, rank):
+	""" The combination of k items of range(n) at position rank of itertools.combinations(range(n), k). The inverse of rank_combination.
+	"""
+	comb = []
+	x = 0
+	for i in range(k):
+		while True:
+			num_with_x = math.comb(n - x - 1, k - i - 1)
+			if rank < num_with_x:
+				break
+			rank -= num_with_x
+			x += 1
+		comb.append(x)
+		x += 1
+	return tuple(comb)
+
+class TopologySpace(object):
+	""" The topologies of one target, in the order of generate_target_topologies, with direct access to the topology at any position.
+
+		Topologies are numbered by a combinatorial number system: first by their number of (non-enforced) parents k, then by the position of their parent combination among the combinations of k candidate parents, then by their interaction permutation (read as a number in base num_interactions, with the first parent as the least significant digit, see enumerate_perms). This makes it possible to count the topologies exactly, and to go from a topology to its index and back, without enumerating the topologies in between. So a range of topologies can be fit on its own, eg. to split a target across hosts (see run_shard).
 
-def objective_fn(fn, specie_vals, target_derivs, topology, time_scale):
-	""" Creates an objective function that calculates the euclidean distance between the target_derivs and the output of fn for given parameters. 
-		
 		Args:
-		fn - A function that takes in the value of species at time t, the time t, the topology and parameter list and outputs the derivative of x.
-		
-		specie_vals - A numpy array containing the value of each species across all time steps, such that species_vals[t, s] = value of species s at time t.
-		
-		target_derivs - A numpy array containing the values against which to compare the output of fn.
-		
-		topology - A Topology object describing the model currently being examined
-		
+		model_space, target, enf_edges, enf_gaps, parents - As for generate_target_topologies
+
+		Attributes:
+		interactomes - The candidate parents besides the enforced edges
+
+		count - The number of topologies
+	"""
+	def __init__(self, model_space, target, enf_edges=[], enf_gaps=[], parents=None):
+		if len(enf_edges) > model_space.max_parents:
+			enf_edges = enf_edges[:model_space.max_parents]
+		interactomes = candidate_interactomes(model_space, enf_edges, enf_gaps)
+		if parents is not None:
+			interactomes = [i for i in interactomes if i in parents]
+
+		self.model_space = model_space
+		self.target = target
+		self.interactomes = interactomes
+		self.positions = dict((interactomes[i], i) for i in range(len(interactomes)))
+		self.enf_edges = tuple([tuple([e]) for e in enf_edges])
+		self.num_interactions = max(model_space.num_interactions, 0)
+
+		# Number of topologies with k non-enforced parents, and the index of the first of them
+		n = len(interactomes)
+		self.sizes = [math.comb(n, k) * self.num_interactions ** k for k in range(model_space.max_parents + 1 - len(enf_edges))]
+		self.offsets = [sum(self.sizes[:k]) for k in range(len(self.sizes))]
+		self.count = sum(self.sizes)
+
+	def __len__(self):
+		return self.count
+
+	def topology(self, index):
+		""" The topology at position index.
+
+			Returns:
+			A Topology object.
+		"""
+		if index < 0 or index >= self.count:
+			raise IndexError('Topology index {} is out of range for {} topologies'.format(index, self.count))
+		k = 0
+		while index >= self.offsets[k] + self.sizes[k]:
+			k += 1
+		num_perms = self.num_interactions ** k
+		comb_rank, perm_rank = divmod(index - self.offsets[k], num_perms)
+		comb = unrank_combination(len(self.interactomes), k, comb_rank)
+		interactions = tuple((perm_rank // self.num_interactions ** j) % self.num_interactions for j in range(k))
+		parents = tuple(self.interactomes[i] for i in comb) + self.enf_edges
+		return Topology(target=self.target, interactions=interactions, parents=parents)
+
+	def index(self, topology):
+		""" The position of a topology. The inverse of the topology method.
+
+			Returns:
+			The index as an integer. A ValueError is raised if the topology is not in this space.
+		"""
+		parents = tuple(topology.parents)
+		k = len(parents) - len(self.enf_edges)
+		if topology.target != self.target or k < 0 or k >= len(self.sizes) or parents[k:] != self.enf_edges:
+			raise ValueError('{} is not in the topology space of target {}'.format(topology, self.target))
+		try:
+			comb = [self.positions[p] for p in parents[:k]]
+		except KeyError:
+			raise ValueError('{} is not in the topology space of target {}'.format(topology, self.target))
+		interactions = tuple(topology.interactions)
+		if comb != sorted(set(comb)) or len(interactions) != k or any(i < 0 or i >= self.num_interactions for i in interactions):
+			raise ValueError('{} is not in the topology space of target {}'.format(topology, self.target))
+		perm_rank = sum(interactions[j] * self.num_interactions ** j for j in range(k))
+		return self.offsets[k] + rank_combination(len(self.interactomes), comb) * self.num_interactions ** k + perm_rank
+
+	def topologies(self, start=0, stop=None):
+		""" Generates the topologies with indices in [start, stop), in the form (dX, topology) of generate_target_topologies.
+		"""
+		stop = self.count if stop is None else min(stop, self.count)
+		dX = self.model_space.topology_fn
+		for index in range(max(start, 0), stop):
+			yield (dX, self.topology(index))
+
+
+def topology_rng(seed, top):
+	""" Creates the random number generator used to draw starting values when fitting a topology. 
+
+		Args:
+		seed - The seed of the whole run. If None, no generator is created and the global random module is used instead. 
+
+		top - The Topology object being fit
+
+		Returns:
+		A random.Random object that depends only on the seed and the target, parents and interactions of the topology, or None if seed is None. This makes the fit of any topology independent of the order (and process) in which topologies are fit, and of which other topologies are enumerated (so fits can be cached across runs, see FitCache).
+	"""
+	if seed is None:
+		return None
+	return random.Random('{}-{}-{}-{}'.format(seed, top.target, list(top.parents), list(top.interactions)))
+
+def sub_topologies(top):
+	""" Lists the topologies nested in a topology with one parent less.
+
+		Returns:
+		A list of (index, Topology) pairs, one for each parent of top, where the Topology is top without the parent at position index.
+	"""
+	subs = []
+	for i in range(len(top.parents)):
+		sub = Topology(target=top.target,
+					   interactions=tuple(top.interactions[:i]) + tuple(top.interactions[i+1:]),
+					   parents=tuple(top.parents[:i]) + tuple(top.parents[i+1:]))
+		subs.append((i, sub))
+	return subs
+
+def warm_starts(dX, top, solver, seed, optima, cache=None):
+	""" Finds starting values for fitting a topology from the fits of its nested topologies (the topology without one of its parents). The fit of the best nested topology is extended with the default values (see ParameterType.default_value) of the parameters of the missing edge.
+
+		Since generate_target_topologies enumerates topologies by increasing number of parents, the nested topologies have usually been fit already. Those that have not (eg. because they were fit by another process) are fit here, in the same way as if they had been enumerated, so the result does not depend on the order in which topologies are fit.
+
+		Args:
+		dX - The topology function of the model framework 
+
+		top - A Topology object describing the model to fit 
+
+		solver - A solver object for the target of the topology
+
+		seed - The seed of the run (see topology_rng)
+
+		optima - A dictionary of the fits of topologies of this target, by topology key, as tuples (params, dist). Updated with any topology fit here.
+
+		cache - An optional FitCache used for the fits of nested topologies
+
+		Returns:
+		A list of starting parameter lists, which is empty for topologies without parents.
+	"""
+	if len(top.parents) < 2:
+		return []
+	best = None
+	for i, sub in sub_topologies(top):
+		key = topology_key(sub)
+		if key not in optima:
+			fit_topology(dX, sub, solver, rng=topology_rng(seed, sub), cache=cache, seed=seed, optima=optima)
+		params, dist = optima[key]
+		if best is None or dist < best[2]:
+			best = (i, params, dist)
+	if best is None:
+		return []
+
+	i, params, dist = best
+	num_node = len(solver.node_ptypes)
+	num_edge = len(solver.edge_ptypes)
+	at = num_node + i * num_edge
+	new_edge = [pt.default_value() for pt in solver.edge_ptypes]
+	return [list(params[:at]) + new_edge + list(params[at:])]
+
+def fit_topology(dX, top, solver, rng=None, cache=None, seed=None, optima=None):
+	""" Performs gradient matching on a single topology to find the parameters that produce gradient values closest to the target derivatives.
+
+		Args:
+		dX - The topology function of the model framework 
+
+		top - A Topology object describing the model to fit 
+
+		solver - A solver object for the target of the topology. See make_solver.
+
+		rng - A random.Random object used to draw starting values. If None, the global random module is used.
+
+		cache - An optional FitCache. The fit is looked up in it before optimizing, and stored in it otherwise. Only used if seed is set and the solver has a fingerprint method, since other fits cannot be reproduced.
+
+		seed - The seed rng was created from (see topology_rng)
+
+		optima - If set, the fit is warm-started from the fits of nested topologies (see warm_starts), and added to them. A dictionary of the fits of topologies of the same target, by topology key. Ignored by solvers that do not use starting values.
+
+		Returns:
+		A TargetModel object containing the best parameters found, along with their distance and AIC.
+	"""
+	if optima is not None and not getattr(solver, 'accepts_starts', False):
+		optima = None
+
+	key = None
+	if cache is not None and seed is not None and hasattr(solver, 'fingerprint'):
+		key = cache.key(dX, top, solver, seed, warm_start=optima is not None)
+		cached = cache.get(key)
+		if cached is not None:
+			params, dist, AIC = cached
+			if optima is not None:
+				optima[topology_key(top)] = (params, dist)
+			return TargetModel(topology=top, params=params, dist=dist, AIC=AIC, restarts=0)
+
+	if optima is not None:
+		starts = warm_starts(dX, top, solver, seed, optima, cache=cache)
+		best_params, best_dist = solver.fit(dX, top, rng=rng, starts=starts)
+		optima[topology_key(top)] = (best_params, best_dist)
+	else:
+		best_params, best_dist = solver.fit(dX, top, rng=rng)
+
+	num_params = len(best_params)
+
+	# Calculate num time steps
+	ts = solver.target_derivs.shape[0]
+
+	# Calculate Biased AIC for this model
+	AIC_bias = 2 * (num_params + 1) * (ts / (ts - num_params))
+	AIC  = ts * np.log(best_dist / ts) + AIC_bias
+
+	if key is not None:
+		cache.put(key, best_params, best_dist, AIC)
+
+	# Create TargetModel using best parameters and AIC 
+	return TargetModel(topology=top,
+					   params=best_params,
+					   dist=best_dist,
+					   AIC=AIC,
+					   restarts=getattr(solver, 'last_restarts', None))
+
+def is_weak_signal(model, weak_sig_thresh):
+	""" Checks if any parameter of a fitted TargetModel is below the weak signal threshold, in which case the model is considered spurious.
+	"""
+	return np.abs(model.params).min() < weak_sig_thresh
+
+def count_restarts(counts, model):
+	""" Adds the number of restarts used to fit a TargetModel to a dictionary counting the topologies fit with each number of restarts. Models with an unknown number of restarts are not counted.
+	"""
+	if model.restarts is not None:
+		counts[model.restarts] = counts.get(model.restarts, 0) + 1
+
+def report_restarts(counts):
+	""" Prints a summary of the restarts used per topology, from the counts of count_restarts.
+	"""
+	num_fit = sum(counts.values())
+	if num_fit == 0:
+		return
+	total = sum(r * n for (r, n) in counts.items())
+	print('Restarts used per topology: {:.2f} on average, {} at most ({} topologies)'.format(total / num_fit, max(counts), num_fit))
+
+def retain_best(best, entry, num_best_models):
+	""" Adds an entry to a bounded list of the best models if it is better than the worst model in the list. 
+
+		Args:
+		best - A list of at most num_best_models entries of the form (AIC, index, TargetModel). Modified in place.
+
+		entry - The new (AIC, index, TargetModel) entry
+
+		num_best_models - The maximum number of entries to retain
+
+		Returns:
+		Nothing. Entries are ordered by AIC, with ties broken by the index of the topology, so that the retained set does not depend on the order in which entries are added.
+	"""
+	if len(best) < num_best_models:
+		best.append(entry)
+	else:
+		# Find the index and key of the worst model we have stored
+		biggest_ind, biggest_item = max(enumerate(best), key=lambda x:x[1][:2])
+
+		# If this model is better than the worst model, replace the worst with this
+		if entry[:2] < biggest_item[:2]:
+			best[biggest_ind] = entry
+
+def screen_topologies(items, screener, num_best_models, margin, seed=None, cache=None):
+	""" The first tier of screened gradient matching: fits topologies with a cheap screening solver (see SLSQPSolver.screening_solver), and keeps the candidates whose screened AIC is within margin of the num_best_models-th best screened AIC so far.
+
+		Args:
+		items - An iterator of (index, dX, topology) tuples 
+
+		screener - The screening solver 
+
+		num_best_models - The number of best models retained by gradient matching
+
+		margin - The AIC margin 
+
+		seed, cache - As in fit_topology
+
+		Returns:
+		A tuple (candidates, num_screened), where candidates is a list of (screened AIC, index, dX, topology) tuples. Pass it to promote_screened to find the topologies that are promoted to a full fit. Topologies that cannot be screened (see screenable) are not fit, and their screened AIC is None.
+	"""
+	kbest = [] 	# The num_best_models best screened AICs (negated, as a max-heap)
+	candidates = []
+	limit = 4 * num_best_models + 64
+	num_screened = 0
+	for idx, dX, top in items:
+		num_screened += 1
+
+		# The AIC of a topology with too many parameters for the screened time steps is meaningless, so it is always promoted
+		if not screenable(screener, top):
+			candidates.append((None, idx, dX, top))
+			continue
+
+		AIC = fit_topology(dX, top, screener, rng=topology_rng(seed, top), cache=cache, seed=seed).AIC
+		if len(kbest) < num_best_models:
+			heapq.heappush(kbest, -AIC)
+		elif AIC < -kbest[0]:
+			heapq.heapreplace(kbest, -AIC)
+		if len(kbest) < num_best_models or AIC <= -kbest[0] + margin:
+			candidates.append((AIC, idx, dX, top))
+
+		# Drop candidates that fell out of the margin as the threshold improved
+		if len(candidates) > limit:
+			candidates = promote_screened(candidates, num_best_models, margin)
+			limit = 2 * max(len(candidates), limit // 2)
+	return candidates, num_screened
+
+def screenable(screener, top):
+	""" Checks whether a topology can be screened: the small sample correction of its AIC (see fit_topology) needs more time steps than its number of parameters plus one.
+	"""
+	return screener.target_derivs.shape[0] > len(screener.bounds.get(top)[0]) + 1
+
+def promote_screened(candidates, num_best_models, margin):
+	""" Selects the screened candidates (see screen_topologies) that are promoted to a full fit: those whose screened AIC is within margin of the num_best_models-th best screened AIC of all candidates, and those that could not be screened.
+
+		Since the threshold only depends on the set of candidates and not on the order in which they were screened, the candidates of several chunks can be merged before promotion.
+
+		Returns:
+		The promoted candidates, in order of their index.
+	"""
+	AICs = sorted(c[0] for c in candidates if c[0] is not None)
+	threshold = AICs[num_best_models - 1] + margin if len(AICs) >= num_best_models else float('inf')
+	return sorted([c for c in candidates if c[0] is None or c[0] <= threshold], key=lambda c: c[1])
+
+def gradient_match_topologies(models, target, species_vals, species_derivs, time_scale,  edge_ptypes, node_ptypes, num_best_models=10, num_restarts=5, weak_sig_thresh=1e-5, seed=None, solver=None, cache=None, warm_start=False, stats=None, screen_margin=None, screen_stride=4, screen_tol=1e-3, optima=None):
+	""" Outputs the model topologies for a target species that produce data closest to its "true" values. 
+
+		Performs gradient matching on each model to find parameters that produce gradient values that are closest to to those in species_derivs.
+
+		Args: 
+		models - An iterator containing model topologies in the form (dX, topology). See the generate_target_topologies function for more details 
+
+		target - The target species the models are for (eg. species 0)
+
+		species_derivs - The "true" values of all species derivatives for all time steps. Should be a numpy array such that species_derivs[t, s] is the derivative of species s at time t. 
+
 		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+
+		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+
+		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+
+		num_best_models - The number of best_performing models to retain. 
+
+		num_restarts - The number of times we restart the optimization function to avoid local optima
+
+		weak_sig_thresh - The threshold below which any parameter is considered to be spurious
+
+		seed - If set, the starting values of each topology are drawn from a generator seeded by the seed and the topology, making results reproducible. See topology_rng.
+
+		solver - The solver used to fit each topology. Either a name (see SOLVERS), a solver class, or None for SLSQP with random restarts. See make_solver.
+
+		cache - An optional FitCache holding fits from earlier runs. Topologies found in it are not fit again. Requires a seed.
+
+		warm_start - If True, each topology is first fit starting from the fit of the best topology nested in it, and num_restarts - 1 random restarts are added to that. See warm_starts.
+
+		stats - An optional dictionary. Its 'restarts' entry is a dictionary counting the topologies fit with each number of restarts (which varies for solvers that stop restarting early, see SLSQPSolver), and is updated with the topologies fit here. When screening, the entry 'promoted'[target] is set to the tuple (number of topologies promoted, number of topologies screened).
+
+		screen_margin - If set, topologies are screened before they are fit. Every topology is first fit by the cheap screening solver (see SLSQPSolver.screening_solver), and only those whose screened AIC is within screen_margin of the num_best_models-th best screened AIC are then fit in full. See screen_topologies. Solvers without a screening_solver fit every topology in full.
+
+		screen_stride - The screening solver fits every screen_stride-th time step. Topologies with too many parameters for the screened time steps are always fit in full (see screenable).
+
+		screen_tol - The tolerance of the screening fits, looser than that of the full fits
+
+		optima - An optional dictionary of the fits of topologies of this target for warm starts (see warm_starts), updated with the fits made here. Pass the same dictionary to several calls (eg. the rounds of a TopologySearch) so that nested topologies fit by earlier calls are not fit again. Only used if warm_start is True.
+
+		Returns:
+		A list of length length num_best_models containing TargetModel objects that closest match the "true" values.
+	"""
+	best = []
+	target_derivs = species_derivs[:, target]
+	solver = make_solver(solver, species_vals, target_derivs, time_scale, edge_ptypes, node_ptypes, num_restarts=num_restarts)
+	if not warm_start:
+		optima = None
+	elif optima is None:
+		optima = {}
+
+	items = ((idx, dX, top) for idx, (dX, top) in enumerate(models))
+	if screen_margin is not None and hasattr(solver, 'screening_solver'):
+		candidates, num_screened = screen_topologies(items, solver.screening_solver(screen_stride, tol=screen_tol), num_best_models, screen_margin, seed=seed, cache=cache)
+		promoted = promote_screened(candidates, num_best_models, screen_margin)
+		items = [(idx, dX, top) for (AIC, idx, dX, top) in promoted]
+		if stats is not None:
+			stats.setdefault('promoted', {})[target] = (len(promoted), num_screened)
+
+	# Iterate through all models in the list
+	for idx, dX, top in items:
+		model_details = fit_topology(dX, top, solver, rng=topology_rng(seed, top), cache=cache, seed=seed, optima=optima)
+		if stats is not None:
+			count_restarts(stats.setdefault('restarts', {}), model_details)
+
+		# Check if any parameter is below the weak signal threshold
+		if is_weak_signal(model_details, weak_sig_thresh):
+			continue
 		
+		retain_best(best, (model_details.AIC, idx, model_details), num_best_models)
+
+	# Sort the list of best models
+	best = [entry[2] for entry in sorted(best, key=lambda x: x[:2])]
+
+	return best
+
+# Shared state of each gradient matching worker process. Set once per worker by gradient_match_init.
+_gm_shared = {}
+
+def gradient_match_init(species_vals, species_derivs, time_scale, edge_ptypes, node_ptypes, num_best_models, num_restarts, weak_sig_thresh, seed, solver, cache, warm_start, screen_margin, screen_stride, screen_tol):
+	""" Initializer for the processes of the gradient_match_par pool. Stores the data that is common to every fit so that it is only sent to each process once.
+	"""
+	_gm_shared.update(species_vals=species_vals,
+					  species_derivs=species_derivs,
+					  time_scale=time_scale,
+					  edge_ptypes=edge_ptypes,
+					  node_ptypes=node_ptypes,
+					  num_best_models=num_best_models,
+					  num_restarts=num_restarts,
+					  weak_sig_thresh=weak_sig_thresh,
+					  seed=seed,
+					  solver=solver,
+					  cache=cache,
+					  warm_start=warm_start,
+					  screen_margin=screen_margin,
+					  screen_stride=screen_stride,
+					  screen_tol=screen_tol,
+					  target_solvers={},
+					  target_screeners={},
+					  target_optima={})
+
+def gradient_match_solver(target):
+	""" Returns the solver of a gradient_match_par worker for the given target, creating it on first use so that it is shared by every chunk of that target the worker receives.
+	"""
+	sh = _gm_shared
+	if target not in sh['target_solvers']:
+		sh['target_solvers'][target] = make_solver(sh['solver'], sh['species_vals'], sh['species_derivs'][:, target], sh['time_scale'], sh['edge_ptypes'], sh['node_ptypes'], num_restarts=sh['num_restarts'])
+	return sh['target_solvers'][target]
+
+def gradient_match_screen_chunk(chunk):
+	""" Screens a chunk of topologies for one target inside a gradient_match_par worker (see screen_topologies). 
+
+		Args:
+		chunk - A tuple (target, items) where items is a list of (index, dX, topology) tuples
+
 		Returns:
-		A function that takes in a list of parameters and outputs the euclidean distance (L2 Norm) between fn(params) and target_derivs.
+		A tuple (target, candidates, num_screened, cache_stats), where candidates are the candidates of this chunk as returned by screen_topologies, and cache_stats is as in gradient_match_chunk.
+	"""
+	target, items = chunk
+	sh = _gm_shared
+	if target not in sh['target_screeners']:
+		sh['target_screeners'][target] = gradient_match_solver(target).screening_solver(sh['screen_stride'], tol=sh['screen_tol'])
+	cache = sh['cache']
+	before = dict(cache.stats) if cache is not None else None
+	candidates, num_screened = screen_topologies(items, sh['target_screeners'][target], sh['num_best_models'], sh['screen_margin'], seed=sh['seed'], cache=cache)
+	cache_stats = dict((k, cache.stats[k] - before[k]) for k in before) if cache is not None else None
+	return target, candidates, num_screened, cache_stats
+
+def gradient_match_chunk(chunk):
+	""" Fits a chunk of topologies for one target inside a gradient_match_par worker. 
+
+		Args:
+		chunk - A tuple (target, items, known) where items is a list of (index, dX, topology) tuples, and known is None or a dictionary of fits of nested topologies for warm starts (see warm_starts), which are added to those of the worker
+
+		Returns:
+		A tuple (target, best, num_fit, cache_stats, restarts) where best is the bounded local list of the best (AIC, index, TargetModel) entries found in this chunk, cache_stats counts the hits and misses of the fit cache in this chunk (or is None if there is no cache) and restarts counts the topologies fit with each number of restarts (see count_restarts).
+	"""
+	target, items, known = chunk
+	sh = _gm_shared
+	solver = gradient_match_solver(target)
+	optima = sh['target_optima'].setdefault(target, {}) if sh['warm_start'] else None
+	if optima is not None and known is not None:
+		optima.update(known)
+	cache = sh['cache']
+	before = dict(cache.stats) if cache is not None else None
+	best = []
+	restarts = {}
+	for idx, dX, top in items:
+		model_details = fit_topology(dX, top, solver, rng=topology_rng(sh['seed'], top), cache=cache, seed=sh['seed'], optima=optima)
+		count_restarts(restarts, model_details)
+		if is_weak_signal(model_details, sh['weak_sig_thresh']):
+			continue
+		retain_best(best, (model_details.AIC, idx, model_details), sh['num_best_models'])
+	cache_stats = dict((k, cache.stats[k] - before[k]) for k in before) if cache is not None else None
+	return target, best, len(items), cache_stats, restarts
+
+def chunk_target_topologies(target_models, chunksize, indexed=False):
+	""" Lazily splits the topologies of every target into chunks for dispatch to a process pool.
+
+		Args:
+		target_models - A list of (target, models) pairs, where models is an iterator of (dX, topology) tuples 
+
+		chunksize - The maximum number of topologies in each chunk 
+
+		indexed - If True, models is an iterator of (index, dX, topology) tuples instead, which already carry their index
+
+		Returns:
+		A generator of (target, items) tuples, where items is a list of (index, dX, topology) tuples and index is the position of the topology in the enumeration for its target.
+	"""
+	for target, models in target_models:
+		items = []
+		if not indexed:
+			models = ((idx, dX, top) for idx, (dX, top) in enumerate(models))
+		for idx, dX, top in models:
+			items.append((idx, dX, top))
+			if len(items) == chunksize:
+				yield target, items
+				items = []
+		if len(items) > 0:
+			yield target, items
+
+def gradient_match_pool(species_vals, species_derivs, time_scale, edge_ptypes, node_ptypes, num_best_models=10, num_restarts=5, weak_sig_thresh=1e-5, seed=None, solver=None, processes=4, cache=None, warm_start=False, screen_margin=None, screen_stride=4, screen_tol=1e-3):
+	""" Starts the process pool of gradient_match_par, so that it can be kept open across several calls of gradient_match_par with the same arguments (see its pool argument). The caller closes the pool.
+	"""
+	init_args = (species_vals, species_derivs, time_scale, edge_ptypes, node_ptypes, num_best_models, num_restarts, weak_sig_thresh, seed, solver, cache, warm_start, screen_margin, screen_stride, screen_tol)
+	return mp.Pool(processes=processes, initializer=gradient_match_init, initargs=init_args)
+
+def gradient_match_par(target_models, species_vals, species_derivs, time_scale, edge_ptypes, node_ptypes, num_best_models=10, num_restarts=5, weak_sig_thresh=1e-5, seed=None, solver=None, processes=4, chunksize=16, target_done=None, cache=None, warm_start=False, stats=None, screen_margin=None, screen_stride=4, screen_tol=1e-3, pool=None, optima=None):
+	""" Performs gradient matching for several targets at once, spreading (target, topology) fits across a pool of processes. 
+
+		Topologies are dispatched in chunks. Each chunk keeps a bounded list of its best models, and these are merged per target at the end. For a fixed seed the result is identical to calling gradient_match_topologies on each target in turn.
+
+		Args:
+		target_models - A list of (target, models) pairs, where models is an iterator containing model topologies in the form (dX, topology). See the generate_target_topologies function for more details 
+
+		species_vals - The "true" values of all species for all time steps. Should be a numpy array such that species_vals[t, s] is the value of species s at time t. 
+
+		species_derivs - The "true" values of all species derivatives for all time steps. Should be a numpy array such that species_derivs[t, s] is the derivative of species s at time t. 
+
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+
+		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+
+		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+
+		num_best_models - The number of best_performing models to retain per target. 
+
+		num_restarts - The number of times we restart the optimization function to avoid local optima
+
+		weak_sig_thresh - The threshold below which any parameter is considered to be spurious
+
+		seed - The seed used to draw starting values. See topology_rng.
+
+		solver - The solver used to fit each topology. See make_solver.
+
+		processes - The number of processes to parallelize across 
+
+		chunksize - The number of topologies sent to a process at a time
+
+		target_done - An optional function called as target_done(target, best) as soon as all topologies of a target are fit, where best is the list of best TargetModels for that target.
+
+		cache - An optional FitCache, shared by every process. See gradient_match_topologies. The hits and misses of the workers are added to its stats.
+
+		warm_start - If True, fits are warm-started from the fits of nested topologies. See gradient_match_topologies. Each process keeps the fits of the topologies it has fit, and fits any other nested topology it needs itself, so results are the same as in the serial case.
+
+		stats - An optional dictionary, updated as in gradient_match_topologies.
+
+		screen_margin, screen_stride, screen_tol - Screening of topologies before they are fit. See gradient_match_topologies. Every topology is screened before the promoted topologies are fit, and topologies are promoted by the best screened AICs of their whole target, so the result is the same as in the serial case.
+
+		pool - An optional pool started by gradient_match_pool with the same arguments as this call. It is used instead of starting a new pool and left open, so that its processes keep their solvers and the fits of warm starts across calls (eg. the rounds of a TopologySearch).
+
+		optima - An optional dictionary mapping each target to a dictionary of fits of its topologies for warm starts (see warm_starts). The fits of the nested topologies of each topology are sent along with it, so that no process fits them again, and the dictionary is updated with the fits returned. Only used if warm_start is True.
+
+		Returns:
+		A list such that element i is the list of best TargetModels (as returned by gradient_match_topologies) for the target of target_models[i].
+	"""
+	targets = [t for (t, _) in target_models]
+	merged = dict((t, []) for t in targets)
+	num_fit = 0
+	if not warm_start:
+		optima = None
+
+	def add_cache_stats(cache_stats):
+		if cache_stats is not None:
+			for k in cache_stats:
+				cache.stats[k] += cache_stats[k]
+
+	# Only screen with solvers that have a screening solver
+	screen = screen_margin is not None and len(targets) > 0 and hasattr(make_solver(solver, species_vals, species_derivs[:, targets[0]], time_scale, edge_ptypes, node_ptypes, num_restarts=num_restarts), 'screening_solver')
+
+	# Count the chunks of each target as the pool takes them, to know when a target is finished
+	dispatched = dict((t, 0) for t in targets)
+	returned = dict((t, 0) for t in targets)
+	enumerated = set()
+	reported = set()
+	def chunks():
+		last = None
+		for target, items in chunk_target_topologies(target_models, chunksize, indexed=screen):
+			if target != last and last is not None:
+				enumerated.add(last)
+			last = target
+			dispatched[target] += 1
+			yield target, items, known_fits(target, items)
+		enumerated.update(targets)
+
+	# The known fits of the nested topologies of a chunk, for warm starts
+	def known_fits(target, items):
+		if optima is None or target not in optima:
+			return None
+		known = {}
+		for idx, dX, top in items:
+			for i, sub in sub_topologies(top):
+				key = topology_key(sub)
+				if key in optima[target]:
+					known[key] = optima[target][key]
+		return known
+
+	def best_of(target):
+		return [entry[2] for entry in sorted(merged[target], key=lambda x: x[:2])]
+
+	own_pool = pool is None
+	if own_pool:
+		pool = gradient_match_pool(species_vals, species_derivs, time_scale, edge_ptypes, node_ptypes, num_best_models, num_restarts, weak_sig_thresh, seed, solver, processes, cache, warm_start, screen_margin, screen_stride, screen_tol)
+	try:
+		if screen:
+			candidates = dict((t, []) for t in targets)
+			num_screened = dict((t, 0) for t in targets)
+			for target, chunk_candidates, n, cache_stats in pool.imap_unordered(gradient_match_screen_chunk, chunk_target_topologies(target_models, chunksize)):
+				add_cache_stats(cache_stats)
+				candidates[target] += chunk_candidates
+				num_screened[target] += n
+				print('Screened {} topologies\r'.format(sum(num_screened.values())), end='')
+			print('')
+
+			# Continue with the promoted topologies only
+			promoted = dict((t, promote_screened(candidates[t], num_best_models, screen_margin)) for t in targets)
+			target_models = [(t, [(idx, dX, top) for (AIC, idx, dX, top) in promoted[t]]) for t in targets]
+			if stats is not None:
+				for t in targets:
+					stats.setdefault('promoted', {})[t] = (len(promoted[t]), num_screened[t])
+
+		for target, best, n, cache_stats, restarts in pool.imap_unordered(gradient_match_chunk, chunks()):
+			if stats is not None:
+				counts = stats.setdefault('restarts', {})
+				for r in restarts:
+					counts[r] = counts.get(r, 0) + restarts[r]
+			add_cache_stats(cache_stats)
+			for entry in best:
+				retain_best(merged[target], entry, num_best_models)
+				if optima is not None and target in optima:
+					optima[target][entry[2].topology.key] = (entry[2].params, entry[2].dist)
+			returned[target] += 1
+			num_fit += n
+			print('Fit {} topologies\r'.format(num_fit), end='')
+			if target_done is not None:
+				for t in targets:
+					if t in enumerated and t not in reported and returned[t] == dispatched[t]:
+						reported.add(t)
+						target_done(t, best_of(t))
+	finally:
+		if own_pool:
+			pool.terminate()
+
+	if target_done is not None:
+		for t in targets:
+			if t not in reported:
+				target_done(t, best_of(t))
+
+	return [best_of(t) for t in targets]
+
+# Strategies for searching the topologies of a target. See TopologySearch.
+SEARCH_STRATEGIES = ['exhaustive', 'stepwise', 'beam']
+
+class TopologySearch(object):
+	""" A greedy search through the topologies of one target, as an alternative to fitting every topology that generate_target_topologies enumerates. 
+
+		The search proposes batches of topologies to fit (next_batch) and is given their fits (update), until it is done. This way the fits of the searches of several targets can be made together, by gradient_match_topologies or gradient_match_par (see search_target_models). Topologies are built from the same parents and enforced edges as generate_target_topologies, but are grown one parent (with one interaction) at a time, so that the num_interactions ** num_parents interaction permutations of every parent set are not all fit.
+
+		Strategies:
+		'stepwise' - Starts from the topology without (non-enforced) parents and moves to the best topology that adds a parent (with any interaction) or removes one, as long as that improves the AIC.
+
+		'beam' - Keeps the beam_width best topologies with each number of parents, and fits every topology with one parent more than those, up to max_parents.
+
+		Args:
+		model_space - A ModelSpace object containing the description of the model space 
+
+		target - The target species 
+
+		strategy - 'stepwise' or 'beam'
+
+		num_best_models - The number of best topologies to retain
+
+		beam_width - The width of the beam search
+
+		enf_edges, enf_gaps, parents - As in generate_target_topologies
+
+		weak_sig_thresh - The threshold below which any parameter is considered to be spurious. Topologies with spurious parameters are not retained, but the search can pass through them.
+
+		Attributes:
+		num_fit - The number of topologies fit so far
+	"""
+	def __init__(self, model_space, target, strategy, num_best_models, beam_width=5, enf_edges=[], enf_gaps=[], parents=None, weak_sig_thresh=1e-5):
+		if strategy not in ('stepwise', 'beam'):
+			raise ValueError('Unknown search strategy {}. Choose one of {}'.format(strategy, SEARCH_STRATEGIES))
+		self.model_space = model_space
+		self.target = target
+		self.strategy = strategy
+		self.num_best_models = num_best_models
+		self.beam_width = beam_width
+		self.weak_sig_thresh = weak_sig_thresh
+		self.enf_edges = tuple([tuple([e]) for e in enf_edges[:model_space.max_parents]])
+		self.interactomes = candidate_interactomes(model_space, enf_edges[:model_space.max_parents], enf_gaps)
+		if parents is not None:
+			self.interactomes = [i for i in self.interactomes if i in parents]
+		self.max_free = model_space.max_parents - len(self.enf_edges)
+		self.interactions = list(range(model_space.num_interactions))
+
+		self.num_fit = 0
+		self.best = []			# The best (AIC, fit index, TargetModel) entries. See retain_best.
+		self.visited = set()	# Keys of the topologies proposed so far
+		self.current = None		# The current (AIC, TargetModel) of a stepwise search
+		self.beam = None		# The TargetModels of the current level of a beam search
+		self.done = False
+		self.batch = [self.topology(())]
+
+	def topology(self, edges):
+		""" Creates the topology with the given (interactome index, interaction) edges, besides the enforced edges. 
+		"""
+		edges = sorted(edges)
+		return Topology(target=self.target,
+						interactions=tuple(inter for (i, inter) in edges),
+						parents=tuple(self.interactomes[i] for (i, inter) in edges) + self.enf_edges)
+
+	def edges(self, top):
+		""" The (interactome index, interaction) edges of a topology created by this search.
+		"""
+		free = top.parents[:len(top.parents) - len(self.enf_edges)]
+		return tuple((self.interactomes.index(free[k]), top.interactions[k]) for k in range(len(free)))
+
+	def neighbours(self, top, removals=False):
+		""" The topologies that add one parent to top (or, if removals is set, remove one from it) and have not been proposed yet.
+		"""
+		edges = self.edges(top)
+		used = set(i for (i, inter) in edges)
+		options = []
+		if len(edges) < self.max_free:
+			options += [edges + ((i, inter),) for i in range(len(self.interactomes)) if i not in used for inter in self.interactions]
+		if removals:
+			options += [edges[:k] + edges[k+1:] for k in range(len(edges))]
+		neighbours = []
+		for option in options:
+			new_top = self.topology(option)
+			key = topology_key(new_top)
+			if key not in self.visited:
+				self.visited.add(key)
+				neighbours.append(new_top)
+		return neighbours
+
+	def next_batch(self):
+		""" Returns the list of topologies to fit next, which is empty once the search is done.
+		"""
+		if self.done:
+			return []
+		for top in self.batch:
+			self.visited.add(topology_key(top))
+		return self.batch
+
+	def update(self, models):
+		""" Continues the search with the fits of the last batch: a list of the TargetModels of its topologies, in any order.
+		"""
+		models = sorted(models, key=lambda m: (m.AIC, topology_key(m.topology)))
+		for k in range(len(models)):
+			if not is_weak_signal(models[k], self.weak_sig_thresh):
+				retain_best(self.best, (models[k].AIC, self.num_fit + k, models[k]), self.num_best_models)
+		self.num_fit += len(self.batch)
+
+		if self.strategy == 'stepwise':
+			if len(models) > 0 and (self.current is None or models[0].AIC < self.current[0]):
+				self.current = (models[0].AIC, models[0])
+				self.batch = self.neighbours(models[0].topology, removals=True)
+			else:
+				self.batch = []
+		else:
+			# The next level grows the beam_width best topologies of this level
+			self.beam = models[:self.beam_width]
+			self.batch = []
+			for m in self.beam:
+				self.batch += self.neighbours(m.topology)
+		self.done = len(self.batch) == 0
+
+	def best_models(self):
+		""" Returns the list of the best TargetModels found, as gradient_match_topologies does.
+		"""
+		return [entry[2] for entry in sorted(self.best, key=lambda x: x[:2])]
+
+	def num_exhaustive(self):
+		""" The number of topologies an exhaustive search would fit. See count_target_topologies.
+		"""
+		return count_target_topologies(self.model_space, len(self.interactomes), len(self.enf_edges))
+
+def search_target_models(searches, fit_batches, target_done=None):
+	""" Runs several TopologySearch objects to the end, fitting the batches of all of them together.
+
+		Args:
+		searches - A list of TopologySearch objects
+
+		fit_batches - A function that takes a list of (target, topologies) pairs and returns a list with the list of TargetModels fit for each pair (eg. by calling gradient_match_topologies with num_best_models large enough to return every fit, and a weak_sig_thresh of 0 so that none are left out)
+
+		target_done - An optional function called as target_done(target, best) when the search of a target is done
+
+		Returns:
+		A list with the best TargetModels found by each search.
+	"""
+	reported = set()
+	while True:
+		active = [s for s in searches if not s.done]
+		if target_done is not None:
+			for s in searches:
+				if s.done and s.target not in reported:
+					reported.add(s.target)
+					target_done(s.target, s.best_models())
+		if len(active) == 0:
+			break
+		batches = [(s.target, s.next_batch()) for s in active]
+		results = fit_batches(batches)
+		for s, models in zip(active, results):
+			s.update(models)
+	return [s.best_models() for s in searches]
+
+def permute_whole_models(best_models):
+	""" Consider a list of length n where each position in the list can take one of a set of values for that position. This function finds all permutations of that list given the set of values that each position can take. 
+
+		Args:
+		best_models - A list of lists such that best_models[i] is the list of values that position i can take.
+
+		Returns:
+		A generator of all the permutations of the list. 
+
+		Examples:
+		>>> a = [ [c + str(i) for i in range(2)] for c in ['AB'] ]
+		>>> all = permute_whole_models(a)
+		>>> for i in all:
+		...    print(i)
+		('A0', 'B0')
+		('A0', 'B1')
+		('A1', 'B0')
+		('A1', 'B1')
+	"""
+	num_species = len(best_models)
+
+	def permute_helper(n, opts, lst, pos):
+		if pos == n:
+			yield lst 
+		else:
+			for i in opts[pos]:
+				lst[pos] = i 
+				for p in permute_helper(n, opts, lst, pos+1):
+					yield p 
+
+
+	lst = [-1 for i in range(num_species)]
+	permutations = permute_helper(num_species, best_models, lst, 0)
+
+	for perm in permutations:
+		yield tuple(perm)
+
+def best_first_whole_models(best_models, key='AIC'):
+	""" Lazily generates the same combinations as permute_whole_models, but in ascending order of the summed score of the TargetModels in each combination. 
+
+		Uses a priority queue over index vectors into the (sorted) lists of TargetModels. Each vector is generated from exactly one parent (the vector whose last non-zero index is one lower), so only the frontier of the enumeration is held in memory.
+
+		Args:
+		best_models - A list of lists such that best_models[i] is the list of TargetModels for species i.
+
+		key - The score to order by. Either 'AIC' or 'dist'.
+
+		Returns:
+		A generator of tuples of TargetModels (one per species), in ascending order of summed score.
+	"""
+	if key not in ('AIC', 'dist'):
+		raise ValueError('Unknown whole model ordering {}. Choose one of [\'AIC\', \'dist\']'.format(key))
+
+	num_species = len(best_models)
+	if num_species == 0 or any(len(b) == 0 for b in best_models):
+		return
+
+	opts = [sorted(b, key=lambda m: getattr(m, key)) for b in best_models]
+	scores = [[getattr(m, key) for m in b] for b in opts]
+
+	start = tuple(0 for i in range(num_species))
+	heap = [(sum(s[0] for s in scores), start, 0)]
+	while len(heap) > 0:
+		score, idx, pivot = heapq.heappop(heap)
+		yield tuple(opts[i][idx[i]] for i in range(num_species))
+
+		# Push successors, only incrementing positions at or after the pivot so each vector is pushed once
+		for j in range(pivot, num_species):
+			if idx[j] + 1 < len(opts[j]):
+				nxt = idx[:j] + (idx[j] + 1,) + idx[j+1:]
+				nxt_score = score - scores[j][idx[j]] + scores[j][idx[j] + 1]
+				heapq.heappush(heap, (nxt_score, nxt, j))
+
+def whole_model_to_ode(topology_fn, topologies, params):
+	""" Converts from a list of topologies to a function that computes the derivative of the whole model.
+
+		Args:
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
+
+		topologies - A list of Topology objects representing the parental structure of each species 
+
+		params - A list such that params[i] is the list of parameters for topology i 
+
+		Returns:
+		A function that calculates the derivatives of every species in the model given their values and the time t. If topology_fn has a `whole_model` attribute (see JitFramework), the function is created by it. Otherwise, if topology_fn has a FrameworkSpec as its `spec` attribute, this is built from the functions compiled for each topology (see compile_whole_model).
+	"""
+	whole_model = getattr(topology_fn, 'whole_model', None)
+	if whole_model is not None:
+		return whole_model(topologies, params)
+	spec = framework_spec(topology_fn)
+	if spec is not None:
+		compiled = compile_whole_model(spec, topologies)
+		return lambda x, t: compiled(x, t, params)
+	num_species = len(topologies)
+	def fn(x, t):
+		derivs = [0 for i in range(num_species)]
+		for i in range(num_species):
+			top = topologies[i]
+			pars = params[i]
+			derivs[i] = topology_fn(x, t, top, pars)
+		return derivs 
+	return fn 
+
+def jacobian_sparsity(topologies):
+	""" Calculates which species the derivative of each species in a whole model depends on, from the parent/target edges of its topologies (as in WholeModel.get_edges).
+
+		Args:
+		topologies - A list of Topology objects representing the parental structure of each species 
+
+		Returns:
+		A boolean numpy array A such that A[i, j] is True if the derivative of species i can depend on the value of species j.
+	"""
+	num_species = len(topologies)
+	sparsity = np.zeros((num_species, num_species), dtype=bool)
+	for i in range(num_species):
+		top = topologies[i]
+		sparsity[i, top.target] = True
+		for p in top.parents:
+			if type(p) is tuple:
+				for par in p:
+					sparsity[i, par] = True
+			else:
+				sparsity[i, p] = True
+	return sparsity
+
+def column_groups(sparsity):
+	""" Greedily partitions the columns of a Jacobian sparsity pattern into groups of columns that share no rows, so that each group can be estimated with a single finite-difference evaluation.
+
+		Returns:
+		A list of lists of column indices.
+	"""
+	groups = []
+	group_rows = []
+	for j in range(sparsity.shape[1]):
+		rows = sparsity[:, j]
+		for g in range(len(groups)):
+			if not np.any(group_rows[g] & rows):
+				groups[g].append(j)
+				group_rows[g] = group_rows[g] | rows
+				break
+		else:
+			groups.append([j])
+			group_rows.append(rows.copy())
+	return groups
+
+def whole_model_to_ode_jac(topology_fn, topologies, params, fd_step=1e-7):
+	""" Converts from a list of topologies to a function that computes the derivative of the whole model as a numpy array, together with the Jacobian of that function with respect to the species values. 
+
+		fn is created as in whole_model_to_ode. If topology_fn has a `state_grad` attribute, it is taken to be a function with the same signature as topology_fn that outputs the derivative of the target's derivative with respect to each species, and the Jacobian is built from it. Otherwise the Jacobian is estimated by finite differences, using the sparsity pattern of the model (see jacobian_sparsity) to perturb several species at once.
+
+		Args:
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
+
+		topologies - A list of Topology objects representing the parental structure of each species 
+
+		params - A list such that params[i] is the list of parameters for topology i 
+
+		fd_step - The relative step size used for finite differences
+
+		Returns:
+		A tuple (fn, dfun) of functions of the species values and the time t. fn returns the derivatives of every species and dfun the Jacobian J[i, j] = d fn_i / d x_j, in the form expected by odeint's Dfun.
+	"""
+	num_species = len(topologies)
+	state_grad = getattr(topology_fn, 'state_grad', None)
+	spec = framework_spec(topology_fn)
+
+	if hasattr(topology_fn, 'whole_model') or spec is not None:
+		fn = whole_model_to_ode(topology_fn, topologies, params)
+	else:
+		def fn(x, t):
+			derivs = np.empty(num_species)
+			for i in range(num_species):
+				derivs[i] = topology_fn(x, t, topologies[i], params[i])
+			return derivs 
+
+	if state_grad is not None:
+		def dfun(x, t):
+			J = np.empty((num_species, num_species))
+			for i in range(num_species):
+				J[i, :] = state_grad(x, t, topologies[i], params[i])
+			return J 
+	else:
+		sparsity = jacobian_sparsity(topologies)
+		groups = column_groups(sparsity)
+		def dfun(x, t):
+			x = np.asarray(x, dtype=float)
+			f0 = fn(x, t)
+			J = np.zeros((num_species, num_species))
+			for g in groups:
+				h = fd_step * np.maximum(1.0, np.abs(x[g]))
+				pert = x.copy()
+				pert[g] += h
+				df = fn(pert, t) - f0
+				for c, j in enumerate(g):
+					rows = sparsity[:, j]
+					J[rows, j] = df[rows] / h[c]
+			return J 
+
+	return fn, dfun
+
+def whole_model_sensitivity_ode(topology_fn, topologies, params, fd_step=1e-7):
+	""" Converts from a list of topologies to a function that computes the derivative of the whole model together with its forward sensitivities.
+
+		The sensitivities S[i, j] = d x_i / d p_j, where p is the concatenation of params, follow dS/dt = Jx S + Jp, where Jx is the derivative of the model with respect to the species and Jp its derivative with respect to the parameters. Jx is taken from whole_model_to_ode_jac. Jp is built from the param_grad of topology_fn when it has one (see objective_jac_fn), and by forward finite differences otherwise.
+
+		Args:
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
+
+		topologies - A list of Topology objects representing the parental structure of each species 
+
+		params - A list such that params[i] is the list of parameters for topology i 
+
+		fd_step - The relative step size used for finite differences
+
+		Returns:
+		A tuple (fn, dfun). fn takes in the augmented state z (the values of every species followed by the flattened sensitivity matrix) and the time t and outputs the derivative of z. dfun is an approximate Jacobian of fn (ignoring second derivatives of the model) that can be passed to odeint as Dfun.
+	"""
+	num_species = len(topologies)
+	param_lens = [len(p) for p in params]
+	num_params = sum(param_lens)
+	offsets = [sum(param_lens[:i]) for i in range(num_species)]
+	ode, jac_x = whole_model_to_ode_jac(topology_fn, topologies, params, fd_step=fd_step)
+	grad_fn = getattr(topology_fn, 'param_grad', None)
+
+	def jac_p(x, t):
+		Jp = np.zeros((num_species, num_params))
+		for i in range(num_species):
+			top = topologies[i]
+			pars = np.asarray(params[i], dtype=float)
+			at = offsets[i]
+			if grad_fn is not None:
+				Jp[i, at:at+len(pars)] = grad_fn(x.reshape(1, -1), np.array([t]), top, pars)[0]
+			else:
+				f0 = topology_fn(x, t, top, pars)
+				for j in range(len(pars)):
+					h = fd_step * max(1.0, abs(pars[j]))
+					pert = pars.copy()
+					pert[j] += h
+					Jp[i, at+j] = (topology_fn(x, t, top, pert) - f0) / h
+		return Jp 
+
+	def fn(z, t):
+		x = z[:num_species]
+		S = z[num_species:].reshape(num_species, num_params)
+		f0 = ode(x, t)
+		dS = jac_x(x, t).dot(S) + jac_p(x, t)
+		return np.concatenate([f0, dS.ravel()])
+
+	def dfun(z, t):
+		Jx = jac_x(z[:num_species], t)
+		D = np.zeros((len(z), len(z)))
+		D[:num_species, :num_species] = Jx 
+		D[num_species:, num_species:] = np.kron(Jx, np.eye(num_params))
+		return D 
+	return fn, dfun
+
+def refit_whole_model(wm, topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes, watchdog=None):
+	""" Fits the parameters of a single whole model to produce outputs similar to true_vals. See fit_whole_model.
+
+		Args:
+		wm - A WholeModel object 
+
+		See fit_whole_model for the other arguments.
+
+		Returns:
+		A new WholeModel with the same topologies as wm and the refit parameters, whose dist is the distance of the refit model from the true_vals.
 	"""
 	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
-	def obj(params):
-		sim = [fn(specie_vals[i], ts[i], topology, params) for i in range(len(ts))]
-		return np.linalg.norm(sim-target_derivs)
-	return obj
+	topologies = [tup.topology for tup in wm.targets]
+	initial_guess = [tup.params for tup in wm.targets]
+	param_lens = [len(ig) for ig in initial_guess]
+	bounds = [tup.topology.to_bounds_lst(edge_ptypes, node_ptypes) for tup in wm.targets]
+	bounds = sum(bounds, [])
+	bounds = [tuple(b) for b in bounds]
+
+	def whole_model_obj(params):
+		formatted = []
+		at = 0
+		for pl in param_lens:
+			formatted += [params[at:at+pl]]
+			at += pl 
+		ode, dfun = whole_model_to_ode_jac(topology_fn, topologies, formatted)
+		if watchdog is None:
+			sim_vals = odeint(ode, initial_values, ts, Dfun=dfun)
+		else:
+			sim_vals = watchdog.simulate(ode, initial_values, ts, Dfun=dfun)
+		dist = np.linalg.norm(sim_vals-true_vals)
+		return dist 
+
+	def guarded_obj(params):
+		# Aborted simulations are given a large (but finite) distance so that the optimizer steers away from them 
+		try:
+			return whole_model_obj(params)
+		except SimulationAborted:
+			return 1e12
+
+	initial_guess = np.concatenate([np.asarray(ig, dtype=float) for ig in initial_guess])
+	res = minimize(guarded_obj, initial_guess, method="SLSQP", bounds=bounds)
+	opt_params = res.x 
+	try:
+		opt_dist = whole_model_obj(opt_params)
+	except SimulationAborted as e:
+		opt_dist = float('inf')
+	opt_formatted = []
+	opt_at = 0
+	for pl in param_lens:
+		opt_formatted += [opt_params[opt_at:opt_at+pl]]
+		opt_at += pl 
+	new_targets = [TargetModel(topology=wm.targets[i].topology, 
+							   params=opt_formatted[i],
+							   dist=None,
+							   AIC=None) for i in range(len(wm.targets))]
+	return WholeModel(new_targets, opt_dist, node_ptypes, edge_ptypes)
+
+def refit_whole_model_lsq(wm, topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes, watchdog=None):
+	""" Does the same as refit_whole_model, but treats the refit as a least-squares problem on the residuals sim_vals - true_vals. The Jacobian of the residuals is taken from the forward sensitivities of the model (see whole_model_sensitivity_ode), so each iteration costs one integration of the augmented system instead of one integration per parameter.
+
+		Args:
+		See refit_whole_model.
+
+		Returns:
+		A new WholeModel with the same topologies as wm and the refit parameters, whose dist is the distance of the refit model from the true_vals.
+	"""
+	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	topologies = [tup.topology for tup in wm.targets]
+	param_lens = [len(tup.params) for tup in wm.targets]
+	num_species = len(topologies)
+	num_params = sum(param_lens)
+	bounds = sum([tup.topology.to_bounds_lst(edge_ptypes, node_ptypes) for tup in wm.targets], [])
+	lb = np.array([b[0] for b in bounds], dtype=float)
+	ub = np.array([b[1] for b in bounds], dtype=float)
+	true_vals = np.asarray(true_vals, dtype=float)
+
+	def split(params):
+		formatted = []
+		at = 0
+		for pl in param_lens:
+			formatted += [params[at:at+pl]]
+			at += pl 
+		return formatted
+
+	# Residuals and Jacobian come from the same integration, so cache the last one
+	cache = {}
+	def solve(params):
+		key = tuple(params)
+		if cache.get('key') != key:
+			ode, dfun = whole_model_sensitivity_ode(topology_fn, topologies, split(params))
+			z0 = np.concatenate([np.asarray(initial_values, dtype=float), np.zeros(num_species * num_params)])
+			if watchdog is None:
+				z = odeint(ode, z0, ts, Dfun=dfun)
+			else:
+				z = watchdog.integrate(watchdog.guard(ode), z0, ts, Dfun=dfun)
+			cache['key'] = key 
+			cache['resid'] = (z[:, :num_species] - true_vals).ravel()
+			cache['jac'] = z[:, num_species:].reshape(len(ts) * num_species, num_params)
+		return cache
+
+	initial_guess = np.concatenate([np.asarray(tup.params, dtype=float) for tup in wm.targets])
+	initial_guess = np.clip(initial_guess, lb, ub)
+	try:
+		res = least_squares(lambda p: solve(p)['resid'], initial_guess, jac=lambda p: solve(p)['jac'], bounds=(lb, ub), method='trf', ftol=1e-6, xtol=1e-6)
+		opt_params = res.x 
+		opt_dist = np.linalg.norm(solve(opt_params)['resid'])
+	except SimulationAborted:
+		opt_params = initial_guess
+		opt_dist = float('inf')
+
+	opt_formatted = split(opt_params)
+	new_targets = [TargetModel(topology=wm.targets[i].topology, 
+							   params=opt_formatted[i],
+							   dist=None,
+							   AIC=None) for i in range(len(wm.targets))]
+	return WholeModel(new_targets, opt_dist, node_ptypes, edge_ptypes)
+
+def print_refit_progress(done, total, index, seconds):
+	""" The default progress callback of fit_whole_model. Prints one line per refit model.
+	"""
+	print('	Finished {} of {} (model {}) in {:.2f} seconds'.format(done, total, index, seconds))
+	sys.stdout.flush()
+
+def load_records(fname, truncate=False):
+	""" Reads the records streamed to a checkpoint file, where each record was appended with pickle.dump (and flushed) as soon as it was ready.
+
+		Args:
+		fname - The checkpoint file name 
+
+		truncate - If True, anything in the file after the last complete record (eg. a record that was only partly written because the run was killed) is removed, so that new records can be appended.
+
+		Returns:
+		A list of the complete records in the file, or an empty list if it does not exist.
+	"""
+	records = []
+	try:
+		f = open(fname, 'r+b' if truncate else 'rb')
+	except FileNotFoundError:
+		return records
+	with f:
+		good = 0
+		while True:
+			try:
+				records.append(pickle.load(f))
+			except Exception:
+				break
+			good = f.tell()
+		if truncate:
+			f.truncate(good)
+	return records
+
+def append_record(f, record):
+	""" Appends a record to a checkpoint file opened in append mode, so that it is on disk even if the run is killed right after. See load_records.
+	"""
+	pickle.dump(record, f, protocol=2)
+	f.flush()
+
+def refit_inputs_digest(model_lst, topology_fn, initial_values, true_vals, time_scale, method):
+	""" Hashes the inputs of fit_whole_model that determine its refits: the framework, the topologies and starting parameters of every model, the initial and true values, the time scale and the refit method. It is stored as the header of the checkpoint file of fit_whole_model, so that the checkpoint cannot be resumed with other inputs.
+	"""
+	topologies = [tuple(tm.topology.key for tm in wm.targets) for wm in model_lst]
+	params = [np.asarray(tm.params, dtype=float) for wm in model_lst for tm in wm.targets]
+	return digest(framework_name(topology_fn), 
+				  topologies, 
+				  np.concatenate(params) if len(params) > 0 else np.zeros(0), 
+				  np.asarray(initial_values, dtype=float), 
+				  np.asarray(true_vals, dtype=float), 
+				  [float(x) for x in time_scale], 
+				  method)
+
+def load_refit_checkpoint(fname, truncate=False, inputs=None):
+	""" Reads the refit models streamed to a checkpoint file by fit_whole_model. 
+
+		Args:
+		fname - The checkpoint file name 
+
+		truncate - If True, a partly written last record is removed. See load_records.
+
+		inputs - If set, the digest of the inputs of the refit (see refit_inputs_digest). A ValueError is raised if the checkpoint was written for other inputs.
+
+		Returns:
+		A dictionary mapping the index of each refit model in the input list to its refit WholeModel.
+	"""
+	records = load_records(fname, truncate=truncate)
+	header = records.pop(0)[1] if len(records) > 0 and records[0][0] == 'inputs' else None
+	if inputs is not None and (header is not None or len(records) > 0) and header != inputs:
+		raise ValueError('The checkpoint {} holds the refits of different models, data, time scale or method. Remove it to start over'.format(fname))
+	return dict(records)
+
+# The state shared between the processes of a fit_whole_model pool. Set by refit_init.
+_refit_shared = {}
+
+def refit_init(topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes, watchdog, method):
+	""" Initializer for the processes of a fit_whole_model pool. Stores everything that is common to all refits.
+	"""
+	_refit_shared.update(topology_fn=topology_fn,
+						 initial_values=initial_values,
+						 true_vals=true_vals,
+						 time_scale=time_scale,
+						 node_ptypes=node_ptypes,
+						 edge_ptypes=edge_ptypes,
+						 watchdog=watchdog,
+						 method=method)
+
+# Refit engines that can be selected by name in fit_whole_model
+REFIT_METHODS = {'slsqp': refit_whole_model,
+				 'lsq': refit_whole_model_lsq}
+
+def refit_whole_model_par(task):
+	""" Does the same as the refit engine chosen in fit_whole_model inside a fit_whole_model worker.
+		Returns the index of the model, the refit model and the time taken in a tuple
+	"""
+	i, wm = task 
+	sh = _refit_shared
+	t_start = time.time()
+	refit = REFIT_METHODS[sh['method']]
+	new_wm = refit(wm, sh['topology_fn'], sh['initial_values'], sh['true_vals'], sh['time_scale'], sh['node_ptypes'], sh['edge_ptypes'], watchdog=sh['watchdog'])
+	return i, new_wm, time.time() - t_start
+
+def fit_whole_model(model_lst, topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes, watchdog=None, processes=None, checkpoint=None, progress=print_refit_progress, method='slsqp'):
+	""" Fits the parameters of every model in the input list to produce outputs similar to true_vals. This method compares the actual values of all species against the true values of all species, making it different from gradient matching where the only derivatives are compared. Warning: this method can take a long time on even small lists (expect on the order of ~10 seconds per item). 
+
+		Args:
+		model_lst - A list of WholeModel objects
+
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
+
+		initial_values - The starting values of the system 
+
+		true_vals - The values to fit to 
+
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+
+		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+
+		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
 
+		watchdog - An optional SimulationWatchdog limiting each simulation. Models whose refit simulation is cut off are given an infinite distance.
 
-def gradient_match_topologies(models, target, species_vals, species_derivs, time_scale,  edge_ptypes, node_ptypes, num_best_models=10, num_restarts=5, weak_sig_thresh=1e-5):
-	""" Outputs the model topologies for a target species that produce data closest to its "true" values. 
+		processes - If set, models are refit in parallel across this many processes. 
 
-		Performs gradient matching on each model to find parameters that produce gradient values that are closest to to those in species_derivs.
+		checkpoint - An optional file name. Every refit model is appended to this file as soon as it is done. If the file already exists, the models it contains are loaded and not refit again, so an interrupted run can be resumed by calling fit_whole_model again with the same arguments. The file starts with a digest of the inputs (see refit_inputs_digest), and a ValueError is raised if it was written for other inputs.
 
-		Args: 
-		models - An iterator containing model topologies in the form (dX, topology). See the generate_target_topologies function for more details 
+		progress - A function called after each model is refit as progress(done, total, index, seconds), where done is the number of models refit so far (including any loaded from the checkpoint), index is the position of the model in model_lst and seconds is the time its refit took. Set to None to report nothing.
 
-		target - The target species the models are for (eg. species 0)
+		method - The refit engine. 'slsqp' minimizes the distance with SLSQP using finite-difference gradients (see refit_whole_model). 'lsq' solves the refit as a bounded least-squares problem with a Jacobian from forward sensitivities, which needs far fewer integrations for models with many parameters (see refit_whole_model_lsq).
 
-		species_derivs - The "true" values of all species derivatives for all time steps. Should be a numpy array such that species_derivs[t, s] is the derivative of species s at time t. 
+		Returns:
+		A list of WholeModels containing every model in model_lst, but refit to match the values in true_vals. In the same order as model_lst.
+	"""
+	if method not in REFIT_METHODS:
+		raise ValueError('Unknown refit method {}. Choose one of {}'.format(method, sorted(REFIT_METHODS.keys())))
+
+	num = len(model_lst)
+	results = [None for i in range(num)]
+
+	# Load models finished by a previous run with the same inputs
+	ckpt_file = None
+	if checkpoint is not None:
+		inputs = refit_inputs_digest(model_lst, topology_fn, initial_values, true_vals, time_scale, method)
+		for i, wm in load_refit_checkpoint(checkpoint, truncate=True, inputs=inputs).items():
+			results[i] = wm 
+		ckpt_file = open(checkpoint, 'ab')
+		if ckpt_file.tell() == 0:
+			append_record(ckpt_file, ('inputs', inputs))
+	todo = [(i, model_lst[i]) for i in range(num) if results[i] is None]
+	done = num - len(todo)
+
+	init_args = (topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes, watchdog, method)
+	pool = None
+	try:
+		if processes is None:
+			refit_init(*init_args)
+			refits = map(refit_whole_model_par, todo)
+		else:
+			pool = mp.Pool(processes=processes, initializer=refit_init, initargs=init_args)
+			refits = pool.imap_unordered(refit_whole_model_par, todo)
+
+		for i, new_wm, seconds in refits:
+			results[i] = new_wm 
+			done += 1
+			if ckpt_file is not None:
+				append_record(ckpt_file, (i, new_wm))
+			if progress is not None:
+				progress(done, num, i, seconds)
+	finally:
+		if pool is not None:
+			pool.terminate()
+		if ckpt_file is not None:
+			ckpt_file.close()
 
-		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+	return results
 
-		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+class SimulationAborted(Exception):
+	""" Raised by a SimulationWatchdog when a simulation runs over its budget or diverges. 
 
-		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+		reason is a short code for why the simulation was aborted: 'timeout', 'max_evals', 'diverged' or 'failed' (the integrator gave up).
+	"""
+	def __init__(self, reason, message):
+		Exception.__init__(self, message)
+		self.reason = reason 
 
-		num_best_models - The number of best_performing models to retain. 
+class SimulationWatchdog(object):
+	""" Limits the resources any single simulation of a whole model can use, so that stiff or diverging models are cut off instead of stalling a run.
 
-		num_restarts - The number of times we restart the optimization function to avoid local optima
+		Args:
+		max_seconds - The wall-clock budget of a simulation in seconds, or None for no limit 
 
-		weak_sig_thresh - The threshold below which any parameter is considered to be spurious
+		max_evals - The maximum number of evaluations of the derivative function per simulation, or None for no limit 
 
-		Returns:
-		A list of length length num_best_models containing TargetModel objects that closest match the "true" values.
+		max_state - The largest absolute value any species may reach before the model is considered to have diverged, or None for no limit
 	"""
-	best = []
-	target_derivs = species_derivs[:, target]
+	def __init__(self, max_seconds=None, max_evals=None, max_state=1e8):
+		self.max_seconds = max_seconds
+		self.max_evals = max_evals
+		self.max_state = max_state 
+
+	def guard(self, ode):
+		""" Wraps a derivative function so that it raises SimulationAborted once the budget of the simulation is used up. Each call to guard starts a new budget.
+		"""
+		t_start = time.time()
+		num_evals = [0]
+		def fn(x, t):
+			num_evals[0] += 1
+			if self.max_evals is not None and num_evals[0] > self.max_evals:
+				raise SimulationAborted('max_evals', 'Simulation exceeded {} evaluations'.format(self.max_evals))
+			if self.max_seconds is not None and time.time() - t_start > self.max_seconds:
+				raise SimulationAborted('timeout', 'Simulation exceeded {} seconds'.format(self.max_seconds))
+			if self.max_state is not None and not np.all(np.abs(x) <= self.max_state):
+				raise SimulationAborted('diverged', 'Simulation diverged at t={}'.format(t))
+			return ode(x, t)
+		return fn 
+
+	def integrate(self, ode, initial_values, ts, Dfun=None, **kwargs):
+		""" Integrates an (already guarded) derivative function across ts, raising SimulationAborted if the integrator fails or the result diverges. Dfun and any other keyword arguments are passed on to odeint.
+		"""
+		sim_vals, info = odeint(ode, initial_values, ts, Dfun=Dfun, full_output=True, **kwargs)
+		if info['message'] != 'Integration successful.':
+			raise SimulationAborted('failed', info['message'])
+		if self.max_state is not None and not np.all(np.abs(sim_vals) <= self.max_state):
+			raise SimulationAborted('diverged', 'Simulation diverged')
+		return sim_vals 
+
+	def simulate(self, ode, initial_values, ts, Dfun=None):
+		""" Integrates a derivative function across ts within the budget of one simulation. Dfun is passed on to odeint.
+
+			Returns:
+			The simulated values, as returned by odeint. Raises SimulationAborted if the simulation had to be cut off.
+		"""
+		return self.integrate(self.guard(ode), initial_values, ts, Dfun=Dfun)
+
+def model_dist(model, topology_fn, initial_values, true_vals, time_scale, watchdog=None):
+	""" Checks the distance of the input model from the true_vals.
 
-	# Iterate through all models in the list
-	for (dX, top) in models:
-		# Calculate objective function 
-		obj = objective_fn(dX, species_vals, target_derivs, top, time_scale)
+		Args: 
+		model - An array of TargetModel objects
 
-		min_AIC = 1e12
-		best_params = []
-		best_dist = 1e12
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
 
-		bounds_list = top.to_bounds_lst(edge_ptypes, node_ptypes)
-		num_params = len(bounds_list)
+		initial_values - The starting values of the system
 
-		# Random restarts 
-		for rr in range(num_restarts):
+		true_vals - The values to compare against 
 
-			# Randomly initiate starting values 
-			param_list = top.to_param_lst(edge_ptypes, node_ptypes)
-			param_list = list(map(lambda x:x.value, param_list)) 
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
 
-			# Perform gradient matching to find optimal parameters
-			res = minimize(obj, param_list, method='SLSQP', tol=1e-6, bounds=bounds_list)
-			opt_params = res.x
+		watchdog - An optional SimulationWatchdog limiting the simulation. If the simulation is cut off, SimulationAborted is raised.
 
-			# Calculate the distance of best guess
-			dist = obj(opt_params)
+		Returns:
+		The euclidean distance between the input model and the true vals.
+	"""
+	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	topologies = [tup.topology for tup in model]
+	params = [tup.params for tup in model]
+	ode, dfun = whole_model_to_ode_jac(topology_fn, topologies, params)
+	if watchdog is None:
+		sim_vals = odeint(ode, initial_values, ts, Dfun=dfun)
+	else:
+		sim_vals = watchdog.simulate(ode, initial_values, ts, Dfun=dfun)
+	dist = np.linalg.norm(sim_vals-true_vals)
+	return dist 
 
-			# Calculate num time steps
-			ts = species_derivs.shape[0]
+def model_dist_bounded(model, topology_fn, initial_values, true_vals, time_scale, cutoff, num_segments=4, watchdog=None):
+	""" Checks the distance of the input model from the true_vals, giving up as soon as it is known to be larger than the cutoff. 
 
-			# Calculate Biased AIC for this model
-			AIC_bias = 2 * (num_params + 1) * (ts / (ts - num_params))
-			AIC  = ts * np.log(dist / ts) + AIC_bias
+		The model is integrated in segments of the time scale. The distance accumulated over the segments integrated so far is a lower bound on the full distance, so once it exceeds the cutoff the model is marked as pruned and the rest of the integration is skipped.
 
-			if AIC < min_AIC:
-				min_AIC = AIC
-				best_params = opt_params
-				best_dist = dist 
+		Args: 
+		model - An array of TargetModel objects
 
-		# Create TargetModel using best parameters and AIC 
-		model_details = TargetModel(topology=top,
-									params=best_params,
-									dist=best_dist,
-									AIC=min_AIC)
+		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
 
-		# Check if any parameter is below the weak signal threshold
-		weakest_param = min(best_params, key=lambda x:abs(x))
-		if abs(weakest_param) < weak_sig_thresh:
-			continue
-		
-		if len(best) < num_best_models:
-			best.append(model_details)
-		else:
-			# Find the index and AIC of the worst model we have stored
-			biggest_ind, biggest_item = max(enumerate(best), key=lambda x:x[1].AIC)
-			biggest_AIC = biggest_item.AIC
+		initial_values - The starting values of the system
 
-			# If the AIC of this model is less than the AIC of the worst model, replace the worst with this
-			if AIC < biggest_AIC:
-				best[biggest_ind] = model_details
+		true_vals - The values to compare against 
 
-	# Sort the list of best models
-	best = sorted(best, key=lambda x: x.AIC)
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
 
-	return best
+		cutoff - The distance above which the model is pruned. Either a number, or a callable returning the current cutoff (so that it can tighten while the model is being integrated).
 
-def permute_whole_models(best_models):
-	""" Consider a list of length n where each position in the list can take one of a set of values for that position. This function finds all permutations of that list given the set of values that each position can take. 
+		num_segments - The number of segments to split the time scale into 
 
-		Args:
-		best_models - A list of lists such that best_models[i] is the list of values that position i can take.
+		watchdog - An optional SimulationWatchdog limiting the simulation (across all segments). If the simulation is cut off, SimulationAborted is raised.
 
 		Returns:
-		A generator of all the permutations of the list. 
-
-		Examples:
-		>>> a = [ [c + str(i) for i in range(2)] for c in ['AB'] ]
-		>>> all = permute_whole_models(a)
-		>>> for i in all:
-		...    print(i)
-		('A0', 'B0')
-		('A0', 'B1')
-		('A1', 'B0')
-		('A1', 'B1')
+		A tuple (dist, pruned, steps_skipped, elapsed). If the model was pruned, dist is the partial distance at the time it was pruned and steps_skipped is the number of time steps that were not integrated. Otherwise dist is the euclidean distance between the model and the true vals and steps_skipped is 0. elapsed is the time spent integrating in seconds.
 	"""
-	num_species = len(best_models)
+	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	topologies = [tup.topology for tup in model]
+	params = [tup.params for tup in model]
+	ode, dfun = whole_model_to_ode_jac(topology_fn, topologies, params)
+	if watchdog is not None:
+		ode = watchdog.guard(ode)
 
-	def permute_helper(n, opts, lst, pos):
-		if pos == n:
-			yield lst 
+	get_cutoff = cutoff if callable(cutoff) else (lambda: cutoff)
+	bounds = [seg[-1] for seg in np.array_split(np.arange(1, len(ts)), num_segments) if len(seg) > 0]
+
+	sq_dist = np.sum((np.asarray(initial_values, dtype=float) - true_vals[0])**2)
+	state = initial_values
+	at = 0
+	t_start = time.time()
+	for b in bounds:
+		if watchdog is None:
+			sim_vals = odeint(ode, state, ts[at:b+1], Dfun=dfun)
 		else:
-			for i in opts[pos]:
-				lst[pos] = i 
-				for p in permute_helper(n, opts, lst, pos+1):
-					yield p 
+			sim_vals = watchdog.integrate(ode, state, ts[at:b+1], Dfun=dfun)
+		sq_dist += np.sum((sim_vals[1:] - true_vals[at+1:b+1])**2)
+		state = sim_vals[-1]
+		at = b
+		dist = math.sqrt(sq_dist)
+		if dist > get_cutoff() and at < len(ts) - 1:
+			return dist, True, len(ts) - 1 - at, time.time() - t_start
+	return math.sqrt(sq_dist), False, 0, time.time() - t_start
 
+def model_dist_par(tup):
+	""" Does the same as the model_dist fuction but exists to facilitate parallelization.
+		Returns the model and the dist in a tuple
+	"""
+	model, topology_fn, initial_values, true_vals, time_scale = tup 
+	return model, model_dist(model, topology_fn, initial_values, true_vals, time_scale)
 
-	lst = [-1 for i in range(num_species)]
-	permutations = permute_helper(num_species, best_models, lst, 0)
+def model_dist_checked(model, topology_fn, initial_values, true_vals, time_scale, cutoff, num_segments, watchdog):
+	""" Runs model_dist_bounded, recording aborted simulations instead of raising. 
 
-	for perm in permutations:
-		yield tuple(perm)
+		Returns:
+		A tuple (dist, pruned, steps_skipped, elapsed, reason). reason is None, unless the simulation was aborted by the watchdog, in which case it is the reason code of the SimulationAborted and dist is infinite.
+	"""
+	t_start = time.time()
+	try:
+		res = model_dist_bounded(model, topology_fn, initial_values, true_vals, time_scale, cutoff, num_segments=num_segments, watchdog=watchdog)
+	except SimulationAborted as e:
+		return float('inf'), False, 0, time.time() - t_start, e.reason 
+	return res + (None,)
 
-def whole_model_to_ode(topology_fn, topologies, params):
-	""" Converts from a list of topologies to a function that computes the derivative of the whole model.
+def batched_whole_model_ode(topology_fn, table, descs):
+	""" Stacks a batch of whole models into one system of ODEs, so that they can be integrated together by a single call to the integrator.
+
+		The state of the stacked system is the concatenation of the states of the models in the batch. Models in a batch usually share most of their TargetModels, so the derivatives are computed per distinct TargetModel, for all the models using it at once, with the vectorized form of topology_fn (see derivative_series) treating the models of the batch as if they were time steps.
 
 		Args:
 		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
 
-		topologies - A list of Topology objects representing the parental structure of each species 
+		table - A table of distinct TargetModels for each species, as created by model_table
 
-		params - A list such that params[i] is the list of parameters for topology i 
+		descs - The descriptors (see model_table) of the models in the batch
 
 		Returns:
-		A function that calculates the derivatives of every species in the model given their values and the time t.
+		A function that calculates the derivatives of every species of every model in the batch given the stacked state and the time t.
 	"""
-	num_species = len(topologies)
+	batch_size = len(descs)
+	num_species = len(table)
+	groups = []
+	for s in range(num_species):
+		rows = {}
+		for b in range(batch_size):
+			rows.setdefault(descs[b][s], []).append(b)
+		for (d, r) in rows.items():
+			groups.append((s, np.array(r), table[s][d].topology, table[s][d].params))
+
 	def fn(x, t):
-		derivs = [0 for i in range(num_species)]
-		for i in range(num_species):
-			top = topologies[i]
-			pars = params[i]
-			derivs[i] = topology_fn(x, t, top, pars)
-		return derivs 
+		xs = np.reshape(x, (batch_size, num_species))
+		derivs = np.empty((batch_size, num_species))
+		for (s, rows, top, pars) in groups:
+			sub = xs if len(rows) == batch_size else xs[rows]
+			derivs[rows, s] = derivative_series(topology_fn, sub, np.full(len(rows), t), top, pars)
+		return derivs.ravel()
 	return fn 
 
-def fit_whole_model(model_lst, topology_fn, initial_values, true_vals, time_scale, node_ptypes, edge_ptypes):
-	""" Fits the parameters of every model in the input list to produce outputs similar to true_vals. This method compares the actual values of all species against the true values of all species, making it different from gradient matching where the only derivatives are compared. Warning: this method can take a long time on even small lists (expect on the order of ~10 seconds per item). 
+def rk4_integrate(ode, initial_values, ts, substeps=10):
+	""" Integrates a derivative function across ts with the classical fixed-step Runge-Kutta method, taking substeps equal steps between consecutive time points. 
 
-		Args:
-		model_lst - A list of WholeModel objects
+		There is no error control, so substeps must be large enough for the dynamics being integrated. A simulation that diverges shows up as non-finite values in the result.
+
+		Returns:
+		The simulated values, in the same form as returned by odeint.
+	"""
+	y = np.array(initial_values, dtype=float)
+	out = np.empty((len(ts), len(y)))
+	out[0] = y
+	for i in range(1, len(ts)):
+		h = (ts[i] - ts[i-1]) / substeps 
+		t = ts[i-1]
+		for k in range(substeps):
+			k1 = ode(y, t)
+			k2 = ode(y + h/2 * k1, t + h/2)
+			k3 = ode(y + h/2 * k2, t + h/2)
+			k4 = ode(y + h * k3, t + h)
+			y = y + h/6 * (k1 + 2*k2 + 2*k3 + k4)
+			t += h 
+		out[i] = y
+	return out 
+
+def model_dist_batch(models, topology_fn, initial_values, true_vals, time_scale, cutoff, num_segments=4, watchdog=None, fixed_step=None, table=None, descs=None):
+	""" Does the same as model_dist_checked for a batch of models at once, integrating them as one stacked system (see batched_whole_model_ode).
+
+		The models are integrated in segments as in model_dist_bounded, and models whose partial distance exceeds the cutoff are dropped from the batch before the next segment. 
+
+		odeint controls the error of the stacked system with a norm taken across all of it, so its tolerances are tightened by the square root of the batch size to keep the error of each model within the tolerances it would have had on its own. If the stacked integration fails (or is cut off by the watchdog), the remaining models are checked one by one with model_dist_checked, so that a single stiff or diverging model does not cost the rest of the batch their results.
+
+		Args: 
+		models - A list of models, represented by arrays of TargetModels for each species.
 
 		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
 
-		initial_values - The starting values of the system 
+		initial_values - The starting values of the system
 
-		true_vals - The values to fit to 
+		true_vals - The values to compare against 
 
 		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
 
-		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+		cutoff - The distance above which models are pruned. Either a number or a callable returning the current cutoff.
 
-		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+		num_segments - The number of segments to split the time scale into 
+
+		watchdog - An optional SimulationWatchdog limiting the simulation. Its budget applies to the whole batch, and to each model separately if the batch falls back to checking them one by one.
+
+		fixed_step - If set, the batch is integrated by rk4_integrate with fixed_step steps between consecutive time points instead of by odeint.
+
+		table, descs - Optionally, the output of model_table for models, if it is already known 
 
 		Returns:
-		A list of WholeModels containing every model in model_lst, but refit to match the values in true_vals. Sorted in order of increasing distance from the true_vals.
+		A list containing the result of model_dist_checked, (dist, pruned, steps_skipped, elapsed, reason), for each model. The elapsed time of the batch is split evenly between its models.
 	"""
-	results = []
-	cnt = 0
+	if table is None:
+		table, descs = model_table(models)
+	num_models = len(models)
+	num_species = len(table)
 	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	get_cutoff = cutoff if callable(cutoff) else (lambda: cutoff)
+	bounds = [seg[-1] for seg in np.array_split(np.arange(1, len(ts)), num_segments) if len(seg) > 0]
+
+	initial_values = np.asarray(initial_values, dtype=float)
+	results = [None for i in range(num_models)]
+	active = list(range(num_models))
+	sq_dist = np.full(num_models, np.sum((initial_values - true_vals[0])**2))
+	state = np.tile(initial_values, (num_models, 1))
+	at = 0
 	t_start = time.time()
-	print('Reporting times every batch of 10:')
-	t_ind_start = time.time()
-	for wm in model_lst:
-		if cnt > 0 and cnt % 10 == 0:
-			t_end = time.time()
-			print("batch={}, took {} seconds".format(cnt//10, t_end-t_start))
-			sys.stdout.flush()
-			t_start = time.time()
-		cnt += 1
-		topologies = [tup.topology for tup in wm.targets]
-		initial_guess = [tup.params for tup in wm.targets]
-		param_lens = [len(ig) for ig in initial_guess]
-		bounds = [tup.topology.to_bounds_lst(node_ptypes, edge_ptypes) for tup in wm.targets]
-		bounds = sum(bounds, [])
-		bounds = [tuple(b) for b in bounds]
-
-		def whole_model_obj(params):
-			len_sums = [sum(param_lens[:i]) for i in range(1, len(param_lens))]
-			formatted = []
-			at = 0
-			for pl in param_lens:
-				formatted += [params[at:at+pl]]
-				at += pl 
-			ode = whole_model_to_ode(topology_fn, topologies, formatted)
-			sim_vals = odeint(ode, initial_values, ts)
-			dist = np.linalg.norm(sim_vals-true_vals)
-			return dist 
-
-		initial_guess = sum(initial_guess, [])
-		res = minimize(whole_model_obj, initial_guess, method="SLSQP", bounds=bounds)
-		opt_params = res.x 
-		opt_dist = whole_model_obj(opt_params)
-		opt_formatted = []
-		opt_at = 0
-		for pl in param_lens:
-			opt_formatted += [opt_params[opt_at:opt_at+pl]]
-			opt_at += pl 
-		new_targets = [TargetModel(topology=wm.targets[i].topology, 
-								   params=opt_formatted[i],
-								   dist=None,
-								   AIC=None) for i in range(len(wm.targets))]
-		new_wm = WholeModel(new_targets, opt_dist, node_ptypes, edge_ptypes)
-		results.append(new_wm);
+	try:
+		for b in bounds:
+			ode = batched_whole_model_ode(topology_fn, table, [descs[i] for i in active])
+			if watchdog is not None:
+				ode = watchdog.guard(ode)
+			y0 = state[active].ravel()
+			seg_ts = ts[at:b+1]
+			if fixed_step is not None:
+				sim_vals = rk4_integrate(ode, y0, seg_ts, substeps=fixed_step)
+				if not np.all(np.isfinite(sim_vals)):
+					raise SimulationAborted('diverged', 'Simulation diverged')
+			else:
+				tol = 1.49012e-8 / math.sqrt(len(active))
+				# The stacked system is block diagonal, so its Jacobian is banded
+				kwargs = dict(rtol=tol, atol=tol, ml=num_species-1, mu=num_species-1)
+				if watchdog is None:
+					sim_vals, info = odeint(ode, y0, seg_ts, full_output=True, **kwargs)
+					if info['message'] != 'Integration successful.':
+						raise SimulationAborted('failed', info['message'])
+				else:
+					sim_vals = watchdog.integrate(ode, y0, seg_ts, **kwargs)
+			sim_vals = sim_vals.reshape(len(seg_ts), len(active), num_species)
+			sq_dist[active] += np.sum((sim_vals[1:] - true_vals[at+1:b+1, np.newaxis, :])**2, axis=(0, 2))
+			state[active] = sim_vals[-1]
+			at = b 
+			if at < len(ts) - 1:
+				c = get_cutoff()
+				for i in active:
+					if math.sqrt(sq_dist[i]) > c:
+						results[i] = (math.sqrt(sq_dist[i]), True, len(ts) - 1 - at)
+				active = [i for i in active if results[i] is None]
+				if len(active) == 0:
+					break 
+	except SimulationAborted:
+		for i in active:
+			results[i] = model_dist_checked(models[i], topology_fn, initial_values, true_vals, time_scale, cutoff, num_segments, watchdog)
+		active = []
+	for i in active:
+		results[i] = (math.sqrt(sq_dist[i]), False, 0)
+	elapsed = (time.time() - t_start) / num_models 
+	return [res if len(res) == 5 else res + (elapsed, None) for res in results]
+
+def share_array(arr):
+	""" Copies a numpy array into a block of shared memory.
 
-		print('	Finished {} in {} seconds'.format(cnt, time.time()-t_ind_start))
-		sys.stdout.flush()
-		t_ind_start = time.time()
+		Returns:
+		A tuple (shm, desc) where shm is the SharedMemory block (which the caller must close and unlink when done) and desc is a small picklable descriptor from which worker processes can view the array without copying it. See attach_array.
+	"""
+	arr = np.ascontiguousarray(arr)
+	shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+	view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)
+	view[...] = arr
+	return shm, (shm.name, arr.shape, arr.dtype.str)
 
+def attach_array(desc):
+	""" Attaches to an array shared by share_array.
 
-	return results
+		Returns:
+		A tuple (shm, arr) where arr is a read-only numpy view of the shared array. shm must be kept alive for as long as arr is used.
+	"""
+	name, shape, dtype = desc
+	shm = shared_memory.SharedMemory(name=name)
+	arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+	arr.flags.writeable = False
+	return shm, arr
 
-def model_dist(model, topology_fn, initial_values, true_vals, time_scale):
-	""" Checks the distance of the input model from the true_vals.
+def model_table(models):
+	""" Splits a list of whole models into a table of the distinct TargetModels for each species and a compact descriptor for each model.
 
-		Args: 
-		model - An array of TargetModel objects
+		Args:
+		models - A list of models, represented by arrays of TargetModels for each species.
 
-		topology_fn -  A function that converts from a topology and specie values to a function, dX, that outputs the value of a species' derivatives
+		Returns:
+		A tuple (table, descs) such that table[s] is the list of distinct TargetModels used for species s and models[i][s] is table[s][descs[i][s]].
+	"""
+	num_species = len(models[0]) if len(models) > 0 else 0
+	table = [[] for s in range(num_species)]
+	lookup = [{} for s in range(num_species)]
+	descs = []
+	for m in models:
+		desc = []
+		for s in range(num_species):
+			key = id(m[s])
+			if key not in lookup[s]:
+				lookup[s][key] = len(table[s])
+				table[s].append(m[s])
+			desc.append(lookup[s][key])
+		descs.append(tuple(desc))
+	return table, descs
+
+def adaptive_chunksize(num_tasks, processes, max_chunksize=256):
+	""" Picks a chunk size for dispatching num_tasks tasks to a pool: about four chunks per process, so that work stays balanced, but no more than max_chunksize tasks per chunk.
+	"""
+	chunksize, extra = divmod(num_tasks, processes * 4)
+	if extra:
+		chunksize += 1
+	return max(1, min(chunksize, max_chunksize))
 
-		initial_values - The starting values of the system
+# The state shared between the processes of a whole_model_check_par pool. Set by whole_model_check_init.
+_check_shared = {}
 
-		true_vals - The values to compare against 
+def whole_model_check_init(cutoff, true_vals_desc, table, topology_fn, initial_values, time_scale, num_segments, watchdog, fixed_step=None):
+	""" Initializer for the processes of a whole_model_check_par pool. Attaches to the shared true values and stores everything that is common to all models, so that tasks only need to carry a model descriptor (see model_table).
+	"""
+	shm, true_vals = attach_array(true_vals_desc)
+	_check_shared.update(cutoff=cutoff,
+						 shm=shm,
+						 true_vals=true_vals,
+						 table=table,
+						 topology_fn=topology_fn,
+						 initial_values=initial_values,
+						 time_scale=time_scale,
+						 num_segments=num_segments,
+						 watchdog=watchdog,
+						 fixed_step=fixed_step)
+
+def model_dist_checked_par(task):
+	""" Does the same as the model_dist_checked function inside a whole_model_check_par worker, using the state and cutoff shared between processes.
 
-		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+		Args:
+		task - A tuple (index, desc) where desc is the descriptor of the model (see model_table)
 
 		Returns:
-		The euclidean distance between the input model and the true vals.
+		The index of the model followed by the outputs of model_dist_checked in a tuple
 	"""
-	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
-	topologies = [tup.topology for tup in model]
-	params = [tup.params for tup in model]
-	ode = whole_model_to_ode(topology_fn, topologies, params)
-	sim_vals = odeint(ode, initial_values, ts)
-	dist = np.linalg.norm(sim_vals-true_vals)
-	return dist 
+	i, desc = task 
+	sh = _check_shared
+	model = [sh['table'][s][desc[s]] for s in range(len(desc))]
+	cutoff = sh['cutoff']
+	res = model_dist_checked(model, sh['topology_fn'], sh['initial_values'], sh['true_vals'], sh['time_scale'], lambda: cutoff.value, sh['num_segments'], sh['watchdog'])
+	return (i,) + res
 
-def model_dist_par(tup):
-	""" Does the same as the model_dist fuction but exists to facilitate parallelization.
-		Returns the model and the dist in a tuple
+def model_dist_batch_par(task):
+	""" Does the same as the model_dist_batch function inside a whole_model_check_par worker, using the state and cutoff shared between processes.
+
+		Args:
+		task - A tuple (indices, descs) of the indices and descriptors (see model_table) of the models in the batch
+
+		Returns:
+		A list containing, for each model in the batch, its index followed by its result from model_dist_batch in a tuple
 	"""
-	model, topology_fn, initial_values, true_vals, time_scale = tup 
-	return model, model_dist(model, topology_fn, initial_values, true_vals, time_scale)
+	indices, descs = task 
+	sh = _check_shared
+	table = sh['table']
+	models = [[table[s][d[s]] for s in range(len(d))] for d in descs]
+	cutoff = sh['cutoff']
+	res = model_dist_batch(models, sh['topology_fn'], sh['initial_values'], sh['true_vals'], sh['time_scale'], lambda: cutoff.value, sh['num_segments'], sh['watchdog'], sh['fixed_step'], table=table, descs=descs)
+	return [(indices[j],) + res[j] for j in range(len(indices))]
+
+def batch_tasks(indices, descs, batch_size):
+	""" Splits the models with the given indices into tasks of (indices, descs) holding batch_size models each, where descs are the descriptors of the models (see model_table).
+	"""
+	return [(indices[at:at+batch_size], [descs[i] for i in indices[at:at+batch_size]]) for at in range(0, len(indices), batch_size)]
+
+class CheckTracker(object):
+	""" Keeps track of the results of a whole model check: the prune_top best distances seen so far (when pruning), how many models were pruned and which simulations were aborted. 
+
+		The integration time saved by pruning is estimated from the number of time steps skipped and the average time per step of the models that were integrated fully.
+	"""
+	def __init__(self, prune_top=None):
+		self.prune_top = prune_top
+		self.top_dists = []	# Max-heap (by negation) of the best distances
+		self.num_pruned = 0
+		self.steps_skipped = 0
+		self.full_steps = 0
+		self.full_time = 0.0
+		self.failures = []	# (model index, reason) for every aborted simulation
+
+	def cutoff(self):
+		if self.prune_top is None or len(self.top_dists) < self.prune_top:
+			return float('inf')
+		return -self.top_dists[0]
+
+	def time_saved(self):
+		if self.full_steps == 0:
+			return 0.0
+		return self.steps_skipped * self.full_time / self.full_steps
+
+	def add(self, index, dist, pruned, steps_skipped, elapsed, reason, num_steps):
+		""" Records the result of a model (see model_dist_checked) and returns the distance to report for it (inf if the model was pruned or aborted).
+		"""
+		if reason is not None:
+			self.failures.append((index, reason))
+			return float('inf')
+		if pruned:
+			self.num_pruned += 1
+			self.steps_skipped += steps_skipped
+			return float('inf')
+		self.full_steps += num_steps
+		self.full_time += elapsed
+		if self.prune_top is not None:
+			if len(self.top_dists) < self.prune_top:
+				heapq.heappush(self.top_dists, -dist)
+			elif dist < -self.top_dists[0]:
+				heapq.heapreplace(self.top_dists, -dist)
+		return dist 
+
+	def report(self, stats=None):
+		time_saved = self.time_saved()
+		aborted = {}
+		for (i, reason) in self.failures:
+			aborted[reason] = aborted.get(reason, 0) + 1
+		if self.prune_top is not None:
+			print('Pruned {} models, saving an estimated {:.1f} seconds of integration'.format(self.num_pruned, time_saved))
+		if len(self.failures) > 0:
+			print('Aborted {} simulations: {}'.format(len(self.failures), ', '.join('{} {}'.format(aborted[r], r) for r in sorted(aborted))))
+		if stats is not None:
+			stats['pruned'] = self.num_pruned
+			stats['time_saved'] = time_saved
+			stats['aborted'] = aborted
+			stats['failures'] = self.failures
+
+def check_inputs_digest(models, topology_fn, initial_values, true_vals, time_scale, prune_top):
+	""" Hashes the inputs of a whole model check that determine its results: the framework, the topologies and parameters of every model (in order, since results are recorded by index), the initial and true values, the time scale and prune_top. It is stored as the header of the checkpoint file of the check (see resume_check), so that the checkpoint cannot be resumed with other models or data.
+	"""
+	topologies = [tuple(tm.topology.key for tm in m) for m in models]
+	params = [np.asarray(tm.params, dtype=float) for m in models for tm in m]
+	return digest(framework_name(topology_fn), 
+				  topologies, 
+				  np.concatenate(params) if len(params) > 0 else np.zeros(0), 
+				  np.asarray(initial_values, dtype=float), 
+				  np.asarray(true_vals, dtype=float), 
+				  [float(x) for x in time_scale], 
+				  prune_top)
 
-def whole_model_check(models, topology_fn, initial_values, true_vals, time_scale):
+def resume_check(checkpoint, models, tracker, topology_fn, initial_values, true_vals, time_scale, prune_top):
+	""" Loads the results of a whole model check streamed to a checkpoint file (see whole_model_check) and replays them into the tracker, so that pruning carries on from the same cutoff. 
+
+		The checkpoint starts with the digest of the inputs of the check (see check_inputs_digest). A ValueError is raised if it was written for other inputs.
+
+		Returns:
+		A tuple (results, ckpt_file). results[i] is (models[i], dist) for every model that was already checked and None for the rest. ckpt_file is the checkpoint file opened for appending new results, or None if checkpoint is None.
+	"""
+	results = [None for i in range(len(models))]
+	if checkpoint is None:
+		return results, None
+	inputs = check_inputs_digest(models, topology_fn, initial_values, true_vals, time_scale, prune_top)
+	records = load_records(checkpoint, truncate=True)
+	header = records.pop(0)[1] if len(records) > 0 and records[0][0] == 'inputs' else None
+	if (header is not None or len(records) > 0) and header != inputs:
+		raise ValueError('The checkpoint {} holds the distances of different models, data, time scale or prune_top. Remove it to start over'.format(checkpoint))
+	for rec in records:
+		i = rec[0]
+		if i < len(models) and results[i] is None:
+			results[i] = (models[i], tracker.add(i, *rec[1:], num_steps=time_scale[2]-1))
+	ckpt_file = open(checkpoint, 'ab')
+	if ckpt_file.tell() == 0:
+		append_record(ckpt_file, ('inputs', inputs))
+	return results, ckpt_file
+
+def whole_model_check(models, topology_fn, initial_values, true_vals, time_scale, prune_top=None, num_segments=4, watchdog=None, stats=None, batch_size=None, fixed_step=None, checkpoint=None):
 	""" Checks the distance of all the input models from the true_vals.
 
 		Args: 
@@ -433,20 +2072,77 @@ def whole_model_check(models, topology_fn, initial_values, true_vals, time_scale
 
 		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
 
+		prune_top - If set, only the distances of the best prune_top models are guaranteed to be exact. Any model whose partial distance exceeds the prune_top-th best distance found so far is pruned (see model_dist_bounded) and given an infinite distance. 
+
+		num_segments - The number of segments to integrate each model in when pruning 
+
+		watchdog - An optional SimulationWatchdog limiting each simulation. Models whose simulation is cut off are given an infinite distance.
+
+		stats - An optional dictionary. It is filled with the number of models pruned ('pruned'), the estimated integration time saved by pruning in seconds ('time_saved'), the number of aborted simulations per reason code ('aborted') and a list of (model index, reason code) for every aborted simulation ('failures').
+
+		batch_size - If set, models are integrated batch_size at a time as one stacked system (see model_dist_batch), which amortizes the overhead of each simulation across the batch.
+
+		fixed_step - If set (with batch_size), batches are integrated with a fixed-step method instead of odeint. See model_dist_batch.
+
+		checkpoint - An optional file name. The result of every model is appended to this file as soon as it is known. If the file already exists, the models it contains are not checked again, so an interrupted check can be resumed by calling whole_model_check again with the same models. A ValueError is raised if it was written for other models or data (see resume_check).
+
 		Returns:
 		A sorted list of the models in ascending order of distace from the true_vals 
 	"""
-	results = []
+	if batch_size is not None:
+		return whole_model_check_batched(models, topology_fn, initial_values, true_vals, time_scale, batch_size, prune_top, num_segments, watchdog, stats, fixed_step, checkpoint)
 	num = len(models)
-	i=0
-	for m in models:
-		dist = model_dist(m, topology_fn, initial_values, true_vals, time_scale)
-		results.append((m, dist))
-		i += 1
-		print('Done {:.1%}\r'.format(i / num), end='')
+	tracker = CheckTracker(prune_top)
+	if prune_top is None:
+		num_segments = 1
+	results, ckpt_file = resume_check(checkpoint, models, tracker, topology_fn, initial_values, true_vals, time_scale, prune_top)
+	done = num - results.count(None)
+	try:
+		for i in range(num):
+			if results[i] is not None:
+				continue
+			res = model_dist_checked(models[i], topology_fn, initial_values, true_vals, time_scale, tracker.cutoff, num_segments, watchdog)
+			results[i] = (models[i], tracker.add(i, *res, num_steps=time_scale[2]-1))
+			if ckpt_file is not None:
+				append_record(ckpt_file, (i,) + res)
+			done += 1
+			print('Done {:.1%}\r'.format(done / num), end='')
+	finally:
+		if ckpt_file is not None:
+			ckpt_file.close()
+	tracker.report(stats)
+	return sorted(results, key=lambda x: x[1])
+
+def whole_model_check_batched(models, topology_fn, initial_values, true_vals, time_scale, batch_size, prune_top=None, num_segments=4, watchdog=None, stats=None, fixed_step=None, checkpoint=None):
+	""" Does the same as whole_model_check, integrating the models batch_size at a time with model_dist_batch. See whole_model_check for the arguments.
+	"""
+	num = len(models)
+	tracker = CheckTracker(prune_top)
+	if prune_top is None:
+		num_segments = 1
+	true_vals = np.asarray(true_vals, dtype=float)
+	table, descs = model_table(models)
+	results, ckpt_file = resume_check(checkpoint, models, tracker, topology_fn, initial_values, true_vals, time_scale, prune_top)
+	todo = [i for i in range(num) if results[i] is None]
+	done = num - len(todo)
+	try:
+		for (indices, batch_descs) in batch_tasks(todo, descs, batch_size):
+			batch = [models[i] for i in indices]
+			res = model_dist_batch(batch, topology_fn, initial_values, true_vals, time_scale, tracker.cutoff, num_segments, watchdog, fixed_step, table=table, descs=batch_descs)
+			for j in range(len(indices)):
+				i = indices[j]
+				results[i] = (models[i], tracker.add(i, *res[j], num_steps=time_scale[2]-1))
+				if ckpt_file is not None:
+					append_record(ckpt_file, (i,) + res[j])
+			done += len(indices)
+			print('Done {:.1%}\r'.format(done / num), end='')
+	finally:
+		if ckpt_file is not None:
+			ckpt_file.close()
+	tracker.report(stats)
 	return sorted(results, key=lambda x: x[1])
 
-def whole_model_check_par(models, topology_fn, initial_values, true_vals, time_scale, processes=4):
+def whole_model_check_par(models, topology_fn, initial_values, true_vals, time_scale, processes=4, prune_top=None, num_segments=4, watchdog=None, stats=None, batch_size=None, fixed_step=None, checkpoint=None):
 	""" Checks the distance of all the input models from the true_vals. Parallelized
 
 		Args: 
@@ -460,23 +2156,144 @@ def whole_model_check_par(models, topology_fn, initial_values, true_vals, time_s
 
 		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
 
-		processes - The number of processes to parallelize across 
+		processes - The number of processes to parallelize across. The true values are placed in shared memory and the models common data is sent to each process once, so each task only carries a compact descriptor of its model. Tasks are dispatched in chunks sized by adaptive_chunksize.
+
+		prune_top - If set, models are pruned as in whole_model_check. The cutoff is shared between all processes and tightened as results come in.
+
+		num_segments - The number of segments to integrate each model in when pruning 
+
+		watchdog - An optional SimulationWatchdog limiting each simulation, as in whole_model_check.
+
+		stats - An optional dictionary, filled as in whole_model_check.
+
+		batch_size - If set, each task is a batch of batch_size models, integrated as one stacked system as in whole_model_check.
+
+		fixed_step - If set (with batch_size), batches are integrated with a fixed-step method, as in whole_model_check.
+
+		checkpoint - An optional file name to stream results to and resume from, as in whole_model_check.
 
 		Returns:
 		A sorted list of the models in ascending order of distace from the true_vals 
 	"""	
-	pool = mp.Pool(processes=processes)
-	args = map(lambda m: (m, topology_fn, initial_values, true_vals, time_scale), models)
 	num = len(models)
-	results = []
-	for i, m in enumerate(pool.imap(model_dist_par, args) , 1):
-		results.append(m)
-		print('Done {:.1%}\r'.format(i/num), end='')
+	tracker = CheckTracker(prune_top)
+	if prune_top is None:
+		num_segments = 1
+	results, ckpt_file = resume_check(checkpoint, models, tracker, topology_fn, initial_values, true_vals, time_scale, prune_top)
+	todo = [i for i in range(num) if results[i] is None]
+	done = num - len(todo)
+	cutoff = mp.Value('d', tracker.cutoff(), lock=False)
+	table, descs = model_table(models)
+	shm, true_vals_desc = share_array(np.asarray(true_vals, dtype=float))
+	init_args = (cutoff, true_vals_desc, table, topology_fn, initial_values, time_scale, num_segments, watchdog, fixed_step)
+	try:
+		with mp.Pool(processes=processes, initializer=whole_model_check_init, initargs=init_args) as pool:
+			if batch_size is None:
+				tasks = [(i, descs[i]) for i in todo]
+				worker = model_dist_checked_par
+			else:
+				tasks = batch_tasks(todo, descs, batch_size)
+				worker = model_dist_batch_par
+			chunksize = adaptive_chunksize(len(tasks), processes)
+			for out in pool.imap_unordered(worker, tasks, chunksize=chunksize):
+				for res in (out if batch_size is not None else [out]):
+					i = res[0]
+					results[i] = (models[i], tracker.add(i, *res[1:], num_steps=time_scale[2]-1))
+					if ckpt_file is not None:
+						append_record(ckpt_file, res)
+					done += 1
+				cutoff.value = tracker.cutoff()
+				print('Done {:.1%}\r'.format(done/num), end='')
+	finally:
+		shm.close()
+		shm.unlink()
+		if ckpt_file is not None:
+			ckpt_file.close()
+	tracker.report(stats)
 	return sorted(results, key=lambda x: x[1])
 
 
 
-def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, nodes=[], max_parents=-1, num_interactions=-1, max_order=-1, enf_edges=[], enf_gaps=[], processes=None, retained_top=5, restarts=1):
+def framework_defaults(topology_fn, num_interactions, max_order):
+	""" Applies the fixed settings of the built in frameworks.
+
+		Returns:
+		A tuple (num_interactions, max_order), which for built in frameworks are the numbers of interactions and the maximum order they support, and otherwise the values given.
+	"""
+	fn_module = getattr(topology_fn, '__module__', None)
+	if fn_module == 'tsa.models.gene_regulation' :
+		num_interactions = 2
+		max_order = 1 
+	elif fn_module == 'tsa.models.population_dynamics':
+		num_interactions = 1
+		max_order = 1
+	elif fn_module == 'tsa.models.linear_model':
+		num_interactions = 1
+		max_order = 1
+	elif fn_module == 'tsa.models.mass_action':
+		num_interactions = 1
+	return num_interactions, max_order
+
+# The arguments of generate_models that determine its results. A run directory can only be resumed with the same values. See open_run_dir.
+RUN_ARGS = ['time_scale', 'initial_vals', 'nodes', 'max_parents', 'num_interactions', 'max_order', 'enf_edges', 'enf_gaps', 'retained_top', 'restarts', 'seed', 'solver', 'max_whole_models', 'whole_model_order', 'prune_top', 'warm_start', 'screen_margin', 'screen_stride', 'screen_tol', 'prescreen_top', 'prescreen_method', 'search', 'beam_width']
+
+def open_run_dir(run_dir, run_args):
+	""" Prepares a run directory for generate_models. A new directory is created and the arguments of the run are stored in it (as run.pkl). An existing directory must hold a run started with the same arguments, otherwise a ValueError is raised.
+
+		Args:
+		run_dir - The run directory 
+
+		run_args - A dictionary of the arguments of the run (see RUN_ARGS) and the name of its framework
+
+		Returns:
+		The ModelBag of the run if it has already finished, and None otherwise.
+	"""
+	# Compare arguments in plain python form, so that eg. numpy initial values can be compared
+	run_args = dict((k, np.asarray(v).tolist() if isinstance(v, np.ndarray) else v) for (k, v) in run_args.items())
+	args_file = os.path.join(run_dir, 'run.pkl')
+	if not os.path.exists(args_file):
+		os.makedirs(run_dir, exist_ok=True)
+		with open(args_file, 'wb') as f:
+			pickle.dump(run_args, f, protocol=2)
+		return None
+
+	stored = load_run_args(run_dir)
+	changed = sorted(k for k in set(stored) | set(run_args) if stored.get(k) != run_args.get(k))
+	if len(changed) > 0:
+		raise ValueError('The run in {} was started with different values of: {}'.format(run_dir, ', '.join(changed)))
+
+	models_file = os.path.join(run_dir, 'models.pkl')
+	if os.path.exists(models_file):
+		return load(models_file)
+	return None
+
+def load_run_args(run_dir):
+	""" Loads the arguments a run of generate_models was started with from its run directory. See open_run_dir.
+	"""
+	with open(os.path.join(run_dir, 'run.pkl'), 'rb') as f:
+		return pickle.load(f)
+
+def resume_models(run_dir, topology_fn, parameter_fn, accepted_model_fn, **kwargs):
+	""" Resumes a run of generate_models from its run directory, using the arguments the run was started with. 
+
+		Args:
+		run_dir - The run directory passed to generate_models
+
+		topology_fn, parameter_fn, accepted_model_fn - The functions the run was started with (functions are not stored in the run directory)
+
+		kwargs - Any other arguments of generate_models that do not affect the results, such as processes, watchdog, batch_size or jit
+
+		Returns:
+		The ModelBag returned by generate_models.
+	"""
+	run_args = load_run_args(run_dir)
+	if run_args['framework'] != framework_name(topology_fn):
+		raise ValueError('The run in {} was started with the framework {}'.format(run_dir, run_args['framework']))
+	args = dict((name, run_args[name]) for name in RUN_ARGS)
+	args.update(kwargs)
+	return generate_models(topology_fn, parameter_fn, accepted_model_fn, run_dir=run_dir, **args)
+
+def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, nodes=[], max_parents=-1, num_interactions=-1, max_order=-1, enf_edges=[], enf_gaps=[], processes=None, retained_top=5, restarts=1, seed=None, solver=None, max_whole_models=None, whole_model_order='AIC', prune_top=None, watchdog=None, batch_size=None, jit=False, run_dir=None, fit_cache=None, warm_start=False, screen_margin=None, screen_stride=4, screen_tol=1e-3, prescreen_top=None, prescreen_method='partial', search='exhaustive', beam_width=5):
 	""" Generate a set of models that show similar behaviour to the accepted model. 
 
 		Each model is a permuation of the original system with attached parameter values that are based on gradient matching. 
@@ -516,25 +2333,163 @@ def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, in
 			per topology (to escape local minima). Note that increasing this 
 			parameter greatly increases runtime. 
 
+		seed - If set, the random starting values of the gradient-matching 
+			optimizations are drawn from generators seeded by this value, 
+			making the results reproducible (also between the serial and 
+			parallel gradient-matching paths).
+
+		solver - The solver used for gradient matching. None (or 'slsqp') 
+			uses SLSQP with random restarts. 'slsqp-sobol' and 'slsqp-lhs' 
+			start the restarts from a low-discrepancy design (Sobol or Latin 
+			hypercube points) and stop them once 3 restarts agree on the 
+			best fit, so that restarts becomes an upper limit that only 
+			hard topologies reach. For frameworks that are linear 
+			in their parameters (linear_model and mass_action), 'lstsq' fits 
+			every topology exactly with one bounded least-squares solve, 
+			making the restarts parameter irrelevant. See make_solver.
+
+		max_whole_models - The maximum number of whole models to simulate. 
+			Whole models are enumerated lazily in ascending order of the 
+			summed score of their gradient-matched topologies, so only the 
+			most promising max_whole_models of the retained_top ** num_nodes 
+			combinations are created and simulated. If None, all 
+			combinations are simulated.
+
+		whole_model_order - The score used to order whole models when 
+			enumerating them. Either 'AIC' or 'dist'. See 
+			best_first_whole_models.
+
+		prune_top - If set, whole models are simulated in segments and 
+			abandoned as soon as their partial distance exceeds the 
+			distance of the prune_top-th best model found so far. Pruned 
+			models are left out of the returned ModelBag, which then 
+			contains (at least) the best prune_top models.
+
+		watchdog - An optional SimulationWatchdog limiting the wall-clock 
+			time, number of derivative evaluations and state magnitude of 
+			every whole model simulation. Models whose simulation is cut 
+			off are left out of the returned ModelBag.
+
+		batch_size - If set, whole models are simulated batch_size at a 
+			time as one stacked ODE system, amortizing the overhead of 
+			each simulation. Useful when there are many small whole 
+			models. See model_dist_batch.
+
+		jit - If True, the derivatives of built in frameworks (and any 
+			framework with a FrameworkSpec) are calculated by kernels 
+			compiled with numba, if it is installed. Otherwise the pure 
+			python functions are used. Compiling takes a few seconds, 
+			so this pays off on larger runs. See JitFramework.
+
+		run_dir - An optional directory to checkpoint the run to. The 
+			best topologies of each target are saved as soon as the 
+			target is gradient matched, the distance of each whole model 
+			as soon as it is checked, and the final ModelBag at the end. 
+			If the directory already holds a run, it is resumed: targets 
+			and whole models that are done are skipped (and a finished 
+			run is simply loaded). The arguments that determine the 
+			results (see RUN_ARGS) must be the same as when the run was 
+			started. See also resume_models.
+
+		fit_cache - An optional FitCache, or the file name of one, holding 
+			the gradient-matching fits of earlier runs. Topologies already 
+			fit to the same data with the same settings are taken from it 
+			instead of being fit again, so that sweeps over eg. retained_top 
+			or the enforced edges and gaps only fit new topologies. Requires 
+			a seed, since fits without one cannot be reproduced.
+
+		warm_start - If True, every topology is first fit starting from 
+			the fit of the best topology with one parent less (extended 
+			with default values for the new edge), and only restarts - 1 
+			random restarts are added to that. Good starting values make 
+			each fit converge in fewer iterations, and make a single 
+			restart enough in most cases. See warm_starts.
+
+		screen_margin - If set, every topology is first screened with a 
+			cheap fit (on every screen_stride-th time step, with one 
+			restart and the loose tolerance screen_tol), and only the 
+			topologies whose 
+			screened AIC is within screen_margin of the retained_top-th 
+			best screened AIC of their target are fit in full. The number 
+			of topologies promoted for each target is reported, to check 
+			that the margin is wide enough. See screen_topologies.
+
+		screen_stride - The stride of the time steps used for screening. 
+			A ValueError is raised if it leaves too few time steps to 
+			screen topologies with max_parents parents.
+
+		screen_tol - The tolerance of the screening fits (the full fits 
+			use that of the solver, 1e-6 for SLSQP)
+
+		prescreen_top - If set, the candidate parents (species, or 
+			complexes of species) of each target are ranked by cheap 
+			statistics of their values against the target's derivatives, 
+			and only the prescreen_top best ranked (plus the target itself 
+			and the enforced edges) are considered as its parents. This 
+			shrinks the number of topologies combinatorially, which makes 
+			larger networks tractable, at the risk of missing parents with 
+			weak statistics. The size of the pruned space is reported. 
+			See prescreen_parents.
+
+		prescreen_method - The statistic that parents are ranked by: 
+			'corr', 'partial' or 'sparse'. See parent_scores.
+
+		search - How the topologies of each target are searched. 
+			'exhaustive' fits every topology. 'stepwise' starts without 
+			parents and repeatedly adds or removes the parent (with the 
+			interaction) that improves the AIC most, until none does. 
+			'beam' grows the beam_width best topologies with each number 
+			of parents by one parent at a time, up to max_parents. Both 
+			fit a small fraction of the topologies of large spaces, at 
+			the risk of missing the best ones. The number of topologies 
+			fit is reported against that of an exhaustive search. 
+			Screening (screen_margin) only applies to exhaustive search. 
+			See TopologySearch.
+
+		beam_width - The width of the beam search
+
 		Returns:
 		A ModelBag object containing the top models that closest match the accepted model.
 	"""
-	# Check for built in functions:
-	fn_module = topology_fn.__module__
-	if fn_module == 'tsa.models.gene_regulation' :
-		num_interactions = 2
-		max_order = 1 
-	elif fn_module == 'tsa.models.population_dynamics':
-		num_interactions = 1
-		max_order = 1
-	elif fn_module == 'tsa.models.linear_model':
-		num_interactions = 1
-		max_order = 1
-	elif fn_module == 'tsa.models.mass_action':
-		num_interactions = 1
-
+	num_interactions, max_order = framework_defaults(topology_fn, num_interactions, max_order)
 	num_nodes = len(nodes)
 
+	# Set up the run directory, or pick up the run already in it
+	if run_dir is not None:
+		run_args = dict(framework=framework_name(topology_fn))
+		for name in RUN_ARGS:
+			run_args[name] = locals()[name]
+		finished = open_run_dir(run_dir, run_args)
+		if finished is not None:
+			print('Loaded the finished run from {}'.format(run_dir))
+			return finished
+		done_targets = dict(load_records(os.path.join(run_dir, 'targets.ckpt'), truncate=True))
+		if len(done_targets) > 0:
+			print('Resuming the run in {}: {} of {} targets already gradient matched'.format(run_dir, len(done_targets), num_nodes))
+		targets_file = open(os.path.join(run_dir, 'targets.ckpt'), 'ab')
+		def target_done(t, best):
+			append_record(targets_file, (t, best))
+		check_ckpt = os.path.join(run_dir, 'check.ckpt')
+	else:
+		done_targets = {}
+		target_done = None
+		check_ckpt = None
+
+	fit_cache = open_fit_cache(fit_cache, topology_fn)
+	if fit_cache is not None and seed is None:
+		print("A fit cache is given, but no seed is set. Proceeding without the fit cache")
+		fit_cache = None
+
+	if jit:
+		if not JIT_AVAILABLE:
+			print("JIT is requested, but numba is not installed. Proceeding without JIT")
+		elif framework_spec(topology_fn) is None:
+			print("JIT is requested, but the model framework has no FrameworkSpec. Proceeding without JIT")
+		else:
+			print("Compiling model framework ... ", end='')
+			topology_fn = jit_framework(topology_fn)
+			print("Done")
+
 	# Create Model Space
 	print("Creating Model Space ... ", end='')
 	model_space = ModelSpace(num_nodes=num_nodes, 
@@ -559,6 +2514,14 @@ def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, in
 	species_vals, species_derivs = sim_data(accepted_model_fn, time_scale, initial_vals)
 	print('Done')
 
+	# Screening fits need more time steps than the parameters of the largest topologies (see screenable)
+	if screen_margin is not None and search == 'exhaustive':
+		num_screen_steps = len(species_vals[::screen_stride])
+		max_params = len(node_ptypes) + max(max_parents, 0) * len(edge_ptypes)
+		if num_screen_steps <= max_params + 1 and hasattr(make_solver(solver, species_vals, species_derivs[:, 0], time_scale, edge_ptypes, node_ptypes, num_restarts=restarts), 'screening_solver'):
+			raise ValueError('A screen_stride of {} leaves {} time steps, too few to screen topologies with {} parameters ({} parents). Use a screen_stride of at most {}'.format(
+				screen_stride, num_screen_steps, max_params, max_parents, max(1, (len(species_vals) - 1) // (max_params + 1))))
+
 	# Specify the list of possible target species
 	targets = [i for i in range(model_space.num_nodes)]
 
@@ -570,58 +2533,168 @@ def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, in
 	for (p, t) in enf_gaps:
 		enf_gaps_target[t].append(p)
 
+	# Restrict the parents of each target to the most promising ones
+	target_parents = [None for i in range(num_nodes)]
+	if prescreen_top is not None:
+		print('Pre-screening parents by {} ... '.format(prescreen_method))
+		for t in targets:
+			interactomes = candidate_interactomes(model_space, enf_edges_target[t], enf_gaps_target[t])
+			target_parents[t] = prescreen_parents(species_vals, species_derivs[:, t], t, interactomes, prescreen_top, method=prescreen_method)
+			num_enf = len(enf_edges_target[t])
+			print('Target {}: kept {} of {} candidate parents, {} of {} topologies'.format(t, len(target_parents[t]), len(interactomes),
+				count_target_topologies(model_space, len(target_parents[t]), num_enf), count_target_topologies(model_space, len(interactomes), num_enf)))
+
+	# Decide whether to multiprocess
+	use_mp = platform.system() != 'Windows'
+	if use_mp:
+		if processes is None:
+			num_procs = 8
+		else:
+			num_procs = processes
+	elif processes is not None:
+		print("Process count is set, but cannot run multiprocessing on Windows machines. Proceeding without parallelization")
+
 	best_target_models = []
 
-	print("Starting gradient matching ... ", end='')
-	for t in targets:
-		# Generate all possible permutations of topologies involving the target
-		topologies = generate_target_topologies(model_space=model_space, 
+	# Generate all possible permutations of topologies involving each target (that is not already done)
+	target_topologies = [(t, generate_target_topologies(model_space=model_space, 
 								 target=t,
 								 enf_edges=enf_edges_target[t],
-								 enf_gaps=enf_gaps_target[t])
-
-		# Perform gradient matching on each candidate model and obtain the closest matches to our 'true' data
-		best = gradient_match_topologies(models=topologies,
-								target=t,
+								 enf_gaps=enf_gaps_target[t],
+								 parents=target_parents[t])) for t in targets if t not in done_targets]
+
+	gm_stats = {}
+	if len(target_topologies) == 0:
+		print("All targets are already gradient matched")
+	elif search != 'exhaustive':
+		searches = [TopologySearch(model_space, t, search, retained_top, beam_width=beam_width, enf_edges=enf_edges_target[t], enf_gaps=enf_gaps_target[t], parents=target_parents[t]) for (t, _) in target_topologies]
+
+		# Every fit is returned, so that the searches can move through topologies with spurious parameters. 
+		# One pool, and the fits of every target for warm starts, are kept across the rounds of the searches.
+		search_args = dict(species_vals=species_vals,
+						   species_derivs=species_derivs,
+						   time_scale=time_scale,
+						   edge_ptypes=edge_ptypes,
+						   node_ptypes=node_ptypes,
+						   num_best_models=sys.maxsize,
+						   num_restarts=restarts,
+						   weak_sig_thresh=0,
+						   seed=seed,
+						   solver=solver,
+						   cache=fit_cache,
+						   warm_start=warm_start)
+		search_optima = dict((t, {}) for (t, _) in target_topologies)
+		search_pool = gradient_match_pool(processes=num_procs, **search_args) if use_mp else None
+		def fit_batches(batches):
+			if use_mp:
+				return gradient_match_par(target_models=[(t, [(topology_fn, top) for top in tops]) for (t, tops) in batches],
+								processes=num_procs,
+								stats=gm_stats,
+								pool=search_pool,
+								optima=search_optima,
+								**search_args)
+			return [gradient_match_topologies(models=[(topology_fn, top) for top in tops],
+									target=t,
+									stats=gm_stats,
+									optima=search_optima[t],
+									**search_args) for (t, tops) in batches]
+
+		print("Starting {} search of topologies ... ".format(search))
+		gm_start = time.time()
+		try:
+			best_target_models = search_target_models(searches, fit_batches, target_done=target_done)
+		finally:
+			if search_pool is not None:
+				search_pool.terminate()
+		print('\nTime taken = {} seconds'.format(time.time() - gm_start))
+		for s in searches:
+			print('Target {}: fit {} of {} topologies'.format(s.target, s.num_fit, s.num_exhaustive()))
+	elif use_mp:
+		print("Starting gradient matching using {} processes ... ".format(num_procs))
+		gm_start = time.time()
+		best_target_models = gradient_match_par(target_models=target_topologies,
 								species_vals=species_vals,
 								species_derivs=species_derivs,
 								time_scale=time_scale,
 								edge_ptypes= edge_ptypes,
 								node_ptypes= node_ptypes,
 								num_best_models=retained_top,
-								num_restarts=restarts)
-
-		best_target_models.append(best)
-	print('Done')
+								num_restarts=restarts,
+								seed=seed,
+								solver=solver,
+								processes=num_procs,
+								target_done=target_done,
+								cache=fit_cache,
+								warm_start=warm_start,
+								stats=gm_stats,
+								screen_margin=screen_margin,
+								screen_stride=screen_stride,
+								screen_tol=screen_tol)
+		print('\nTime taken = {} seconds'.format(time.time() - gm_start))
+	else:
+		print("Starting gradient matching ... ", end='')
+		for (t, topologies) in target_topologies:
+			# Perform gradient matching on each candidate model and obtain the closest matches to our 'true' data
+			best = gradient_match_topologies(models=topologies,
+									target=t,
+									species_vals=species_vals,
+									species_derivs=species_derivs,
+									time_scale=time_scale,
+									edge_ptypes= edge_ptypes,
+									node_ptypes= node_ptypes,
+									num_best_models=retained_top,
+									num_restarts=restarts,
+									seed=seed,
+									solver=solver,
+									cache=fit_cache,
+									warm_start=warm_start,
+									stats=gm_stats,
+									screen_margin=screen_margin,
+									screen_stride=screen_stride,
+									screen_tol=screen_tol)
+
+			best_target_models.append(best)
+			if target_done is not None:
+				target_done(t, best)
+		print('Done')
+	for (t, (num_promoted, num_screened)) in sorted(gm_stats.get('promoted', {}).items()):
+		print('Screening promoted {} of {} topologies of target {}'.format(num_promoted, num_screened, t))
+	report_restarts(gm_stats.get('restarts', {}))
+	if fit_cache is not None:
+		fit_cache.evict()
+		fit_cache.report()
+
+	# Put the targets loaded from the run directory back in place
+	if run_dir is not None:
+		targets_file.close()
+		computed = dict(zip([t for (t, _) in target_topologies], best_target_models))
+		computed.update(done_targets)
+		best_target_models = [computed[t] for t in targets]
 
 	print("Creating Whole Models ... ", end='')
-	# Generate list of best ensemble models, taking all permutations of the best topologies for each target that we found. 
-	system_models = permute_whole_models(best_target_models)
-	system_models = list(system_models)
-	print('Done')
+	# Generate list of best ensemble models, taking permutations of the best topologies for each target that we found in order of their combined score. 
+	system_models = best_first_whole_models(best_target_models, key=whole_model_order)
+	system_models = list(itertools.islice(system_models, max_whole_models))
+	print('Done. Created {} whole models'.format(len(system_models)))
 
 
 	# Resimulate each ensemble model and reorder based on distace from our accepted model
 	best_whole_models = []
-	if platform.system() != 'Windows':
-		if processes is None:
-			num_procs = 8
-		else:
-			num_procs = processes
+	if use_mp:
 		print("Running simple integrity check on generated whole models.\nMultiprocessing enabled, using {} processes".format(num_procs))
 		mp_start = time.time()
-		mp_best_models = whole_model_check_par(system_models, topology_fn, initial_vals, species_vals, time_scale, processes=num_procs)
+		mp_best_models = whole_model_check_par(system_models, topology_fn, initial_vals, species_vals, time_scale, processes=num_procs, prune_top=prune_top, watchdog=watchdog, batch_size=batch_size, checkpoint=check_ckpt)
 		print('Time taken = {} seconds'.format(time.time() - mp_start))
 		best_whole_models = mp_best_models
 	else:
-		if processes is not None:
-			print("Process count is set, but cannot run multiprocessing on Windows machines. Proceeding without parallelization")
 		print("Running simple integrity check on generated whole models")
 		est_start = time.time()
-		est_best_models = whole_model_check(system_models, topology_fn, initial_vals, species_vals, time_scale)
+		est_best_models = whole_model_check(system_models, topology_fn, initial_vals, species_vals, time_scale, prune_top=prune_top, watchdog=watchdog, batch_size=batch_size, checkpoint=check_ckpt)
 		print('Time taken = {} seconds'.format(time.time() - est_start))
 		best_whole_models = est_best_models
 	
+	# Leave out models that were pruned or whose simulation was aborted
+	best_whole_models = [(m, dist) for (m, dist) in best_whole_models if dist != float('inf')]
 
 	# Convert to WholeModel format for future analysis
 	best_whole_models = ModelBag(best_whole_models, 
@@ -634,6 +2707,9 @@ def generate_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, in
 								 enf_gaps,
 								 nodes)
 
+	if run_dir is not None:
+		store(best_whole_models, os.path.join(run_dir, 'models.pkl'))
+
 	return best_whole_models
 	
 
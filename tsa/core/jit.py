@@ -0,0 +1,203 @@
+import collections
+import numpy as np
+from .compiler import *
+from .solvers import *
+
+try:
+	import numba
+except ImportError:
+	numba = None
+
+# Whether the JIT backend can be used (numba is installed)
+JIT_AVAILABLE = numba is not None
+
+
+def term_source(spec):
+	""" Writes the expressions of a FrameworkSpec as two python functions taking the parameters as a flat array:
+			node_term(X, params, at, edges) - The derivative of a target with value X, whose node parameters start at params[at], given the sum of its edge terms
+			edge_term(X, P, params, at, inter) - The term of an edge with interaction inter from a parent with value P, whose parameters start at params[at]
+
+		Returns:
+		The source code of the two functions as a string.
+	"""
+	def node_names(name):
+		if name == 'X':
+			return 'X'
+		if name == 'EDGES':
+			return 'edges'
+		if name.startswith('n'):
+			return 'params[at + {}]'.format(int(name[1:]))
+		raise ValueError('{} cannot be used in a node expression'.format(name))
+
+	def edge_names(name):
+		if name in ('X', 'P'):
+			return name
+		if name.startswith('e'):
+			return 'params[at + {}]'.format(int(name[1:]))
+		raise ValueError('{} cannot be used in an edge expression'.format(name))
+
+	lines = ['def node_term(X, params, at, edges):',
+			 '\treturn ' + substitute_names(spec.node_expr, node_names),
+			 '',
+			 'def edge_term(X, P, params, at, inter):']
+	for i in range(len(spec.edge_exprs) - 1):
+		lines.append('\tif inter == {}:'.format(i))
+		lines.append('\t\treturn ' + substitute_names(spec.edge_exprs[i], edge_names))
+	lines.append('\treturn ' + substitute_names(spec.edge_exprs[-1], edge_names))
+	return '\n'.join(lines) + '\n'
+
+class JitKernels(object):
+	""" The numba-compiled functions of a framework, generated from its FrameworkSpec by jit_kernels. Topologies are passed to them in the array form created by encode_topologies.
+
+		series(xs, target, parents, inters, params) - The derivative of a target at every time step, as the vectorized form of a framework
+		rhs(x, targets, edge_ptr, parents, inters, param_ptr, params) - The derivatives of every species of a whole model
+	"""
+	def __init__(self, series, rhs):
+		self.series = series
+		self.rhs = rhs
+
+# Kernels for each spec. See jit_kernels.
+_jit_kernels = {}
+
+def jit_kernels(spec):
+	""" Compiles the kernels of a framework with numba, from its FrameworkSpec. Kernels are compiled once per spec (and process) and then cached.
+
+		Returns:
+		A JitKernels object.
+	"""
+	if not JIT_AVAILABLE:
+		raise ImportError('The JIT backend requires numba')
+	cached = _jit_kernels.get(id(spec))
+	if cached is not None:
+		return cached[1]
+
+	terms = compile_source(term_source(spec))
+	node_term = numba.njit(terms['node_term'])
+	edge_term = numba.njit(terms['edge_term'])
+	num_node_params = spec.num_node_params
+	num_edge_params = spec.num_edge_params
+
+	@numba.njit
+	def deriv(x, target, parents, inters, lo, hi, params, at):
+		X = x[target]
+		edges = 0.0
+		for e in range(lo, hi):
+			P = 1.0
+			for k in range(parents.shape[1]):
+				if parents[e, k] < 0:
+					break
+				P *= x[parents[e, k]]
+			edges += edge_term(X, P, params, at + num_node_params + (e - lo) * num_edge_params, inters[e])
+		return node_term(X, params, at, edges)
+
+	@numba.njit
+	def series(xs, target, parents, inters, params):
+		out = np.empty(xs.shape[0])
+		for t in range(xs.shape[0]):
+			out[t] = deriv(xs[t], target, parents, inters, 0, parents.shape[0], params, 0)
+		return out
+
+	@numba.njit
+	def rhs(x, targets, edge_ptr, parents, inters, param_ptr, params):
+		out = np.empty(targets.shape[0])
+		for i in range(targets.shape[0]):
+			out[i] = deriv(x, targets[i], parents, inters, edge_ptr[i], edge_ptr[i+1], params, param_ptr[i])
+		return out
+
+	kernels = JitKernels(series, rhs)
+	_jit_kernels[id(spec)] = (spec, kernels)	# Keep spec alive so that its id is not reused
+	return kernels
+
+def encode_topologies(topologies):
+	""" Encodes a list of topologies as arrays that can be passed to the JIT kernels.
+
+		Returns:
+		A tuple (targets, edge_ptr, parents, inters). The edges of topology i are edges edge_ptr[i] to edge_ptr[i+1]. parents[e] lists the species of the parent of edge e, padded with -1 (so that complex parents have several entries), and inters[e] is its interaction.
+	"""
+	edges = [(top.parents[i], top.interactions[i]) for top in topologies for i in range(len(top.parents))]
+	width = max([len(p) if type(p) is tuple else 1 for (p, inter) in edges] + [1])
+	targets = np.array([top.target for top in topologies], dtype=np.int64)
+	edge_ptr = np.cumsum([0] + [len(top.parents) for top in topologies]).astype(np.int64)
+	parents = np.full((len(edges), width), -1, dtype=np.int64)
+	inters = np.zeros(len(edges), dtype=np.int64)
+	for e in range(len(edges)):
+		p, inter = edges[e]
+		p = p if type(p) is tuple else (p,)
+		parents[e, :len(p)] = p
+		inters[e] = inter
+	return targets, edge_ptr, parents, inters
+
+# Encoded single topologies, by topology key, least recently used first. The COMPILED_CACHE_SIZE most recently used are kept. See JitFramework.
+_encoded_topologies = collections.OrderedDict()
+
+class JitFramework(object):
+	""" Wraps a framework that has a FrameworkSpec (see compile_topology) so that its derivatives are calculated by numba-compiled kernels. It can be passed as the topology_fn anywhere in TSA.
+
+		Calling it and its vectorized form use the kernels, as do whole model simulations through its whole_model function (see whole_model_to_ode). The param_grad, state_grad and linear_features functions of the framework are kept as they are. Complex parameters (used for complex-step differentiation) fall back to the framework's own functions.
+
+		The kernels are compiled when the JitFramework is created, so that processes forked afterwards do not compile them again.
+
+		Args:
+		topology_fn - A framework with a FrameworkSpec as its `spec` attribute
+	"""
+	def __init__(self, topology_fn):
+		spec = framework_spec(topology_fn)
+		if spec is None:
+			raise ValueError('The JIT backend needs a framework with a FrameworkSpec')
+		self.topology_fn = topology_fn
+		for name in ('param_grad', 'state_grad', 'linear_features'):
+			if hasattr(topology_fn, name):
+				setattr(self, name, getattr(topology_fn, name))
+		self.warm_up()
+
+	def kernels(self):
+		return jit_kernels(self.topology_fn.spec)
+
+	def encode(self, topology):
+		key = topology_key(topology)
+		encoded = _encoded_topologies.get(key)
+		if encoded is not None:
+			_encoded_topologies.move_to_end(key)
+			return encoded
+		encoded = encode_topologies([topology])
+		_encoded_topologies[key] = encoded
+		if len(_encoded_topologies) > COMPILED_CACHE_SIZE:
+			_encoded_topologies.popitem(last=False)
+		return encoded
+
+	def warm_up(self):
+		""" Compiles the kernels by running them on a small model.
+		"""
+		targets, edge_ptr, parents, inters = encode_topologies([])
+		kernels = self.kernels()
+		kernels.series(np.zeros((1, 1)), 0, parents, inters, np.zeros(self.topology_fn.spec.num_node_params))
+		kernels.rhs(np.zeros(0), targets, edge_ptr, parents, inters, np.zeros(0, dtype=np.int64), np.zeros(0))
+
+	def __call__(self, x, t, topology, params):
+		return self.vectorized(np.asarray(x, dtype=float).reshape(1, -1), np.array([t]), topology, params)[0]
+
+	def vectorized(self, xs, ts, topology, params):
+		params = np.asarray(params)
+		if params.dtype.kind == 'c':
+			return derivative_series(self.topology_fn, xs, ts, topology, params)
+		targets, edge_ptr, parents, inters = self.encode(topology)
+		return self.kernels().series(np.ascontiguousarray(xs, dtype=float), targets[0], parents, inters, params.astype(float))
+
+	def whole_model(self, topologies, params):
+		""" Creates the derivative function of a whole model, for whole_model_to_ode.
+
+			Returns:
+			A function of the species values and the time t that returns the derivatives of every species as a numpy array.
+		"""
+		rhs = self.kernels().rhs
+		targets, edge_ptr, parents, inters = encode_topologies(topologies)
+		param_ptr = np.cumsum([0] + [len(p) for p in params[:-1]]).astype(np.int64)
+		flat = np.concatenate([np.asarray(p, dtype=float) for p in params]) if len(params) > 0 else np.zeros(0)
+		return lambda x, t: rhs(np.asarray(x, dtype=float), targets, edge_ptr, parents, inters, param_ptr, flat)
+
+def jit_framework(topology_fn):
+	""" Selects the JIT backend for a framework if it can be used: returns a JitFramework for topology_fn if numba is installed and topology_fn has a FrameworkSpec, and topology_fn itself otherwise.
+	"""
+	if not JIT_AVAILABLE or framework_spec(topology_fn) is None:
+		return topology_fn
+	return JitFramework(topology_fn)
@@ -1,7 +1,17 @@
 import random 
+import weakref
 import numpy as np
 
+def restore_slots(obj, state):
+	""" Sets the attributes of an object with __slots__ from its pickled state: either the (None, attributes) pair pickled for objects with slots, or the attribute dictionary of objects pickled before their class had slots.
+	"""
+	if isinstance(state, tuple):
+		state = state[1]
+	for (name, value) in state.items():
+		object.__setattr__(obj, name, value)
+
 class Parameter(object):
+	__slots__ = ('idx', 'param_type', 'value', 'bounds', 'is_edge_param', 'edge', 'node')
 	num_params = 0
 	def __init__(self, param_type, value, bounds, is_edge_param, edge=None, node=None):
 		self.idx = Parameter.num_params
@@ -24,8 +34,10 @@ class Parameter(object):
 	def update_val(self, new_val):
 		self.value = new_val
 
-	def random(self):
-		rnd = random.random()
+	def random(self, rng=None):
+		if rng is None:
+			rng = random
+		rnd = rng.random()
 		rng = self.bounds[1] - self.bounds[0]
 		lb = self.bounds[0]
 		return rnd * rng + lb 
@@ -65,6 +77,9 @@ class Parameter(object):
 			raise ValueError('More than one Parameter with type {} and node {}'.format(param_type, node))
 		return by_node
 
+	def __setstate__(self, state):
+		restore_slots(self, state)
+
 	def __str__(self):
 		return 'Parameter of type {} with value {}'.format(self.param_type, self.value)
 
@@ -72,10 +87,11 @@ class Parameter(object):
 		return self.__str__()
 
 class ParameterType(object):
-	def __init__(self, param_type, bounds, is_edge_param):
+	def __init__(self, param_type, bounds, is_edge_param, default=None):
 		self.param_type = param_type 
 		self.bounds = bounds 
 		self.is_edge_param = is_edge_param
+		self.default = default 	# Starting value for a new edge when warm-starting fits. See default_value.
 
 	def create(self, value, edge=None, node=None):
 		return Parameter(param_type=self.param_type, 
@@ -85,21 +101,33 @@ class ParameterType(object):
 						 edge=edge, 
 						 node=node)
 
-	def create_random(self, edge=None, node=None):
+	def create_random(self, edge=None, node=None, rng=None):
 		p = Parameter(param_type=self.param_type, 
 						 value=self.bounds[0], 
 						 bounds=self.bounds, 
 						 is_edge_param=self.is_edge_param, 
 						 edge=edge, 
 						 node=node)
-		p.value = p.random()
+		p.value = p.random(rng)
 		return p 
 
+	def default_value(self):
+		""" The value a parameter starts from when it is added to an already fit model (see warm_starts). This is the default given to the constructor if there is one, and otherwise 0 if it is within the bounds (so that a new edge starts out without effect in additive frameworks) or else the middle of the bounds.
+		"""
+		if self.default is not None:
+			return self.default
+		if self.bounds[0] <= 0 <= self.bounds[1]:
+			return 0.0
+		return (self.bounds[0] + self.bounds[1]) / 2
+
 	def to_dict(self):
-		return {'param_type': self.param_type, 'bounds': self.bounds, 'is_edge_param': self.is_edge_param}
+		d = {'param_type': self.param_type, 'bounds': self.bounds, 'is_edge_param': self.is_edge_param}
+		if self.default is not None:
+			d['default'] = self.default
+		return d
 
 	def from_dict(d):
-		return ParameterType(d['param_type'], d['bounds'], d['is_edge_param'])
+		return ParameterType(d['param_type'], d['bounds'], d['is_edge_param'], d.get('default'))
 
 
 class Species(object):
@@ -118,11 +146,54 @@ class Species(object):
 
 class Topology(object):
 	""" Container for all the parameters required to fully describe a certain topology.
+
+		Topologies are immutable and interned: creating a topology with the same target, parents and interactions as one that exists returns the existing object. So the topologies of the retained models of a run are shared rather than copied, and topologies can be compared and hashed (eg. as dictionary keys) by their structure. Parents and interactions are stored as tuples.
 	"""
-	def __init__(self, target, interactions, parents):
-		self.target = target 			 # The target species
-		self.interactions = interactions # The interactions that each parent has with the target. 
-		self.parents = parents 			 # The parents of the species
+	__slots__ = ('target', 'interactions', 'parents', 'key', '__weakref__')
+
+	# The existing topologies by key
+	interned = weakref.WeakValueDictionary()
+
+	def __new__(cls, *args, **kwargs):
+		if len(args) == 0 and len(kwargs) == 0:
+			# Unpickling a topology pickled before topologies were interned. See __setstate__.
+			return object.__new__(cls)
+		return cls.intern(*args, **kwargs)
+
+	@classmethod
+	def intern(cls, target, interactions, parents):
+		# Complex parents loaded from json are lists
+		parents = tuple(tuple(p) if type(p) is list else p for p in parents)
+		key = (target, parents, tuple(interactions))
+		top = cls.interned.get(key)
+		if top is None:
+			top = object.__new__(cls)
+			object.__setattr__(top, 'target', target) 				# The target species
+			object.__setattr__(top, 'interactions', key[2]) 		# The interactions that each parent has with the target. 
+			object.__setattr__(top, 'parents', parents) 			# The parents of the species
+			object.__setattr__(top, 'key', key)
+			cls.interned[key] = top
+		return top
+
+	def __setattr__(self, name, value):
+		raise AttributeError('Topology objects are immutable')
+
+	def __reduce__(self):
+		return (Topology, (self.target, self.interactions, self.parents))
+
+	def __setstate__(self, state):
+		restore_slots(self, state)
+		object.__setattr__(self, 'parents', tuple(self.parents))
+		object.__setattr__(self, 'interactions', tuple(self.interactions))
+		object.__setattr__(self, 'key', (self.target, self.parents, self.interactions))
+
+	def __eq__(self, other):
+		if not isinstance(other, Topology):
+			return NotImplemented
+		return self.key == other.key
+
+	def __hash__(self):
+		return hash(self.key)
 
 	def __str__(self):
 		return 'target = {},\nparents = {},\ninteractions = {}\n'.format(self.target, self.parents, self.interactions)
@@ -130,11 +201,11 @@ class Topology(object):
 	# def __repr__(self):
 	# 	return self.__str__()
 
-	def to_param_lst(self, edge_ptypes, node_ptypes):
-		param_lst = [n.create_random(node=self.target) for n in node_ptypes]
+	def to_param_lst(self, edge_ptypes, node_ptypes, rng=None):
+		param_lst = [n.create_random(node=self.target, rng=rng) for n in node_ptypes]
 		for p in self.parents:
 			edge = (p, self.target)
-			param_lst += [e.create_random(edge=edge) for e in edge_ptypes]
+			param_lst += [e.create_random(edge=edge, rng=rng) for e in edge_ptypes]
 		return param_lst
 
 	def to_bounds_lst(self, edge_ptypes, node_ptypes):
@@ -143,6 +214,35 @@ class Topology(object):
 			bounds_lst += [e.bounds for e in edge_ptypes]
 		return bounds_lst
 
+class BoundsTable(object):
+	""" The parameter bounds of topologies, which only depend on their number of parents. They are built once for each number of parents and then looked up.
+
+		Args:
+		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+
+		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+	"""
+	def __init__(self, node_ptypes, edge_ptypes):
+		self.node_ptypes = node_ptypes
+		self.edge_ptypes = edge_ptypes
+		self.table = {}
+
+	def get(self, top):
+		""" The bounds of the parameters of a topology.
+
+			Returns:
+			A tuple (bounds_list, lb, ub), where bounds_list is the list of (lower, upper) bounds of top.to_bounds_lst, and lb and ub are numpy arrays of the lower and upper bounds.
+		"""
+		num_parents = len(top.parents)
+		bounds = self.table.get(num_parents)
+		if bounds is None:
+			bounds_list = top.to_bounds_lst(self.edge_ptypes, self.node_ptypes)
+			lb = np.array([b[0] for b in bounds_list], dtype=float)
+			ub = np.array([b[1] for b in bounds_list], dtype=float)
+			bounds = (bounds_list, lb, ub)
+			self.table[num_parents] = bounds
+		return bounds
+
 class ModelSpace(object):
 	""" Container for the parameters describing the model space
 	"""
@@ -156,15 +256,35 @@ class ModelSpace(object):
 		
 
 class TargetModel(object):
-	def __init__(self, topology, params, dist, AIC):
+	""" A fitted topology of one target. The parameters are kept as a numpy array of floats, in the order of Topology.to_param_lst. Parameter objects are only created when asked for (see to_param_lst).
+	"""
+	__slots__ = ('topology', 'params', 'dist', 'AIC', 'restarts')
+
+	def __init__(self, topology, params, dist, AIC, restarts=None):
 		self.topology = topology 
-		self.params = params 
+		self.params = np.asarray(params, dtype=float)
 		self.dist = dist 
 		self.AIC = AIC 
+		self.restarts = restarts 	# The number of restarts used to fit the model (0 if it was taken from a FitCache), or None if unknown
+
+	def __setstate__(self, state):
+		self.restarts = None
+		restore_slots(self, state)
+		self.params = np.asarray(self.params, dtype=float)
 
 	def to_param_lst(self, node_ptypes, edge_ptypes):
-		lst = self.topology.to_param_lst(edge_ptypes, node_ptypes)
-		Parameter.update_lst(lst, self.params)
+		""" Creates Parameter objects for the parameters of the model.
+		"""
+		top = self.topology
+		values = self.params.tolist()
+		if len(values) != len(node_ptypes) + len(top.parents) * len(edge_ptypes):
+			raise ValueError('Length of input lists are mismatched')
+		lst = [node_ptypes[i].create(values[i], node=top.target) for i in range(len(node_ptypes))]
+		at = len(node_ptypes)
+		for p in top.parents:
+			edge = (p, top.target)
+			lst += [edge_ptypes[i].create(values[at + i], edge=edge) for i in range(len(edge_ptypes))]
+			at += len(edge_ptypes)
 		return lst
 
 
@@ -175,7 +295,30 @@ class WholeModel(object):
 		self.dist = dist
 		self.node_ptypes = node_ptypes
 		self.edge_ptypes = edge_ptypes
-		self.params = self.build_par_dict(target_lst, node_ptypes, edge_ptypes)
+		self.param_dict = None
+
+	@property
+	def params(self):
+		""" A dictionary of the Parameter objects of the model, such that params[param_type][node] (or params[param_type][edge]) is a parameter. Built on first use.
+		"""
+		if self.param_dict is None:
+			self.param_dict = self.build_par_dict(self.targets, self.node_ptypes, self.edge_ptypes)
+		return self.param_dict
+
+	def __getstate__(self):
+		# Parameters are rebuilt on demand, and views are pickled without their bag (see ModelBag.whole_model)
+		state = self.__dict__.copy()
+		state['param_dict'] = None
+		state.pop('bag_row', None)
+		return state
+
+	def __setstate__(self, state):
+		# Models pickled before parameters were built lazily stored them as params
+		state = dict(state)
+		if 'params' in state:
+			state['param_dict'] = state.pop('params')
+		state.setdefault('param_dict', None)
+		self.__dict__.update(state)
 
 	def topologies(self):
 		return [t.topology for t in self.targets]
@@ -252,9 +395,42 @@ class WholeModel(object):
 	def get_node_params(self, node):
 		return [self.get_param(pt.param_type, node=node) for pt in self.node_ptypes]
 
+class WholeModelList(object):
+	""" The whole models of a ModelBag as a read-only sequence, in order of distance. WholeModel objects are only created for the models that are accessed. Slicing returns a list.
+	"""
+	def __init__(self, bag):
+		self.bag = bag
+
+	def __len__(self):
+		return len(self.bag)
+
+	def __getitem__(self, key):
+		if type(key) is slice:
+			return [self.bag.whole_model(row) for row in range(*key.indices(len(self.bag)))]
+		return self.bag[key]
+
+	def __iter__(self):
+		for row in range(len(self.bag)):
+			yield self.bag.whole_model(row)
+
 class ModelBag(object):
+	""" A set of whole models, sorted by distance. 
+
+		Whole models are combinations of a few TargetModels for each species, so the bag stores them by column: a table holding each distinct TargetModel of every species once, a matrix of indices into it (choices[row, column] is the index in table[column] of the TargetModel of the model at row, or -1 if the model has none for that species), and a vector of the distances of the models. Indexing the bag (or iterating over its models) creates WholeModel views of the rows, see models. Queries over many models, such as get_param and the counts used by the visualization functions, work on the arrays directly.
+
+		Args:
+		lst - A list of (targets, dist) pairs, where targets is a list of the TargetModels of a whole model (one per species) and dist its distance
+
+		Attributes:
+		species - The target species of each column
+
+		table - A list such that table[column] is the list of distinct TargetModels of species species[column]
+
+		choices - The numpy array of indices into the table described above
+
+		dists - The numpy array of the distances of the models
+	"""
 	def __init__(self, lst, node_ptypes, edge_ptypes, max_parents, num_interactions, max_order, enf_edges, enf_gaps, node_names):
-		self.models = sorted([WholeModel(targets, dist, node_ptypes, edge_ptypes) for (targets, dist) in lst], key=lambda x:x.dist)
 		self.node_ptypes = node_ptypes
 		self.edge_ptypes = edge_ptypes
 		self.max_parents = max_parents
@@ -263,8 +439,45 @@ class ModelBag(object):
 		self.enf_edges = enf_edges
 		self.enf_gaps = enf_gaps
 		self.node_names = node_names
-
-	def from_wm_list(self, wmlist):
+		self.set_columns(lst)
+
+	def set_columns(self, lst):
+		""" Stores the (targets, dist) pairs of lst in the columns of the bag, sorted by distance.
+		"""
+		species = sorted(set(tm.topology.target for (targets, dist) in lst for tm in targets))
+		columns = dict((species[c], c) for c in range(len(species)))
+		table = [[] for c in species]
+		positions = [{} for c in species]	# The index of each TargetModel in table, by id
+		rows = []
+		for (targets, dist) in lst:
+			row = [-1 for c in species]
+			for tm in targets:
+				c = columns[tm.topology.target]
+				k = positions[c].get(id(tm))
+				if k is None:
+					k = len(table[c])
+					positions[c][id(tm)] = k
+					table[c].append(tm)
+				row[c] = k
+			rows.append(row)
+
+		dists = np.array([dist for (targets, dist) in lst], dtype=float)
+		order = np.argsort(dists, kind='stable')
+		dtype = np.min_scalar_type(-max([len(t) for t in table] + [1]))
+		self.species = species
+		self.table = table
+		self.choices = np.array(rows, dtype=dtype).reshape(len(lst), len(species))[order]
+		self.dists = dists[order]
+
+	def with_rows(self, rows):
+		""" Creates a bag of some of the models of this bag, sharing its table of TargetModels.
+
+			Args:
+			rows - The rows of the models to keep
+
+			Returns:
+			A ModelBag of these models, sorted by distance.
+		"""
 		nmb = ModelBag([], 
 			self.node_ptypes, 
 			self.edge_ptypes, 
@@ -274,30 +487,178 @@ class ModelBag(object):
 			self.enf_edges, 
 			self.enf_gaps, 
 			self.node_names)
-		nmb.models = sorted(wmlist, key=lambda x: x.dist)
+		rows = np.asarray(rows, dtype=int)
+		rows = rows[np.argsort(self.dists[rows], kind='stable')]
+		nmb.species = self.species
+		nmb.table = self.table
+		nmb.choices = self.choices[rows]
+		nmb.dists = self.dists[rows]
+		return nmb
 
+	def from_wm_list(self, wmlist):
+		""" Creates a bag of the given WholeModels, with the settings of this bag. Unchanged views of the models of this bag (see whole_model) share its table of TargetModels.
+		"""
+		if all(self.is_unchanged_view(wm) for wm in wmlist):
+			return self.with_rows([wm.bag_row[1] for wm in wmlist])
+		nmb = self.with_rows([])
+		nmb.set_columns([(wm.targets, wm.dist) for wm in wmlist])
 		return nmb
 
+	def __setstate__(self, state):
+		# Bags pickled before they were stored by column hold a list of WholeModels
+		models = state.pop('models', None)
+		self.__dict__.update(state)
+		if models is not None:
+			self.set_columns([(wm.targets, wm.dist) for wm in models])
+
+	@property
+	def models(self):
+		""" The whole models of the bag, in order of distance, as a WholeModelList. 
+
+			The models are views created on every access, so bag[0] is not bag[0], and changes to a view (eg. to its dist or targets) do not change the bag. To change the models of a bag, assign a list of WholeModels to models (which stores them by column again) or create a new bag with from_wm_list.
+		"""
+		return WholeModelList(self)
+
+	@models.setter
+	def models(self, wmlist):
+		self.set_columns([(wm.targets, wm.dist) for wm in wmlist])
+
+	def is_unchanged_view(self, wm):
+		""" Checks whether a WholeModel is a view of a model of this bag (see whole_model) whose distance and TargetModels have not been changed since.
+		"""
+		bag, row = getattr(wm, 'bag_row', (None, None))
+		if bag is not self or wm.dist != self.dists[row]:
+			return False
+		targets = [self.table[c][k] for (c, k) in enumerate(self.choices[row].tolist()) if k >= 0]
+		return len(wm.targets) == len(targets) and all(a is b for (a, b) in zip(wm.targets, targets))
+
+	def whole_model(self, row):
+		""" Creates a WholeModel view of the model at row. Its bag_row attribute is the pair (bag, row).
+		"""
+		targets = [self.table[c][k] for (c, k) in enumerate(self.choices[row].tolist()) if k >= 0]
+		wm = WholeModel(targets, self.dists[row].item(), self.node_ptypes, self.edge_ptypes)
+		wm.bag_row = (self, row)
+		return wm
+
 	def __getitem__(self, key):
-		if type(key) is not int and type(key) is not slice:
-			raise TypeError('Index must be an int. Instead got a {}'.format(type(key)))
-		else:
+		if type(key) is slice:
 			return self.models[key]
+		if not isinstance(key, (int, np.integer)):
+			raise TypeError('Index must be an int. Instead got a {}'.format(type(key)))
+		row = range(len(self))[key]
+		return self.whole_model(row)
 
 	def top(self, num):
 		return self.models[:num]
 
-	def get_param(self, param_type, num, node=None, edge=None):
-		t = self.top(num)
-		if edge != None:
-			t = [m.get_param(param_type, node=node, edge=edge) for m in t if m.param_exists(param_type, node=node, edge=edge)]
-		elif node != None:
-			t = [m.get_param(param_type, node=node, edge=edge) for m in t]
-
+	def param_column(self, param_type, node=None, edge=None):
+		""" Finds the parameter of the given type of a node (or edge) in each TargetModel of the table.
+
+			Returns:
+			A tuple (column, positions), where column is the column of the table holding the TargetModels of the target of the parameter, and positions[k] is the position of the parameter in the params of table[column][k], or -1 if it has no such parameter. column is None if no model has the target.
+		"""
+		if edge is not None:
+			ptypes = self.edge_ptypes
+			target = edge[1]
+		elif node is not None:
+			ptypes = self.node_ptypes
+			target = node
 		else:
 			raise ValueError('Must specify either edge or node for parameter')
+		types = [pt.param_type for pt in ptypes]
+		if param_type not in types:
+			raise ValueError('No parameter of type {}'.format(param_type))
+		i = types.index(param_type)
+
+		if target not in self.species:
+			return None, np.zeros(0, dtype=int)
+		column = self.species.index(target)
+		positions = []
+		for tm in self.table[column]:
+			if edge is None:
+				positions.append(i)
+			elif edge[0] in tm.topology.parents:
+				positions.append(len(self.node_ptypes) + tm.topology.parents.index(edge[0]) * len(self.edge_ptypes) + i)
+			else:
+				positions.append(-1)
+		return column, np.array(positions, dtype=int)
+
+	def param_values(self, param_type, num, node=None, edge=None):
+		""" The values of a parameter of a node (or edge) in the best num models that have it.
+
+			Returns:
+			A numpy array of the values, in order of distance.
+		"""
+		column, positions = self.param_column(param_type, node=node, edge=edge)
+		if column is None:
+			return np.zeros(0)
+		entries = self.choices[:num, column]
+		entries = entries[entries >= 0]
+		entries = entries[positions[entries] >= 0]
+		values = np.array([self.table[column][k].params[positions[k]] if positions[k] >= 0 else np.nan for k in range(len(positions))])
+		return values[entries]
 
-		return t 
+	def get_param(self, param_type, num, node=None, edge=None):
+		""" The Parameter objects of a parameter of a node (or edge) in the best num models. Models without an edge are left out for edge parameters, while a model without a node raises a ValueError for node parameters. Models sharing a TargetModel share its Parameter objects.
+		"""
+		column, positions = self.param_column(param_type, node=node, edge=edge)
+		entries = self.choices[:num, column] if column is not None else np.full(min(num, len(self)), -1)
+		if edge is None and (entries < 0).any():
+			raise ValueError('No parameter of type {} attached to node {}'.format(param_type, node))
+		entries = entries[entries >= 0]
+		entries = entries[positions[entries] >= 0]
+
+		ptype = [pt for pt in self.node_ptypes + self.edge_ptypes if pt.param_type == param_type and pt.is_edge_param == (edge is not None)][0]
+		params = {}
+		for k in np.unique(entries).tolist():
+			value = self.table[column][k].params[positions[k]].item()
+			if edge is None:
+				params[k] = ptype.create(value, node=node)
+			else:
+				params[k] = ptype.create(value, edge=tuple(edge))
+		return [params[k] for k in entries.tolist()]
+
+	def entry_counts(self, num):
+		""" Counts how often each TargetModel of the table is used by the best num models.
+
+			Returns:
+			A list such that counts[column][k] is the number of models using table[column][k].
+		"""
+		return [np.bincount(self.choices[:num, c][self.choices[:num, c] >= 0], minlength=len(self.table[c])) for c in range(len(self.species))]
+
+	def edge_counts(self, num):
+		""" Counts the edges of the best num models.
+
+			Returns:
+			A dictionary mapping each edge (parent, target, interaction) to the number of models that have it.
+		"""
+		counts = {}
+		for (c, column_counts) in enumerate(self.entry_counts(num)):
+			for k in np.nonzero(column_counts)[0].tolist():
+				top = self.table[c][k].topology
+				for i in range(len(top.parents)):
+					e = (top.parents[i], top.target, top.interactions[i])
+					counts[e] = counts.get(e, 0) + int(column_counts[k])
+		return counts
+
+	def edge_matrix(self, num):
+		""" The edges of each of the best num models, leaving out complex parents (as in WholeModel.to_adjacency_mat).
+
+			Returns:
+			A boolean numpy array a such that a[i, p, t] is True if the model at row i has an edge from p to t.
+		"""
+		n = len(self.node_names) if self.node_names is not None and len(self.node_names) > 0 else max(self.species) + 1
+		num = min(num, len(self))
+		edges = np.zeros((num, n, n), dtype=bool)
+		for (c, t) in enumerate(self.species):
+			# The parents of each TargetModel of the column as rows of an indicator matrix
+			indicator = np.zeros((len(self.table[c]) + 1, n), dtype=bool)
+			for (k, tm) in enumerate(self.table[c]):
+				for p in tm.topology.parents:
+					if type(p) is not tuple:
+						indicator[k, p] = True
+			edges[:, :, t] = indicator[self.choices[:num, c]]	# -1 picks the empty last row
+		return edges
 
 	def __len__(self):
-		return len(self.models)
+		return len(self.dists)
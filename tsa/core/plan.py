@@ -0,0 +1,251 @@
+import copy
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from .shard import *
+
+try:
+	import resource
+except ImportError:
+	resource = None
+
+
+def format_seconds(seconds):
+	""" Formats a duration in the largest unit that keeps it above 1 (eg. '3.2 hours').
+	"""
+	for (unit, size) in (('days', 86400), ('hours', 3600), ('minutes', 60)):
+		if seconds >= size:
+			return '{:.1f} {}'.format(seconds / size, unit)
+	return '{:.1f} seconds'.format(seconds)
+
+def format_bytes(num_bytes):
+	""" Formats a number of bytes in the largest unit that keeps it above 1 (eg. '1.5 GB').
+	"""
+	for (unit, size) in (('TB', 1024**4), ('GB', 1024**3), ('MB', 1024**2), ('kB', 1024)):
+		if num_bytes >= size:
+			return '{:.1f} {}'.format(num_bytes / size, unit)
+	return '{} bytes'.format(int(num_bytes))
+
+def physical_memory():
+	""" The physical memory of this machine in bytes, or None if it cannot be found.
+	"""
+	try:
+		return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+	except (AttributeError, ValueError, OSError):
+		return None
+
+def process_memory():
+	""" The peak resident memory of this process in bytes (the memory every process of a run starts from, with TSA and its dependencies loaded), or 0 if it cannot be found.
+	"""
+	if resource is None:
+		return 0
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# Linux reports kB, macOS bytes
+	return peak if sys.platform == 'darwin' else peak * 1024
+
+def traced_bytes(fn):
+	""" Measures the memory held by the objects fn creates.
+
+		Returns:
+		A tuple (result of fn, number of bytes allocated by fn and still held).
+	"""
+	tracemalloc.start()
+	try:
+		before = tracemalloc.get_traced_memory()[0]
+		result = fn()
+		held = tracemalloc.get_traced_memory()[0] - before
+	finally:
+		tracemalloc.stop()
+	return result, held
+
+
+class RunPlan(object):
+	""" The projected cost of a run of generate_models, as calculated by plan_spec.
+
+		Attributes:
+		counts - The number of topologies of each target
+
+		num_topologies - The total number of topologies
+
+		product - The number of whole models that can be combined from the best topologies of each target (at most retained_top ** num_nodes)
+
+		num_whole_models - The number of whole models that are simulated (product, limited by max_whole_models)
+
+		fit_seconds - A dictionary mapping numbers of parents to the measured CPU seconds per fit of a topology with that many (non-enforced) parents, or None if the plan only counts
+
+		sim_seconds - The measured CPU seconds per whole model simulation, or None if the plan only counts
+
+		stages - A list of dictionaries, one per stage of the run, with the 'name' of the stage, the number of 'tasks' (fits or simulations) in it, and the projected 'cpu_seconds', 'wall_seconds' and 'peak_bytes' (peak memory of all processes) of the stage. The projections are None if the plan only counts.
+
+		warnings - A list of messages about settings that make the run unmanageable
+	"""
+	def __init__(self, counts, product, num_whole_models, processes):
+		self.counts = counts
+		self.num_topologies = sum(counts)
+		self.product = product
+		self.num_whole_models = num_whole_models
+		self.processes = processes
+		self.fit_seconds = None
+		self.sim_seconds = None
+		self.stages = []
+		self.warnings = []
+
+	def add_stage(self, name, tasks, cpu_seconds=None, peak_bytes=None):
+		wall_seconds = None if cpu_seconds is None else cpu_seconds / self.processes
+		self.stages.append(dict(name=name, tasks=tasks, cpu_seconds=cpu_seconds, wall_seconds=wall_seconds, peak_bytes=peak_bytes))
+
+	def report(self):
+		""" Prints the plan.
+		"""
+		for t in range(len(self.counts)):
+			print('Target {}: {} topologies'.format(t, self.counts[t]))
+		print('Whole models: {} combinations of the retained topologies, {} simulated'.format(self.product, self.num_whole_models))
+		if self.fit_seconds is not None:
+			print('Measured CPU time per fit: {}'.format(', '.join('{:.3g}s with {} parent(s)'.format(self.fit_seconds[k], k) for k in sorted(self.fit_seconds))))
+		if self.sim_seconds is not None:
+			print('Measured CPU time per whole model simulation: {:.3g}s'.format(self.sim_seconds))
+		for stage in self.stages:
+			if stage['cpu_seconds'] is None:
+				print('{}: {} tasks'.format(stage['name'], stage['tasks']))
+			else:
+				print('{}: {} tasks, {} CPU time, {} on {} processes, {} peak memory'.format(stage['name'], stage['tasks'],
+					format_seconds(stage['cpu_seconds']), format_seconds(stage['wall_seconds']), self.processes, format_bytes(stage['peak_bytes'])))
+		for warning in self.warnings:
+			print('Warning: {}'.format(warning))
+
+def sample_fits(spec, spaces, topology_fn, node_ptypes, edge_ptypes, num_samples, rng):
+	""" Fits a sample of topologies of each size (number of non-enforced parents), drawn at random from all targets in proportion to their number of topologies of that size.
+
+		Returns:
+		A tuple (fits, fit_seconds), where fits is a list of the fitted TargetModels and fit_seconds maps each size to the mean CPU seconds per fit.
+	"""
+	args = spec['run_args']
+	solvers = {}
+	fits = []
+	fit_seconds = {}
+	for k in range(max(len(space.sizes) for space in spaces)):
+		weights = [space.sizes[k] if k < len(space.sizes) else 0 for space in spaces]
+		if sum(weights) == 0:
+			continue
+		seconds = []
+		for i in range(num_samples):
+			space = rng.choices(spaces, weights=weights)[0]
+			top = space.topology(space.offsets[k] + rng.randrange(space.sizes[k]))
+			solver = solvers.get(space.target)
+			if solver is None:
+				solver = make_solver(args['solver'], spec['species_vals'], spec['species_derivs'][:, space.target], args['time_scale'], edge_ptypes, node_ptypes, num_restarts=args['restarts'])
+				solvers[space.target] = solver
+			start = time.process_time()
+			fits.append(fit_topology(topology_fn, top, solver, rng=topology_rng(args['seed'], top)))
+			seconds.append(time.process_time() - start)
+		fit_seconds[k] = sum(seconds) / len(seconds)
+	return fits, fit_seconds
+
+def plan_spec(spec, processes=None, num_samples=10, num_sim_samples=5, jit=False, max_whole_models=10**6, seed=0):
+	""" Projects the cost of a run of generate_models without running it. The number of topologies of each target is counted exactly (see TopologySpace), as is the number of whole models. The CPU time of each stage is projected from a sample of fits and whole model simulations timed on this machine, and its peak memory from the measured memory of the sampled models.
+
+		The projections assume every topology is fit in full, from random starting values. Screening, non-exhaustive searches, warm starts, fit caches and pruning of whole models (see generate_models) can only make the run cheaper, so the projections are upper bounds for such runs.
+
+		Args:
+		spec - The spec of the run (see run_spec). If it has no simulated data (no accepted model was given), the plan only counts.
+
+		processes - The number of processes the run uses, as for generate_models
+
+		num_samples - The number of topologies of each size to fit
+
+		num_sim_samples - The number of whole models to simulate
+
+		jit - If True, the sample is fit with the JIT backend if it can be used. See JitFramework.
+
+		max_whole_models - The number of simulated whole models above which the run is flagged as unmanageable
+
+		seed - The seed of the sampling of topologies
+
+		Returns:
+		A RunPlan.
+	"""
+	args = spec['run_args']
+	num_nodes = len(args['nodes'])
+	if processes is None:
+		processes = 8 if platform.system() != 'Windows' else 1
+	spaces = [shard_space(spec, t) for t in range(num_nodes)]
+	counts = [len(space) for space in spaces]
+
+	# Each target contributes its retained_top best topologies to the whole models
+	product = 1
+	for count in counts:
+		product *= min(count, args['retained_top'])
+	num_whole = product if args['max_whole_models'] is None else min(product, args['max_whole_models'])
+
+	plan = RunPlan(counts, product, num_whole, processes)
+	if num_whole > max_whole_models:
+		plan.warnings.append('{} whole models would be simulated (retained_top ** num_nodes = {} ** {}). Set max_whole_models or lower retained_top'.format(num_whole, args['retained_top'], num_nodes))
+	if args['search'] != 'exhaustive':
+		plan.warnings.append('The {} search fits only some of the topologies, so the gradient matching projection is an upper bound'.format(args['search']))
+	if spec['species_vals'] is None:
+		plan.add_stage('Gradient matching', plan.num_topologies)
+		plan.add_stage('Whole models', num_whole)
+		return plan
+
+	topology_fn = jit_framework(spec['topology_fn']) if jit else spec['topology_fn']
+	spaces = [shard_space(spec, t, topology_fn=topology_fn) for t in range(num_nodes)]
+	all_params = spec['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	rng = random.Random(seed)
+	baseline = process_memory()
+
+	# Gradient matching: time a sample of fits of each size
+	fits, plan.fit_seconds = sample_fits(spec, spaces, topology_fn, node_ptypes, edge_ptypes, num_samples, rng)
+	fit_cpu = sum(space.sizes[k] * plan.fit_seconds[k] for space in spaces for k in range(len(space.sizes)) if space.sizes[k] > 0)
+	copies, fits_bytes = traced_bytes(lambda: copy.deepcopy(fits))
+	model_bytes = fits_bytes / max(len(fits), 1)
+	data_bytes = spec['species_vals'].nbytes + spec['species_derivs'].nbytes
+	# Each process holds the data and its retained models, and with warm starts the fits of the topologies it was given
+	held = args['retained_top'] * num_nodes + (max(counts) if args['warm_start'] else 0)
+	plan.add_stage('Gradient matching', plan.num_topologies, fit_cpu, processes * (baseline + data_bytes + held * model_bytes))
+
+	# Whole models: time simulations of combinations of the best sampled fits of each target
+	best = []
+	for t in range(num_nodes):
+		target_fits = sorted([m for m in fits if m.topology.target == t], key=lambda m: m.AIC)[:args['retained_top']]
+		if len(target_fits) == 0:
+			top = spaces[t].topology(0)
+			solver = make_solver(args['solver'], spec['species_vals'], spec['species_derivs'][:, t], args['time_scale'], edge_ptypes, node_ptypes, num_restarts=args['restarts'])
+			target_fits = [fit_topology(topology_fn, top, solver, rng=topology_rng(args['seed'], top))]
+		best.append(target_fits)
+	models = [tuple(rng.choice(b) for b in best) for i in range(num_sim_samples)]
+	start = time.process_time()
+	dists = [model_dist(m, topology_fn, args['initial_vals'], spec['species_vals'], args['time_scale']) for m in models]
+	plan.sim_seconds = (time.process_time() - start) / max(len(models), 1)
+	# The whole models are held as tuples and results while they are checked, and as WholeModels in the ModelBag
+	bag, bag_bytes = traced_bytes(lambda: ([tuple(m) for m in models], [(m, d) for (m, d) in zip(models, dists)], ModelBag(list(zip(models, dists)), node_ptypes, edge_ptypes, args['max_parents'], args['num_interactions'], args['max_order'], args['enf_edges'], args['enf_gaps'], args['nodes'])))
+	whole_bytes = bag_bytes / max(len(models), 1)
+	plan.add_stage('Whole models', num_whole, num_whole * plan.sim_seconds, processes * baseline + num_whole * whole_bytes)
+
+	available = physical_memory()
+	if available is not None:
+		for stage in plan.stages:
+			if stage['peak_bytes'] > available:
+				plan.warnings.append('{} would need {} of memory, but this machine has {}'.format(stage['name'], format_bytes(stage['peak_bytes']), format_bytes(available)))
+	return plan
+
+def plan_models(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, processes=None, num_samples=10, num_sim_samples=5, jit=False, **kwargs):
+	""" Projects the cost of generate_models with the given arguments, without running it. See plan_spec.
+
+		Args:
+		topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, processes, jit - As for generate_models. If accepted_model_fn is None, the plan only counts topologies and whole models.
+
+		num_samples, num_sim_samples - The number of fits of each size and of whole model simulations to time. See plan_spec.
+
+		kwargs - Any arguments of generate_models that determine the results (see RUN_ARGS)
+
+		Returns:
+		A RunPlan. Call its report method to print it.
+	"""
+	spec = run_spec(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, **kwargs)
+	return plan_spec(spec, processes=processes, num_samples=num_samples, num_sim_samples=num_sim_samples, jit=jit)
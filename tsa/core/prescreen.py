@@ -0,0 +1,89 @@
+import numpy as np
+
+
+# Statistics that parents can be ranked by. See parent_scores.
+PRESCREEN_METHODS = ['corr', 'partial', 'sparse']
+
+def interactome_values(species_vals, interactome):
+	""" The value of an interactome (a single species, or a tuple of species for complex parents) at every time step: the product of the values of its species.
+	"""
+	if type(interactome) is tuple:
+		return np.prod(species_vals[:, list(interactome)], axis=1)
+	return species_vals[:, interactome]
+
+def standardize(cols):
+	""" Centers the columns of a matrix and scales them to unit norm. Constant columns become zero.
+	"""
+	cols = cols - cols.mean(axis=0)
+	norms = np.linalg.norm(cols, axis=0)
+	norms[norms == 0] = np.inf
+	return cols / norms
+
+def residualize(cols, controls):
+	""" Removes the least-squares fit on the control columns from each column.
+	"""
+	coef = np.linalg.lstsq(controls, cols, rcond=None)[0]
+	return cols - controls.dot(coef)
+
+def parent_scores(species_vals, target_derivs, target, interactomes, method='partial'):
+	""" Scores how promising each candidate parent of a target is, using cheap statistics of its values against the target's derivatives.
+
+		Args:
+		species_vals - The "true" values of all species for all time steps, such that species_vals[t, s] is the value of species s at time t.
+
+		target_derivs - The "true" derivatives of the target species for all time steps
+
+		target - The target species
+
+		interactomes - The list of candidate parents (species, or tuples of species for complex parents)
+
+		method - The statistic to rank by:
+			'corr' - The absolute correlation of the parent's values with the target's derivatives
+			'partial' - The absolute partial correlation, controlling for the value of the target itself (which drives its own degradation or growth in most frameworks)
+			'sparse' - The order in which parents are selected by orthogonal matching pursuit, a greedy sparse regression of the target's derivatives on the parents' values (controlling for the target as in 'partial'). This accounts for parents that are correlated with each other.
+
+		Returns:
+		A numpy array of scores, one per interactome, where higher scores are more promising.
+	"""
+	if method not in PRESCREEN_METHODS:
+		raise ValueError('Unknown pre-screening method {}. Choose one of {}'.format(method, PRESCREEN_METHODS))
+	if len(interactomes) == 0:
+		return np.zeros(0)
+	F = np.column_stack([interactome_values(species_vals, i) for i in interactomes])
+	y = np.asarray(target_derivs, dtype=float).reshape(-1, 1)
+	if method != 'corr':
+		controls = np.column_stack([np.ones(len(y)), species_vals[:, target]])
+		F = residualize(F, controls)
+		y = residualize(y, controls)
+	F = standardize(F)
+	y = standardize(y)[:, 0]
+	corr = np.abs(F.T.dot(y))
+	if method != 'sparse':
+		return corr
+
+	# Selected parents score above 1 in order of selection, the rest by their correlation
+	scores = corr.copy()
+	selected = []
+	resid = y
+	for step in range(min(len(interactomes), F.shape[0])):
+		c = np.abs(F.T.dot(resid))
+		c[selected] = -1
+		j = int(np.argmax(c))
+		if c[j] <= 1e-12:
+			break
+		selected.append(j)
+		scores[j] = 1 + len(interactomes) - step
+		coef = np.linalg.lstsq(F[:, selected], y, rcond=None)[0]
+		resid = y - F[:, selected].dot(coef)
+	return scores
+
+def prescreen_parents(species_vals, target_derivs, target, interactomes, top_m, method='partial'):
+	""" Selects the top_m most promising candidate parents of a target (see parent_scores). The target itself is always kept if it is a candidate, as the statistics controlling for it cannot score it.
+
+		Returns:
+		The selected interactomes, in the order of interactomes.
+	"""
+	scores = parent_scores(species_vals, target_derivs, target, interactomes, method=method)
+	order = sorted(range(len(interactomes)), key=lambda i: (-scores[i], i))
+	keep = set(order[:top_m])
+	return [interactomes[i] for i in range(len(interactomes)) if i in keep or interactomes[i] == target]
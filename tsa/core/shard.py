@@ -0,0 +1,281 @@
+import inspect
+import os
+import pickle
+import time
+from .generate import *
+
+
+def shard_range(count, shard, num_shards):
+	""" Splits count topologies into num_shards contiguous ranges of (nearly) equal size.
+
+		Returns:
+		The range [start, stop) of shard number shard (counting from 0) as a tuple (start, stop).
+	"""
+	if shard < 0 or shard >= num_shards:
+		raise ValueError('Shard {} is out of range for {} shards'.format(shard, num_shards))
+	return (count * shard // num_shards, count * (shard + 1) // num_shards)
+
+def shard_dir(run_dir):
+	return os.path.join(run_dir, 'shards')
+
+def shard_file(run_dir, target, start, stop):
+	""" The file name of the results of the topologies [start, stop) of a target.
+	"""
+	return os.path.join(shard_dir(run_dir), 'target{}'.format(target), '{}-{}.pkl'.format(start, stop))
+
+def write_atomic(fname, obj):
+	""" Pickles obj to fname through a temporary file, so that readers (and hosts sharing the directory) never see a partly written file.
+	"""
+	tmp = '{}.{}.{}.tmp'.format(fname, os.uname().nodename, os.getpid())
+	with open(tmp, 'wb') as f:
+		pickle.dump(obj, f, protocol=2)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(tmp, fname)
+
+def run_spec(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, **kwargs):
+	""" Collects everything the gradient matching of a run of generate_models depends on: the arguments of the run, the framework, the simulated data and the candidate parents of each target. See create_shards and plan_spec.
+
+		Args:
+		topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals - As for generate_models. If accepted_model_fn is None, no data is simulated (and the spec can only be used to count topologies).
+
+		kwargs - Any arguments of generate_models that determine the results (see RUN_ARGS). Others are left at their defaults.
+
+		Returns:
+		The spec as a dictionary.
+	"""
+	args = dict((name, p.default) for (name, p) in inspect.signature(generate_models).parameters.items() if name in RUN_ARGS and p.default is not inspect.Parameter.empty)
+	unknown = sorted(set(kwargs) - set(RUN_ARGS))
+	if len(unknown) > 0:
+		raise ValueError('Arguments that do not affect the results cannot be stored with the run: {}'.format(', '.join(unknown)))
+	args.update(kwargs)
+	args['time_scale'] = time_scale
+	args['initial_vals'] = initial_vals
+	args['num_interactions'], args['max_order'] = framework_defaults(topology_fn, args['num_interactions'], args['max_order'])
+	run_args = dict(framework=None if topology_fn is None else framework_name(topology_fn))
+	run_args.update(args)
+
+	num_nodes = len(args['nodes'])
+	model_space = ModelSpace(num_nodes=num_nodes,
+							 node_names=args['nodes'],
+							 max_parents=args['max_parents'],
+							 num_interactions=args['num_interactions'],
+							 max_order=args['max_order'],
+							 topology_fn=topology_fn)
+	if accepted_model_fn is None:
+		species_vals = species_derivs = None
+	else:
+		species_vals, species_derivs = sim_data(accepted_model_fn, time_scale, initial_vals)
+
+	enf_edges_target = [ [] for i in range(num_nodes) ]
+	enf_gaps_target = [ [] for i in range(num_nodes) ]
+	for (p, t) in args['enf_edges']:
+		enf_edges_target[t].append(p)
+	for (p, t) in args['enf_gaps']:
+		enf_gaps_target[t].append(p)
+
+	target_parents = [None for i in range(num_nodes)]
+	if args['prescreen_top'] is not None:
+		if species_vals is None:
+			raise ValueError('Pre-screening needs the data of the accepted model')
+		for t in range(num_nodes):
+			interactomes = candidate_interactomes(model_space, enf_edges_target[t], enf_gaps_target[t])
+			target_parents[t] = prescreen_parents(species_vals, species_derivs[:, t], t, interactomes, args['prescreen_top'], method=args['prescreen_method'])
+
+	return dict(run_args=run_args,
+				topology_fn=topology_fn,
+				parameter_fn=parameter_fn,
+				species_vals=species_vals,
+				species_derivs=species_derivs,
+				enf_edges_target=enf_edges_target,
+				enf_gaps_target=enf_gaps_target,
+				target_parents=target_parents)
+
+def create_shards(run_dir, topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, **kwargs):
+	""" Prepares a run of generate_models whose gradient matching is split into shards: ranges of the topologies of a target (see TopologySpace) that can be fit independently, eg. on different hosts sharing the run directory.
+
+		The run directory is set up as by generate_models, and everything the shards need (see run_spec) is stored in it, so that a shard only needs the run directory (see run_shard and the tsa.shard command). Once every shard of a target is done, merge_shards adds the best topologies of the target to the run, and resume_models then carries out the rest of the run (targets that were not sharded are gradient matched by resume_models as usual).
+
+		The topology_fn and parameter_fn must be importable by the hosts running the shards (eg. the built in frameworks, or functions defined in a module rather than in a script), since they are pickled by name.
+
+		Args:
+		run_dir - The run directory
+
+		topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals - As for generate_models
+
+		kwargs - Any arguments of generate_models that determine the results (see RUN_ARGS). Screening and searches other than 'exhaustive' are not supported, since they depend on all topologies of a target.
+
+		Returns:
+		A list of the number of topologies of each target.
+	"""
+	if kwargs.get('screen_margin') is not None or kwargs.get('search', 'exhaustive') != 'exhaustive':
+		raise ValueError('Shards can only be used with exhaustive search and without screening')
+	spec = run_spec(topology_fn, parameter_fn, accepted_model_fn, time_scale, initial_vals, **kwargs)
+	if open_run_dir(run_dir, spec['run_args']) is not None:
+		print('The run in {} has already finished'.format(run_dir))
+	os.makedirs(shard_dir(run_dir), exist_ok=True)
+	write_atomic(os.path.join(shard_dir(run_dir), 'spec.pkl'), spec)
+
+	counts = [len(shard_space(spec, t)) for t in range(len(spec['run_args']['nodes']))]
+	for t in range(len(counts)):
+		print('Target {}: {} topologies'.format(t, counts[t]))
+	return counts
+
+def load_shard_spec(run_dir):
+	""" Loads the spec (see run_spec) that create_shards stored in a run directory.
+	"""
+	with open(os.path.join(shard_dir(run_dir), 'spec.pkl'), 'rb') as f:
+		return pickle.load(f)
+
+def shard_space(spec, target, topology_fn=None):
+	""" The TopologySpace of a target of a sharded run.
+
+		Args:
+		spec - The spec of the run (see run_spec)
+
+		target - The target species
+
+		topology_fn - The framework to put in the model space, if not the one in the spec (eg. a JitFramework wrapping it)
+	"""
+	args = spec['run_args']
+	model_space = ModelSpace(num_nodes=len(args['nodes']),
+							 node_names=args['nodes'],
+							 max_parents=args['max_parents'],
+							 num_interactions=args['num_interactions'],
+							 max_order=args['max_order'],
+							 topology_fn=spec['topology_fn'] if topology_fn is None else topology_fn)
+	return TopologySpace(model_space, target, enf_edges=spec['enf_edges_target'][target], enf_gaps=spec['enf_gaps_target'][target], parents=spec['target_parents'][target])
+
+def run_shard(run_dir, target, start, stop, processes=None, jit=False, fit_cache=None):
+	""" Gradient matches the topologies [start, stop) of a target of a run prepared by create_shards, and stores the best of them in the run directory. A shard that is already done is not fit again.
+
+		Args:
+		run_dir - The run directory
+
+		target - The target species
+
+		start, stop - The range of topology indices to fit (see TopologySpace and shard_range)
+
+		processes - If set, the shard is fit by this many processes. See gradient_match_par.
+
+		jit - If True, the framework is compiled with numba if possible. See JitFramework.
+
+		fit_cache - An optional FitCache, or the file name of one, as for generate_models
+
+		Returns:
+		A list of (AIC, index, TargetModel) entries for the best topologies of the shard, where index is the index of the topology in the space of the target.
+	"""
+	spec = load_shard_spec(run_dir)
+	args = spec['run_args']
+	space = shard_space(spec, target)
+	stop = min(stop, len(space))
+	fname = shard_file(run_dir, target, start, stop)
+	if os.path.exists(fname):
+		print('Shard {}-{} of target {} is already done'.format(start, stop, target))
+		with open(fname, 'rb') as f:
+			return pickle.load(f)['entries']
+
+	if jit:
+		space = shard_space(spec, target, topology_fn=jit_framework(spec['topology_fn']))
+	all_params = spec['parameter_fn']()
+	node_ptypes = [pt for pt in all_params if not pt.is_edge_param]
+	edge_ptypes = [pt for pt in all_params if pt.is_edge_param]
+	fit_cache = open_fit_cache(fit_cache, spec['topology_fn'])
+	if args['seed'] is None:
+		fit_cache = None
+
+	print('Fitting topologies {}-{} of {} of target {} ... '.format(start, stop, len(space), target), end='')
+	fit_start = time.time()
+	topologies = space.topologies(start, stop)
+	if processes is not None:
+		best = gradient_match_par(target_models=[(target, topologies)],
+								  species_vals=spec['species_vals'],
+								  species_derivs=spec['species_derivs'],
+								  time_scale=args['time_scale'],
+								  edge_ptypes=edge_ptypes,
+								  node_ptypes=node_ptypes,
+								  num_best_models=args['retained_top'],
+								  num_restarts=args['restarts'],
+								  seed=args['seed'],
+								  solver=args['solver'],
+								  processes=processes,
+								  cache=fit_cache,
+								  warm_start=args['warm_start'])[0]
+	else:
+		best = gradient_match_topologies(models=topologies,
+										 target=target,
+										 species_vals=spec['species_vals'],
+										 species_derivs=spec['species_derivs'],
+										 time_scale=args['time_scale'],
+										 edge_ptypes=edge_ptypes,
+										 node_ptypes=node_ptypes,
+										 num_best_models=args['retained_top'],
+										 num_restarts=args['restarts'],
+										 seed=args['seed'],
+										 solver=args['solver'],
+										 cache=fit_cache,
+										 warm_start=args['warm_start'])
+	print('Done. Time taken = {} seconds'.format(time.time() - fit_start))
+
+	entries = [(model.AIC, space.index(model.topology), model) for model in best]
+	os.makedirs(os.path.dirname(fname), exist_ok=True)
+	write_atomic(fname, dict(target=target, start=start, stop=stop, entries=entries))
+	return entries
+
+def missing_ranges(ranges, count):
+	""" Finds the topologies of a space of count topologies that none of the ranges [start, stop) cover.
+
+		Returns:
+		A list of the uncovered ranges as (start, stop) tuples.
+	"""
+	missing = []
+	covered = 0
+	for (start, stop) in sorted(ranges):
+		if start > covered:
+			missing.append((covered, start))
+		covered = max(covered, stop)
+	if covered < count:
+		missing.append((covered, count))
+	return missing
+
+def merge_shards(run_dir):
+	""" Merges the shards of each target of a run prepared by create_shards. The best topologies of every target whose shards cover all of its topologies are added to the run directory, in the same way as generate_models stores a gradient matched target, and are then used by resume_models. The result is the same as that of an exhaustive run on one host. Shards may overlap (eg. when some were run with a different number of shards).
+
+		Returns:
+		A dictionary mapping each target that is not complete to a list of the (start, stop) ranges of its topologies that no shard covers.
+	"""
+	spec = load_shard_spec(run_dir)
+	args = spec['run_args']
+	num_nodes = len(args['nodes'])
+	done_targets = dict(load_records(os.path.join(run_dir, 'targets.ckpt'), truncate=True))
+
+	incomplete = {}
+	with open(os.path.join(run_dir, 'targets.ckpt'), 'ab') as targets_file:
+		for t in range(num_nodes):
+			if t in done_targets:
+				continue
+			count = len(shard_space(spec, t))
+			target_dir = os.path.join(shard_dir(run_dir), 'target{}'.format(t))
+			shards = []
+			if os.path.isdir(target_dir):
+				for name in sorted(os.listdir(target_dir)):
+					if name.endswith('.pkl'):
+						with open(os.path.join(target_dir, name), 'rb') as f:
+							shards.append(pickle.load(f))
+			missing = missing_ranges([(s['start'], s['stop']) for s in shards], count)
+			if len(missing) > 0:
+				incomplete[t] = missing
+				print('Target {}: {} of {} topologies are not covered by a shard'.format(t, sum(b - a for (a, b) in missing), count))
+				continue
+
+			best = []
+			seen = set()
+			for s in shards:
+				for entry in s['entries']:
+					if entry[1] not in seen:
+						seen.add(entry[1])
+						retain_best(best, entry, args['retained_top'])
+			best = [entry[2] for entry in sorted(best, key=lambda x: x[:2])]
+			append_record(targets_file, (t, best))
+			print('Target {}: merged {} shards'.format(t, len(shards)))
+	return incomplete
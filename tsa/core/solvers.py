@@ -0,0 +1,326 @@
+import functools
+import math
+import random
+import numpy as np 
+from scipy.optimize import minimize, lsq_linear
+from scipy.stats import qmc
+from .compiler import *
+from .model import *
+
+
+def objective_fn(fn, specie_vals, target_derivs, topology, time_scale):
+	""" Creates an objective function that calculates the euclidean distance between the target_derivs and the output of fn for given parameters. 
+
+		The derivatives are calculated in the first of these ways that fn supports:
+			1. If fn has a `spec` attribute, it is taken to be a FrameworkSpec, and the function compiled for the topology is used (see compile_topology). This is the case for every built in framework, so their `vectorized` forms are not used.
+			2. If fn has a `vectorized` attribute, it is taken to be a function with the same signature as fn, except that it takes in the values of species across all time steps and the array of all time steps, and outputs the derivatives of x at every time step as a numpy array. 
+			3. Otherwise fn is called once per time step.
+		
+		Args:
+		fn - A function that takes in the value of species at time t, the time t, the topology and parameter list and outputs the derivative of x.
+		
+		specie_vals - A numpy array containing the value of each species across all time steps, such that species_vals[t, s] = value of species s at time t.
+		
+		target_derivs - A numpy array containing the values against which to compare the output of fn.
+		
+		topology - A Topology object describing the model currently being examined
+		
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+		
+		Returns:
+		A function that takes in a list of parameters and outputs the euclidean distance (L2 Norm) between fn(params) and target_derivs.
+	"""
+	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	spec = framework_spec(fn)
+	if spec is not None:
+		# Look up the compiled function once rather than on every evaluation
+		series = compile_topology(spec, topology).vectorized
+		def obj(params):
+			return np.linalg.norm(series(specie_vals, ts, params)-target_derivs)
+		return obj
+	def obj(params):
+		sim = derivative_series(fn, specie_vals, ts, topology, params)
+		return np.linalg.norm(sim-target_derivs)
+	return obj
+
+
+def derivative_series(fn, specie_vals, ts, topology, params):
+	""" Calculates the derivative of a topology's target at every time step, preferring the compiled spec of fn to its vectorized form, and that to calling fn once per time step (see objective_fn).
+	"""
+	spec = framework_spec(fn)
+	if spec is not None:
+		return compile_topology(spec, topology).vectorized(specie_vals, ts, params)
+	vec_fn = getattr(fn, 'vectorized', None)
+	if vec_fn is not None:
+		return vec_fn(specie_vals, ts, topology, params)
+	return np.array([fn(specie_vals[i], ts[i], topology, params) for i in range(len(ts))])
+
+def objective_jac_fn(fn, specie_vals, target_derivs, topology, time_scale, fallback='fd', step=1e-20):
+	""" Creates the gradient of the objective function created by objective_fn with respect to the parameters. 
+
+		If fn has a `param_grad` attribute, it is taken to be a function with the same signature as fn.vectorized that outputs a numpy array J such that J[t, i] is the derivative of the target's derivative at time step t with respect to parameter i. The gradient of the objective is then computed analytically from J. 
+
+		Args:
+		fn - A function that takes in the value of species at time t, the time t, the topology and parameter list and outputs the derivative of x.
+		
+		specie_vals - A numpy array containing the value of each species across all time steps, such that species_vals[t, s] = value of species s at time t.
+		
+		target_derivs - A numpy array containing the values against which to compare the output of fn.
+		
+		topology - A Topology object describing the model currently being examined
+		
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+
+		fallback - What to do if fn has no param_grad. 'cs' computes J by complex-step differentiation, which is exact to machine precision but requires fn to work with complex parameters. 'fd' returns None, so that the optimizer falls back to its own finite differences.
+
+		step - The step size used for complex-step differentiation 
+
+		Returns:
+		A function that takes in a list of parameters and outputs the gradient of the euclidean distance between fn(params) and target_derivs, or None (see fallback).
+	"""
+	ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+	grad_fn = getattr(fn, 'param_grad', None)
+	if grad_fn is None:
+		if fallback == 'fd':
+			return None
+		elif fallback == 'cs':
+			def grad_fn(xs, ts, topology, params):
+				params = np.asarray(params, dtype=complex)
+				J = np.zeros((len(ts), len(params)))
+				for i in range(len(params)):
+					params[i] += step * 1j
+					J[:, i] = np.imag(derivative_series(fn, xs, ts, topology, params)) / step
+					params[i] -= step * 1j
+				return J 
+		else:
+			raise ValueError('Unknown gradient fallback {}. Choose one of [\'cs\', \'fd\']'.format(fallback))
+
+	def jac(params):
+		sim = derivative_series(fn, specie_vals, ts, topology, params)
+		resid = sim - target_derivs
+		dist = np.linalg.norm(resid)
+		if dist == 0:
+			return np.zeros(len(params))
+		J = grad_fn(specie_vals, ts, topology, params)
+		return J.T.dot(resid) / dist
+	return jac
+
+
+# Designs for drawing the starting values of restarts. See restart_points.
+RESTART_DESIGNS = ['random', 'sobol', 'lhs']
+
+def restart_points(design, bounds_list, num_points, rng=None):
+	""" Draws starting values for the restarts of a fit.
+
+		Args:
+		design - How points are drawn. 'random' draws every parameter uniformly and independently. 'sobol' (a scrambled Sobol sequence) and 'lhs' (Latin hypercube sampling) are low-discrepancy designs, which spread the points evenly over the bounds so that fewer points are needed to cover them.
+
+		bounds_list - The (lower, upper) bounds of each parameter
+
+		num_points - The number of points to draw
+
+		rng - A random.Random object used to draw the points (or to seed the design). If None, the global random module is used.
+
+		Returns:
+		A list of num_points parameter lists.
+	"""
+	if rng is None:
+		rng = random
+	if design == 'random':
+		return [[lb + rng.random() * (ub - lb) for (lb, ub) in bounds_list] for i in range(num_points)]
+	if design not in RESTART_DESIGNS:
+		raise ValueError('Unknown restart design {}. Choose one of {}'.format(design, RESTART_DESIGNS))
+	if num_points == 0 or len(bounds_list) == 0:
+		return [[] for i in range(num_points)]
+
+	seed = rng.getrandbits(32)
+	if design == 'sobol':
+		# Sobol points are balanced in powers of 2, of which we take the first num_points
+		sample = qmc.Sobol(len(bounds_list), seed=seed).random_base2(int(math.ceil(math.log2(num_points))))[:num_points]
+	else:
+		sample = qmc.LatinHypercube(len(bounds_list), seed=seed).random(num_points)
+	# Scaled by hand, since qmc.scale rejects parameters fixed by equal bounds
+	lb = np.array([b[0] for b in bounds_list], dtype=float)
+	ub = np.array([b[1] for b in bounds_list], dtype=float)
+	return (lb + sample * (ub - lb)).tolist()
+
+
+class SLSQPSolver(object):
+	""" Gradient-matching solver that minimizes the objective_fn of a topology with SLSQP, restarting from several starting values to avoid local optima.
+
+		The gradient of the objective is supplied to SLSQP by objective_jac_fn. jac_fallback sets how it is computed for frameworks without a param_grad ('fd' or 'cs'). To change it, pass eg. functools.partial(SLSQPSolver, jac_fallback='cs') as the solver.
+
+		Starting values are drawn with the given design (see restart_points). If converged is set, the restarts stop early as soon as converged of them have reached the best distance found (within a relative tolerance of converged_tol), so num_restarts is only an upper limit: easy topologies stop after a few restarts, while hard ones use all of them. The number of restarts used for the last fit is kept as last_restarts.
+
+		tol sets the tolerance of every SLSQP run. See also screening_solver.
+	"""
+	# Whether fit makes use of given starting values (see warm_starts)
+	accepts_starts = True
+
+	def __init__(self, species_vals, target_derivs, time_scale, edge_ptypes, node_ptypes, num_restarts=5, jac_fallback='fd', design='random', converged=None, converged_tol=1e-3, tol=1e-6):
+		self.species_vals = species_vals
+		self.target_derivs = target_derivs
+		self.time_scale = time_scale
+		self.edge_ptypes = edge_ptypes
+		self.node_ptypes = node_ptypes
+		self.num_restarts = num_restarts
+		self.jac_fallback = jac_fallback
+		self.design = design
+		self.converged = converged
+		self.converged_tol = converged_tol
+		self.tol = tol
+		self.bounds = BoundsTable(node_ptypes, edge_ptypes)
+		self.last_restarts = None
+
+	def fingerprint(self):
+		""" Returns the settings and data that determine the fits of this solver, for the key of a FitCache.
+		"""
+		return ('slsqp', self.species_vals, self.target_derivs, list(self.time_scale), [pt.to_dict() for pt in self.node_ptypes + self.edge_ptypes], self.num_restarts, self.jac_fallback, self.design, self.converged, self.converged_tol, self.tol)
+
+	def screening_solver(self, stride, tol=1e-3):
+		""" Creates a cheap version of this solver for screening topologies (see screen_topologies): it fits every stride-th time step only, with a single restart and the loose tolerance tol. 
+		"""
+		ts = np.linspace(self.time_scale[0], self.time_scale[1], self.time_scale[2])[::stride]
+		return SLSQPSolver(self.species_vals[::stride], self.target_derivs[::stride], [float(ts[0]), float(ts[-1]), len(ts)], self.edge_ptypes, self.node_ptypes, num_restarts=1, jac_fallback=self.jac_fallback, tol=tol)
+
+	def fit(self, dX, top, rng=None, starts=None):
+		""" Finds the parameters of a topology whose derivatives are closest to the target derivatives.
+
+			Args:
+			dX - The topology function of the model framework 
+
+			top - A Topology object describing the model to fit 
+
+			rng - A random.Random object used to draw starting values. If None, the global random module is used.
+
+			starts - An optional list of parameter lists to start the optimization from (see warm_starts). Points of the restart design are only used for the remaining num_restarts - len(starts) restarts.
+
+			Returns:
+			A tuple (params, dist) of the best parameters found and their distance from the target derivatives.
+		"""
+		obj = objective_fn(dX, self.species_vals, self.target_derivs, top, self.time_scale)
+		jac = objective_jac_fn(dX, self.species_vals, self.target_derivs, top, self.time_scale, fallback=self.jac_fallback)
+		bounds_list = self.bounds.get(top)[0]
+
+		best_params = []
+		best_dist = 1e12
+		dists = []
+
+		# Given starting values first, then points of the restart design
+		starts = list(starts) if starts is not None else []
+		starts += restart_points(self.design, bounds_list, self.num_restarts - len(starts), rng=rng)
+		for param_list in starts:
+
+			# Perform gradient matching to find optimal parameters
+			res = minimize(obj, param_list, method='SLSQP', jac=jac, tol=self.tol, bounds=bounds_list)
+			opt_params = res.x
+
+			# Calculate the distance of best guess
+			dist = obj(opt_params)
+			dists.append(dist)
+
+			if dist < best_dist:
+				best_params = opt_params
+				best_dist = dist 
+
+			# Stop once enough restarts have converged to the best distance
+			if self.converged is not None:
+				agreeing = sum(1 for d in dists if d <= best_dist * (1 + self.converged_tol) + 1e-12)
+				if agreeing >= self.converged:
+					break
+
+		self.last_restarts = len(dists)
+		return best_params, best_dist
+
+
+class LeastSquaresSolver(object):
+	""" Gradient-matching solver for model frameworks whose derivative is linear in their parameters. Each topology is fit exactly with a single bounded linear least-squares solve, so random restarts are not needed. 
+
+		The framework's topology function must have a `linear_features` attribute. This is a function that takes in the values of all species across all time steps, the time steps, the target and a parent (or None), and returns the columns that multiply the parameters of that parent's edge (or of the target node, if the parent is None). Columns are built once per (target, parent) and reused across every topology.
+	"""
+	accepts_starts = False
+
+	def __init__(self, species_vals, target_derivs, time_scale, edge_ptypes, node_ptypes, num_restarts=5):
+		self.species_vals = species_vals
+		self.target_derivs = target_derivs
+		self.ts = np.linspace(time_scale[0], time_scale[1], time_scale[2])
+		self.edge_ptypes = edge_ptypes
+		self.node_ptypes = node_ptypes
+		self.bounds = BoundsTable(node_ptypes, edge_ptypes)
+		self.columns = {}
+
+	def fingerprint(self):
+		""" Returns the data that determines the fits of this solver, for the key of a FitCache. Fits are exact, so the number of restarts is not part of it.
+		"""
+		return ('lstsq', self.species_vals, self.target_derivs, self.ts, [pt.to_dict() for pt in self.node_ptypes + self.edge_ptypes])
+
+	def features(self, dX, target, parent):
+		""" Returns the (cached) columns of the design matrix for the given target and parent.
+		"""
+		key = (target, parent)
+		if key not in self.columns:
+			cols = np.asarray(dX.linear_features(self.species_vals, self.ts, target, parent), dtype=float)
+			self.columns[key] = cols.reshape(len(self.ts), -1)
+		return self.columns[key]
+
+	def fit(self, dX, top, rng=None, starts=None):
+		""" Finds the parameters of a topology whose derivatives are closest to the target derivatives.
+
+			Args:
+			dX - The topology function of the model framework. Must have a `linear_features` attribute.
+
+			top - A Topology object describing the model to fit 
+
+			rng, starts - Unused, since fits are exact. Present for compatibility with other solvers.
+
+			Returns:
+			A tuple (params, dist) of the optimal parameters and their distance from the target derivatives.
+		"""
+		if getattr(dX, 'linear_features', None) is None:
+			raise ValueError('Topology function {} is not linear in its parameters (it has no linear_features)'.format(dX.__name__))
+
+		blocks = [self.features(dX, top.target, None)] + [self.features(dX, top.target, p) for p in top.parents]
+		A = np.hstack(blocks)
+
+		bounds_list, lb, ub = self.bounds.get(top)
+		res = lsq_linear(A, self.target_derivs, bounds=(lb, ub))
+		opt_params = res.x 
+		dist = np.linalg.norm(A.dot(opt_params) - self.target_derivs)
+
+		return opt_params, dist
+
+
+# Solvers that can be selected by name
+SOLVERS = {'slsqp': SLSQPSolver,
+		   'slsqp-sobol': functools.partial(SLSQPSolver, design='sobol', converged=3),
+		   'slsqp-lhs': functools.partial(SLSQPSolver, design='lhs', converged=3),
+		   'lstsq': LeastSquaresSolver}
+
+def make_solver(solver, species_vals, target_derivs, time_scale, edge_ptypes, node_ptypes, num_restarts=5):
+	""" Creates a gradient-matching solver for one target species.
+
+		Args:
+		solver - Either the name of a solver in SOLVERS, a solver class (or any callable with the same signature as the SLSQPSolver constructor), or None for the default SLSQP solver.
+
+		species_vals - The "true" values of all species for all time steps, such that species_vals[t, s] is the value of species s at time t.
+
+		target_derivs - The "true" derivatives of the target species for all time steps.
+
+		time_scale - The time scale to simulate across. Should have the form [start, stop, num_steps]
+
+		edge_ptypes - A list of ParameterType objects representing types of parameters attached to edges
+
+		node_ptypes - A list of ParameterType objects representing types of parameters attached to nodes
+
+		num_restarts - The number of times we restart the optimization function to avoid local optima
+
+		Returns:
+		A solver object with a fit(dX, topology, rng) method returning the (params, dist) of the best fit. Solvers that restart can keep the number of restarts used by the last fit as last_restarts.
+	"""
+	if solver is None:
+		solver = 'slsqp'
+	if type(solver) is str:
+		if solver not in SOLVERS:
+			raise ValueError('Unknown solver {}. Choose one of {}'.format(solver, sorted(SOLVERS.keys())))
+		solver = SOLVERS[solver]
+	return solver(species_vals, target_derivs, time_scale, edge_ptypes, node_ptypes, num_restarts=num_restarts)
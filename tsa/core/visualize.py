@@ -76,15 +76,8 @@ def prevalence_graph(model_lst, numtop):
 	max_width=20.0
 	min_width=1.0
 
-	top_n = model_lst.top(numtop)
-
-	edge_list = sum([wm.get_edges() for wm in top_n], [])
-	edges = {}
-	for e in edge_list:
-		if e in edges:
-			edges[e] += 1
-		else:
-			edges[e] = 1
+	edges = model_lst.edge_counts(numtop)
+	edge_list = list(edges.keys())
 
 	most = max(edges.values())
 
@@ -115,7 +108,7 @@ def plot_errs(model_bag, numtop):
 		Returns:
 		Nothing. Displays a chart.
 	"""
-	ys = [m.dist for m in model_bag.top(numtop)]
+	ys = model_bag.dists[:numtop]
 	xs = range(numtop)
 	for i in xs:
 	    plt.plot([xs[i]+1,xs[i]+1],[0,ys[i]],'k-')
@@ -135,8 +128,7 @@ def inter_map(model_lst, numtop):
 		Returns:
 		Nothing. Displays a heat map.
 	"""
-	topx = model_lst.top(numtop)
-	means = sum([model.to_adjacency_mat() for model in topx]) / numtop
+	means = model_lst.edge_matrix(numtop).sum(axis=0) / numtop
 	plt.imshow(means, cmap='Blues', interpolation='nearest')
 	plt.title("Interaction Prevalence %")
 	plt.ylabel("Outgoing Node")
@@ -162,20 +154,12 @@ def inter_map(model_lst, numtop):
 # 	plt.clf()
 
 def param_density(model_lst,numtop,p_type,index,cushion = 1):
-	a = []
-	best = model_lst.top(numtop)
-	for i in range(0,numtop):
-		mod1 = best[i]
-		try:
-			if type(index) == int:
-				if mod1.param_exists(p_type, node=index):
-					a.append(mod1.get_param(p_type,node=index).value)
-			elif type(index) == tuple or type(index) == list:
-				if mod1.param_exists(p_type, edge=index):
-					pval = mod1.get_param(p_type,edge=index).value
-					a.append(pval)
-		except ValueError:
-			pass
+	if type(index) == int:
+		a = model_lst.param_values(p_type, numtop, node=index)
+	elif type(index) == tuple or type(index) == list:
+		a = model_lst.param_values(p_type, numtop, edge=tuple(index))
+	else:
+		a = []
 	density1 = gaussian_kde(a)
 	bins = np.linspace(min(a)-cushion,max(a)+cushion,200)
 	return bins,density1(bins)
@@ -209,11 +193,8 @@ def chi_edge(model_lst,num_top = 100, ignore_same= True, threshold = 0.01):
     # ignore_same = True # choose whether to ignore
     # threshold = 0.01
     
-    num_spec = l1.top(1)[0].num_species
-    a = -1*np.ones((num_top,num_spec,num_spec))
-    for i in range(0,num_top):
-        for (nfrom, nto, ninter) in l1.top(100)[i].get_edges():
-            a[i][(nfrom, nto)] = 1
+    a = np.where(l1.edge_matrix(num_top), 1.0, -1.0)
+    num_spec = a.shape[1]
             
     b = np.ones((num_spec**2,num_spec**2))
     c = np.ones((num_spec**2,num_spec**2))
@@ -0,0 +1,68 @@
+# Compares the speed of the pure python and JIT (numba) backends of the
+# built in model frameworks.
+#
+# For each framework this times the two calls that dominate a TSA run:
+# - the gradient matching objective of one topology, which evaluates the
+#   derivative over all time steps for every parameter guess. The python
+#   backend evaluates the function compiled from the framework's spec,
+#   as gradient matching does (see tsa.objective_fn)
+# - the derivative of a whole model at one time step, which odeint
+#   evaluates at every step of a whole model simulation
+
+import tsa
+from tsa.models.gene_regulation import dX_gene_reg_fn
+from tsa.models.population_dynamics import dX_pop_dynamics_fn
+from tsa.models.linear_model import dX_linear_fn
+from tsa.models.mass_action import dX_massact_fn
+import numpy as np
+import time
+
+num_nodes = 6
+num_steps = 51
+repeats = 2000
+
+frameworks = [('Gene regulation', dX_gene_reg_fn),
+              ('Population dynamics', dX_pop_dynamics_fn),
+              ('Linear', dX_linear_fn),
+              ('Mass action', dX_massact_fn)]
+
+def time_per_call(fn, *args):
+    fn(*args)
+    start = time.time()
+    for i in range(repeats):
+        fn(*args)
+    return (time.time() - start) / repeats
+
+if not tsa.JIT_AVAILABLE:
+    print('numba is not installed, so only the pure python backend is available')
+
+rng = np.random.RandomState(0)
+xs = rng.uniform(0.1, 2, (num_steps, num_nodes))
+time_scale = [0, 10, num_steps]
+
+# Each species has two parents, with the first interaction type
+topologies = [tsa.Topology(target=i, interactions=[0, 0], parents=[(i+1) % num_nodes, (i+2) % num_nodes]) for i in range(num_nodes)]
+
+print('{:<20} {:>14} {:>14} {:>9} {:>14} {:>14} {:>9}'.format('Framework', 'Objective (us)', 'JIT (us)', 'Speedup', 'Whole (us)', 'JIT (us)', 'Speedup'))
+for (name, fn) in frameworks:
+    spec = fn.spec
+    num_params = spec.num_node_params + 2 * spec.num_edge_params
+    params = [rng.uniform(0.5, 2, num_params) for top in topologies]
+
+    target_derivs = rng.uniform(-1, 1, num_steps)
+    series = time_per_call(tsa.objective_fn(fn, xs, target_derivs, topologies[0], time_scale), params[0])
+    ode = tsa.whole_model_to_ode(fn, topologies, params)
+    whole = time_per_call(ode, xs[0], 0.0)
+
+    if tsa.JIT_AVAILABLE:
+        jit_fn = tsa.jit_framework(fn)
+        jit_series = time_per_call(tsa.objective_fn(jit_fn, xs, target_derivs, topologies[0], time_scale), params[0])
+        jit_ode = tsa.whole_model_to_ode(jit_fn, topologies, params)
+        jit_whole = time_per_call(jit_ode, xs[0], 0.0)
+    else:
+        jit_series = series
+        jit_whole = whole
+
+    print('{:<20} {:>14.1f} {:>14.1f} {:>8.1f}x {:>14.1f} {:>14.1f} {:>8.1f}x'.format(name,
+        series * 1e6, jit_series * 1e6, series / jit_series,
+        whole * 1e6, jit_whole * 1e6, whole / jit_whole))
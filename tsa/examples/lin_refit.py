@@ -41,7 +41,12 @@ edge_ptypes = [p for p in params_linear() if p.is_edge_param]
 
 species_vals, species_derivs = tsa.sim_data(accepted_model_fn, time_scale, y0)
 
-rr = tsa.fit_whole_model(top1000, dX_linear_fn, y0, species_vals, time_scale, node_ptypes, edge_ptypes)
+# Refit in parallel, streaming finished models to a checkpoint file. 
+# If the run is interrupted, running this script again resumes from the checkpoint.
+# The checkpoint is refused if the models, data or time scale have changed; remove it to start over.
+rr = tsa.fit_whole_model(top1000, dX_linear_fn, y0, species_vals, time_scale, node_ptypes, edge_ptypes,
+                         processes=8,
+                         checkpoint='lin_refit.ckpt')
 
 rrmb = ll.from_wm_list(rr)
 
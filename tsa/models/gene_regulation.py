@@ -1,10 +1,10 @@
 import numpy as np 
-from tsa import ParameterType
+from tsa import ParameterType, FrameworkSpec
 
 # Define parameters
 param_basal_synth = ParameterType(param_type='Basal Synth', bounds=(0.1, 1), is_edge_param=False)
 param_basal_degr = ParameterType(param_type='Basal Degr', bounds=(0.1, 2), is_edge_param=False)
-param_strength = ParameterType(param_type='Strength', bounds=(0.5, 4), is_edge_param=True)
+param_strength = ParameterType(param_type='Strength', bounds=(0.5, 4), is_edge_param=True, default=0.5)
 param_theta = ParameterType(param_type='Theta', bounds=(0.2, 3), is_edge_param=True)
 param_hill_coeff = ParameterType(param_type='Hill Coeff', bounds=(0.7, 5), is_edge_param=True)
 
@@ -52,5 +52,193 @@ def dX_gene_reg_fn(x, t, topology, params):
 	
 	return dX
 
+def dX_gene_reg_vec_fn(xs, ts, topology, params):
+	""" Vectorized form of dX_gene_reg_fn. Calculates the derivative of the target species at every time step at once.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array containing the derivative of the target species at each time step.
+	"""
+	parents = topology.parents
+	target = topology.target
+	interactions = topology.interactions
+
+	base_synth = params[0]
+	base_degr = params[1]
+
+	# Add basal synthesis and basal degradation terms
+	dX = base_synth - xs[:, target] * base_degr
+
+	# Add contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		inter = interactions[i]
+
+		j = 2 + i*3
+		b = params[ j ] 	  # Interaction 'Strength'
+		k = params[ j + 1 ]   # Hill fn parameter (theta)
+		m = params[ j + 2 ]   # Hill fn parameter (m)
+
+		# Value of parent for all t
+		if type(p) is tuple:
+			parent_val = np.prod(xs[:, list(p)], axis=1)
+		else:
+			parent_val = xs[:, p]
+
+		if inter == 0:
+			dX = dX + (b * parent_val**m) / (parent_val**m + k**m)
+		elif inter == 1:
+			dX = dX + b / (1 + (parent_val/k)**m)
+	
+	return dX
+
+# TSA evaluates the compiled spec (see below) in preference to this vectorized form, which is kept for
+# frameworks built on this one without a spec, and as the reference the spec is tested against.
+dX_gene_reg_fn.vectorized = dX_gene_reg_vec_fn
+
+def dX_gene_reg_grad_fn(xs, ts, topology, params):
+	""" Calculates the derivative of dX_gene_reg_vec_fn with respect to each parameter at every time step.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array J such that J[t, i] is the derivative of the target's derivative at time step t with respect to params[i].
+	"""
+	parents = topology.parents
+	target = topology.target
+	interactions = topology.interactions
+
+	J = np.zeros((xs.shape[0], len(params)))
+
+	# Basal synthesis and basal degradation terms
+	J[:, 0] = 1
+	J[:, 1] = -xs[:, target]
+
+	# Contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		inter = interactions[i]
+
+		j = 2 + i*3
+		b = params[ j ] 	  # Interaction 'Strength'
+		k = params[ j + 1 ]   # Hill fn parameter (theta)
+		m = params[ j + 2 ]   # Hill fn parameter (m)
+
+		# Value of parent for all t
+		if type(p) is tuple:
+			parent_val = np.prod(xs[:, list(p)], axis=1)
+		else:
+			parent_val = xs[:, p]
+
+		# log of the parent value. Wherever the parent is 0 the terms it multiplies are also 0.
+		log_parent = np.log(np.where(parent_val > 0, parent_val, 1))
+
+		if inter == 0:
+			pm = parent_val**m
+			km = k**m
+			denom = (pm + km)**2
+			J[:, j] = pm / (pm + km)
+			J[:, j + 1] = -b * pm * m * k**(m-1) / denom
+			J[:, j + 2] = b * pm * km * (log_parent - np.log(k)) / denom
+		elif inter == 1:
+			u = (parent_val/k)**m
+			denom = (1 + u)**2
+			J[:, j] = 1 / (1 + u)
+			J[:, j + 1] = b * m * u / (k * denom)
+			J[:, j + 2] = -b * u * (log_parent - np.log(k)) / denom
+
+	return J
+
+dX_gene_reg_fn.param_grad = dX_gene_reg_grad_fn
+
+def dX_gene_reg_state_grad_fn(x, t, topology, params):
+	""" Calculates the derivative of dX_gene_reg_fn with respect to the value of every species at time t.
+
+		Args:
+		x - The values of all species at time t 
+
+		t - The time 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array g such that g[s] is the derivative of the target's derivative with respect to species s.
+	"""
+	parents = topology.parents
+	target = topology.target
+	interactions = topology.interactions
+
+	grad = np.zeros(len(x))
+
+	# Basal degradation term
+	grad[target] -= params[1]
+
+	# Contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		inter = interactions[i]
+
+		j = 2 + i*3
+		b = params[ j ] 	  # Interaction 'Strength'
+		k = params[ j + 1 ]   # Hill fn parameter (theta)
+		m = params[ j + 2 ]   # Hill fn parameter (m)
+
+		# Value of parent and its derivative with respect to each species
+		if type(p) is tuple:
+			parent_val = 1
+			for par in p:
+				parent_val = parent_val * x[par]
+			parent_grad = np.zeros(len(x))
+			for par in p:
+				parent_grad[par] += np.prod([x[q] for q in p if q != par])
+		else:
+			parent_val = x[p]
+			parent_grad = np.zeros(len(x))
+			parent_grad[p] = 1
+
+		# The Hill functions are flat at a parent value of 0 (for m >= 1), and their slope is unbounded there for m < 1, so treat it as 0
+		if parent_val <= 0:
+			continue
+
+		if inter == 0:
+			pm = parent_val**m
+			km = k**m
+			d_parent = b * m * parent_val**(m-1) * km / (pm + km)**2
+		elif inter == 1:
+			u = (parent_val/k)**m
+			d_parent = -b * m * u / (parent_val * (1 + u)**2)
+		else:
+			continue
+
+		grad += d_parent * parent_grad
+
+	return grad
+
+dX_gene_reg_fn.state_grad = dX_gene_reg_state_grad_fn
+
+# Declarative form of dX_gene_reg_fn, from which a derivative is compiled for each topology
+dX_gene_reg_fn.spec = FrameworkSpec(node_expr='n0 - X * n1 + EDGES',
+									edge_exprs=['(e0 * P**e2) / (P**e2 + e1**e2)',	# Activation
+												'e0 / (1 + (P/e1)**e2)'],			# Repression
+									num_node_params=2,
+									num_edge_params=3)
+
 def params_gene_reg():
 	return [param_basal_synth, param_basal_degr, param_strength, param_theta, param_hill_coeff]
\ No newline at end of file
@@ -1,5 +1,5 @@
 import numpy as np 
-from tsa import ParameterType
+from tsa import ParameterType, FrameworkSpec
 
 # Define parameters
 const = ParameterType(param_type='CONST', bounds=(-10, 10), is_edge_param=False)
@@ -36,5 +36,137 @@ def dX_linear_fn(x, t, topology, params):
 
 	return deriv
 
+def dX_linear_vec_fn(xs, ts, topology, params):
+	""" Vectorized form of dX_linear_fn. Calculates the derivative of the target species at every time step at once.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array containing the derivative of the target species at each time step.
+	"""
+	parents = topology.parents
+
+	deriv = np.zeros(xs.shape[0]) + params[0]
+
+	# Add contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+
+		k = params[i + 1]   # Parent coefficient
+
+		if type(p) is tuple:
+			parent_val = np.prod(xs[:, list(p)], axis=1)
+		else:
+			parent_val = xs[:, p]
+
+		deriv = deriv + k * parent_val
+
+	return deriv
+
+# TSA evaluates the compiled spec (see below) in preference to this vectorized form, which is kept for
+# frameworks built on this one without a spec, and as the reference the spec is tested against.
+dX_linear_fn.vectorized = dX_linear_vec_fn
+
+def linear_features(xs, ts, target, parent):
+	""" Calculates the columns of the design matrix of a linear model, whose derivative is linear in its parameters. Used by the LeastSquaresSolver. The mass-action framework shares it.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		target - The target species 
+
+		parent - A parent of the target, or None for the terms attached to the target node 
+
+		Returns:
+		A numpy array whose columns multiply the node parameters (if parent is None) or the edge parameters of the parent. 
+	"""
+	# Constant term
+	if parent is None:
+		return np.ones((xs.shape[0], 1))
+
+	if type(parent) is tuple:
+		parent_val = np.prod(xs[:, list(parent)], axis=1)
+	else:
+		parent_val = xs[:, parent]
+
+	return parent_val.reshape(-1, 1)
+
+dX_linear_fn.linear_features = linear_features
+
+def dX_linear_grad_fn(xs, ts, topology, params):
+	""" Calculates the derivative of dX_linear_vec_fn with respect to each parameter at every time step.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array J such that J[t, i] is the derivative of the target's derivative at time step t with respect to params[i].
+	"""
+	# The derivative is linear in the parameters, so its gradient is the design matrix
+	blocks = [linear_features(xs, ts, topology.target, None)] + [linear_features(xs, ts, topology.target, p) for p in topology.parents]
+	return np.hstack(blocks)
+
+dX_linear_fn.param_grad = dX_linear_grad_fn
+
+def dX_linear_state_grad_fn(x, t, topology, params):
+	""" Calculates the derivative of dX_linear_fn with respect to the value of every species at time t.
+
+		Args:
+		x - The values of all species at time t 
+
+		t - The time 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array g such that g[s] is the derivative of the target's derivative with respect to species s.
+	"""
+	parents = topology.parents
+
+	grad = np.zeros(len(x))
+
+	# Add contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+
+		k = params[i + 1]   # Parent coefficient
+
+		# Derivative of the value of the parent with respect to each species
+		parent_grad = np.zeros(len(x))
+		if type(p) is tuple:
+			for par in p:
+				parent_grad[par] += np.prod([x[q] for q in p if q != par])
+		else:
+			parent_grad[p] = 1
+
+		grad += k * parent_grad
+
+	return grad
+
+dX_linear_fn.state_grad = dX_linear_state_grad_fn
+
+# Declarative form of dX_linear_fn, from which a derivative is compiled for each topology
+dX_linear_fn.spec = FrameworkSpec(node_expr='n0 + EDGES',
+								  edge_exprs=['e0 * P'],
+								  num_node_params=1,
+								  num_edge_params=1)
+
 def params_linear():
 	return [const, coeff]
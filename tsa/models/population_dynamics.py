@@ -1,9 +1,9 @@
 import numpy as np 
-from tsa import ParameterType
+from tsa import ParameterType, FrameworkSpec
 
 # Define parameters
 param_growth_rate = ParameterType(param_type='Growth Rate', bounds=(0.1, 1), is_edge_param=False)
-param_inter_strength = ParameterType(param_type='Interaction Strength', bounds=(0.1, 2), is_edge_param=True)
+param_inter_strength = ParameterType(param_type='Interaction Strength', bounds=(0.1, 2), is_edge_param=True, default=0.1)
 
 
 def dX_pop_dynamics_fn(x, t, topology, params):
@@ -37,5 +37,145 @@ def dX_pop_dynamics_fn(x, t, topology, params):
 	return dX
 
 
+def dX_pop_dynamics_vec_fn(xs, ts, topology, params):
+	""" Vectorized form of dX_pop_dynamics_fn. Calculates the derivative of the target species at every time step at once.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array containing the derivative of the target species at each time step.
+	"""
+	parents = topology.parents
+	target = topology.target
+
+	growth_rate = params[0]
+	growth_term = growth_rate * xs[:, target]
+	strength_term = 1 - xs[:, target]
+
+	# Add contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		s = params[i + 1]   # Interaction Strength
+		if type(p) is tuple:
+			parent_vals = np.prod(xs[:, list(p)], axis=1)
+		else:
+			parent_vals = xs[:, p]
+		strength_term = strength_term - s * parent_vals
+
+	dX = growth_term * strength_term
+
+	return dX
+
+# TSA evaluates the compiled spec (see below) in preference to this vectorized form, which is kept for
+# frameworks built on this one without a spec, and as the reference the spec is tested against.
+dX_pop_dynamics_fn.vectorized = dX_pop_dynamics_vec_fn
+
+def dX_pop_dynamics_grad_fn(xs, ts, topology, params):
+	""" Calculates the derivative of dX_pop_dynamics_vec_fn with respect to each parameter at every time step.
+
+		Args:
+		xs - The values of all species across all time steps, such that xs[t, s] = value of species s at time t
+
+		ts - The time steps 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array J such that J[t, i] is the derivative of the target's derivative at time step t with respect to params[i].
+	"""
+	parents = topology.parents
+	target = topology.target
+
+	J = np.zeros((xs.shape[0], len(params)))
+
+	growth_rate = params[0]
+	strength_term = 1 - xs[:, target]
+
+	# Contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		s = params[i + 1]   # Interaction Strength
+		if type(p) is tuple:
+			parent_vals = np.prod(xs[:, list(p)], axis=1)
+		else:
+			parent_vals = xs[:, p]
+		strength_term = strength_term - s * parent_vals
+		J[:, i + 1] = -growth_rate * xs[:, target] * parent_vals
+
+	J[:, 0] = xs[:, target] * strength_term
+
+	return J
+
+dX_pop_dynamics_fn.param_grad = dX_pop_dynamics_grad_fn
+
+def dX_pop_dynamics_state_grad_fn(x, t, topology, params):
+	""" Calculates the derivative of dX_pop_dynamics_fn with respect to the value of every species at time t.
+
+		Args:
+		x - The values of all species at time t 
+
+		t - The time 
+
+		topology - A Topology object describing the model currently being examined
+
+		params - A list of params for this model 
+
+		Returns:
+		A numpy array g such that g[s] is the derivative of the target's derivative with respect to species s.
+	"""
+	parents = topology.parents
+	target = topology.target
+
+	growth_rate = params[0]
+	growth_term = growth_rate * x[target]
+	strength_term = 1 - x[target]
+
+	# Derivative of the strength term with respect to each species
+	strength_grad = np.zeros(len(x))
+	strength_grad[target] = -1
+
+	# Add contributions from each edge
+	for i in range(len(parents)):
+		p = parents[i]
+		s = params[i + 1]   # Interaction Strength
+		# Value of parent and its derivative with respect to each species
+		if type(p) is tuple:
+			parent_val = 1
+			for par in p:
+				parent_val = parent_val * x[par]
+			parent_grad = np.zeros(len(x))
+			for par in p:
+				parent_grad[par] += np.prod([x[q] for q in p if q != par])
+		else:
+			parent_val = x[p]
+			parent_grad = np.zeros(len(x))
+			parent_grad[p] = 1
+		strength_term -= s * parent_val
+		strength_grad -= s * parent_grad
+
+	# Product rule on growth_term * strength_term
+	grad = growth_term * strength_grad
+	grad[target] += growth_rate * strength_term
+
+	return grad
+
+dX_pop_dynamics_fn.state_grad = dX_pop_dynamics_state_grad_fn
+
+# Declarative form of dX_pop_dynamics_fn, from which a derivative is compiled for each topology
+dX_pop_dynamics_fn.spec = FrameworkSpec(node_expr='n0 * X * (1 - X - EDGES)',
+										edge_exprs=['e0 * P'],
+										num_node_params=1,
+										num_edge_params=1)
+
+
 def params_pop_dynamics():
 	return [param_growth_rate, param_inter_strength]
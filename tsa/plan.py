@@ -0,0 +1,78 @@
+# Projects the cost of a run of tsa.generate_models before launching it.
+#
+# python -m tsa.plan RUN_DIR [--processes P]
+#     Times a sample of fits and whole model simulations of a run prepared
+#     by tsa.create_shards, and projects the CPU time and peak memory of
+#     each stage of the run
+# python -m tsa.plan --nodes N --max-parents P (--framework F | --num-interactions I --max-order O) ...
+#     Only counts the topologies of each species and the whole models
+#
+# From python, tsa.plan_models takes the same arguments as
+# tsa.generate_models.
+
+import argparse
+import importlib
+import sys
+
+from .core.plan import *
+
+
+def load_function(name):
+	""" Imports a function given as 'module:name'.
+	"""
+	module, _, fn = name.partition(':')
+	return getattr(importlib.import_module(module), fn)
+
+def edge_list(text):
+	""" Parses a list of edges given as 'parent,target parent,target ...'.
+	"""
+	return [tuple(int(i) for i in edge.split(',')) for edge in text.split()]
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m tsa.plan', description='Projects the cost of a run of tsa.generate_models')
+	parser.add_argument('run_dir', nargs='?', help='a run directory prepared by tsa.create_shards')
+	parser.add_argument('--processes', type=int, help='the number of processes of the run')
+	parser.add_argument('--samples', type=int, default=10, help='the number of topologies of each size to time')
+	parser.add_argument('--sim-samples', type=int, default=5, help='the number of whole models to time')
+	parser.add_argument('--jit', action='store_true', help='time the JIT backend')
+
+	counting = parser.add_argument_group('counting only (without a run directory)')
+	counting.add_argument('--framework', help='the derivative function of the framework as module:name, eg. tsa.models.gene_regulation:dX_gene_reg_fn')
+	counting.add_argument('--nodes', type=int, help='the number of species')
+	counting.add_argument('--max-parents', type=int, default=-1, help='the maximum number of parents of a species')
+	counting.add_argument('--num-interactions', type=int, default=-1, help='the number of interactions (set by built in frameworks)')
+	counting.add_argument('--max-order', type=int, default=-1, help='the maximum order of complex parents (set by built in frameworks)')
+	counting.add_argument('--enf-edges', type=edge_list, default=[], help="enforced edges, eg. '0,1 2,1'")
+	counting.add_argument('--enf-gaps', type=edge_list, default=[], help="enforced gaps, eg. '0,1 2,1'")
+	counting.add_argument('--retained-top', type=int, default=5)
+	counting.add_argument('--max-whole-models', type=int)
+
+	args = parser.parse_args(argv)
+	if args.run_dir is not None:
+		spec = load_shard_spec(args.run_dir)
+	elif args.nodes is not None:
+		topology_fn = None if args.framework is None else load_function(args.framework)
+		# Built in frameworks fix their interactions and order, others must be given
+		num_interactions, max_order = framework_defaults(topology_fn, args.num_interactions, args.max_order)
+		if num_interactions < 1 or max_order < 1:
+			parser.error('give --num-interactions and --max-order (of at least 1), or the --framework of a built in framework')
+		if args.max_parents < 0:
+			parser.error('give --max-parents')
+		spec = run_spec(topology_fn, None, None, None, None,
+						nodes=list(range(args.nodes)),
+						max_parents=args.max_parents,
+						num_interactions=args.num_interactions,
+						max_order=args.max_order,
+						enf_edges=args.enf_edges,
+						enf_gaps=args.enf_gaps,
+						retained_top=args.retained_top,
+						max_whole_models=args.max_whole_models)
+	else:
+		parser.error('give either a run directory or --nodes')
+
+	plan = plan_spec(spec, processes=args.processes, num_samples=args.samples, num_sim_samples=args.sim_samples, jit=args.jit)
+	plan.report()
+	return 1 if len(plan.warnings) > 0 else 0
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,58 @@
+# Runs the shards of a run prepared by tsa.create_shards, so that the
+# gradient matching of large topology spaces can be spread across hosts
+# that share the run directory.
+#
+# python -m tsa.shard count RUN_DIR
+#     Prints the number of topologies of each target
+# python -m tsa.shard run RUN_DIR --shard I --num-shards N [--target T]
+#     Fits shard I of N of every target (or only of target T)
+# python -m tsa.shard merge RUN_DIR
+#     Adds the targets whose shards are all done to the run. Afterwards,
+#     tsa.resume_models finishes the run.
+
+import argparse
+import sys
+
+from .core.shard import *
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(prog='python -m tsa.shard', description='Runs the shards of a run prepared by tsa.create_shards')
+	commands = parser.add_subparsers(dest='command')
+	commands.required = True
+
+	count = commands.add_parser('count', help='print the number of topologies of each target')
+	count.add_argument('run_dir')
+
+	run = commands.add_parser('run', help='fit one shard of the topologies of each target')
+	run.add_argument('run_dir')
+	run.add_argument('--shard', type=int, required=True, help='the shard to fit, counting from 0')
+	run.add_argument('--num-shards', type=int, required=True, help='the number of shards the topologies of each target are split into')
+	run.add_argument('--target', type=int, action='append', help='only fit the shard of this target (can be repeated)')
+	run.add_argument('--processes', type=int, help='the number of processes to fit with')
+	run.add_argument('--jit', action='store_true', help='compile the framework with numba')
+	run.add_argument('--fit-cache', help='the file name of a fit cache')
+
+	merge = commands.add_parser('merge', help='add the targets whose shards are all done to the run')
+	merge.add_argument('run_dir')
+
+	args = parser.parse_args(argv)
+	spec = load_shard_spec(args.run_dir)
+	targets = range(len(spec['run_args']['nodes']))
+
+	if args.command == 'count':
+		for t in targets:
+			print('Target {}: {} topologies'.format(t, len(shard_space(spec, t))))
+	elif args.command == 'run':
+		for t in (targets if args.target is None else args.target):
+			start, stop = shard_range(len(shard_space(spec, t)), args.shard, args.num_shards)
+			if start < stop:
+				run_shard(args.run_dir, t, start, stop, processes=args.processes, jit=args.jit, fit_cache=args.fit_cache)
+	else:
+		incomplete = merge_shards(args.run_dir)
+		if len(incomplete) > 0:
+			return 1
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main())